@@ -11,6 +11,7 @@ from app.storage.enode_account import (
     update_enode_account,
     delete_enode_account,
 )
+from app.enode.verify import refresh_account_secrets
 
 logger = logging.getLogger(__name__)
 
@@ -61,6 +62,8 @@ async def create_account(request: Request, user=Depends(require_admin)):
     if not account:
         raise HTTPException(status_code=500, detail="Failed to create account")
 
+    await refresh_account_secrets()
+
     _mask_secrets(account)
     return account
 
@@ -99,6 +102,9 @@ async def update_account(account_id: str, request: Request, user=Depends(require
         from app.enode.auth import invalidate_token_cache
         invalidate_token_cache(account_id)
 
+    # Webhook secret or active flag may have changed
+    await refresh_account_secrets()
+
     _mask_secrets(account)
     return account
 
@@ -112,6 +118,7 @@ async def remove_account(account_id: str, user=Depends(require_admin)):
             status_code=409,
             detail="Cannot delete account: users are still assigned or account not found"
         )
+    await refresh_account_secrets()
     return {"deleted": True}
 
 
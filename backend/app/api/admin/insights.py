@@ -143,7 +143,7 @@ async def get_users_on_trial(user=Depends(require_admin)):
 async def get_vehicles_by_country_insight(user=Depends(require_admin)):
     """
     Returns the count of vehicles grouped by country.
-    Uses reverse geocoding from vehicle location data.
+    Uses the stored country_code (filled in by the country backfill job).
     """
     countries = await get_vehicles_by_country()
     return {"vehicles_by_country": countries}
@@ -5,7 +5,20 @@ Admin endpoint for real-time system metrics.
 
 from fastapi import APIRouter, Depends
 from app.auth.supabase_auth import get_supabase_user
+from app.api.webhook import get_dedup_stats
 from app.services.metrics import get_metrics
+from app.services.webhook_ingest import webhook_ingest_queue
+from app.services.fanout import fanout_dispatcher
+from app.services.geocoding import country_geocoder
+from app.services.ha_status import ha_status_cache
+from app.services.ha_stream import ha_stream_broker
+from app.services.rate_limiter import poll_rate_limiter
+from app.services.vehicle_lanes import vehicle_lanes
+from app.services.webhook_idempotency import webhook_idempotency
+from app.storage.vehicle_pairing import get_vehicle_pairing_stats
+from app.storage.vehicle_state import get_vehicle_state_stats
+from app.storage.webhook import webhook_log_writer
+from app.storage.poll_logs import poll_log_writer
 
 router = APIRouter()
 
@@ -31,5 +44,33 @@ async def get_system_metrics(user=Depends(require_admin)):
     Returns:
         - current: Metrics for the current 5-minute window
         - previous: Metrics from the previous 5-minute window (for comparison)
+        - webhook_ingest: Depth and age of the Enode webhook ingest queue
+        - vehicle_lanes: Pending jobs in the per-vehicle processing lanes
+        - log_writers: Buffer depth, written and dropped rows per log table
+        - webhook_dedup: Size and hit/miss counters of the webhook dedup cache
+        - webhook_idempotency: Claimed and duplicate Enode event ids
+        - fanout: Pending HA/Pushover/ABRP jobs per sink (latency and drops are in current.sinks)
+        - vehicle_state: Entries, evictions and approximate memory of the vehicle state registry
+        - vehicle_pairings: Enode ↔ ABRP pairings and cached cross-populate contributions
+        - geocoding: Country geocoding cache size and hit rate
+        - ha_status: Rendered HA status documents, hit rate and 304 responses
+        - ha_stream: Open HA event streams and events published/delivered to them
+        - rate_limiter: Poll counter backend, keys, hits and rebuilds from poll_logs
     """
-    return get_metrics()
+    metrics = get_metrics()
+    metrics["webhook_ingest"] = webhook_ingest_queue.stats()
+    metrics["vehicle_lanes"] = vehicle_lanes.stats()
+    metrics["log_writers"] = {
+        "webhook_logs": webhook_log_writer.stats(),
+        "poll_logs": poll_log_writer.stats(),
+    }
+    metrics["webhook_dedup"] = get_dedup_stats()
+    metrics["webhook_idempotency"] = webhook_idempotency.stats()
+    metrics["fanout"] = fanout_dispatcher.stats()
+    metrics["vehicle_state"] = get_vehicle_state_stats()
+    metrics["vehicle_pairings"] = get_vehicle_pairing_stats()
+    metrics["geocoding"] = country_geocoder.stats()
+    metrics["ha_status"] = ha_status_cache.stats()
+    metrics["ha_stream"] = ha_stream_broker.stats()
+    metrics["rate_limiter"] = poll_rate_limiter.stats()
+    return metrics
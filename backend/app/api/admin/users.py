@@ -1,31 +1,21 @@
 # backend/app/api/admin/users.py
 """Admin endpoints for managing user accounts."""
 
-import json
+import asyncio
 import logging
 from fastapi import APIRouter, Depends, HTTPException, Response
 from fastapi.responses import JSONResponse
 import httpx
-import reverse_geocode
 from app.auth.supabase_auth import get_supabase_user
 from app.storage.user import get_all_users_with_enode_info, set_user_approval, delete_user, update_ha_url_check
 from app.enode.user import delete_enode_user
 from app.lib.supabase import get_supabase_admin_client
+from app.services.geocoding import country_geocoder
 from app.storage.enode_account import get_enode_account_for_user, assign_user_to_account
 
 logger = logging.getLogger(__name__)
 
 
-def get_country_code_from_location(lat: float, lon: float) -> str | None:
-    """Convert latitude/longitude to country code using reverse geocoding."""
-    try:
-        result = reverse_geocode.search([(lat, lon)])
-        if result and len(result) > 0:
-            return result[0].get("country_code")
-    except Exception as e:
-        logger.warning(f"Failed to reverse geocode ({lat}, {lon}): {e}")
-    return None
-
 router = APIRouter()
 
 # TODO: Add docstrings to all functions in this file.
@@ -112,8 +102,8 @@ async def get_user_details(user_id: str, user=Depends(require_admin)):
 
         user_data = user_res.data
 
-        # Fetch user's vehicles with cache data for location
-        vehicles_res = supabase.table("vehicles").select("vehicle_id, vendor, updated_at, online, vehicle_cache").eq("user_id", user_id).execute()
+        # Fetch user's vehicles with only the location from the cache
+        vehicles_res = supabase.table("vehicles").select("vehicle_id, vendor, updated_at, online, location:vehicle_cache->location").eq("user_id", user_id).execute()
         vehicles_raw = vehicles_res.data or []
 
         # Process vehicles to extract location and country code
@@ -126,17 +116,7 @@ async def get_user_details(user_id: str, user=Depends(require_admin)):
                 "online": v.get("online"),
             }
 
-            # Extract location from vehicle_cache if available
-            cache_raw = v.get("vehicle_cache")
-            cache = {}
-            if isinstance(cache_raw, str):
-                try:
-                    cache = json.loads(cache_raw)
-                except json.JSONDecodeError:
-                    pass
-            elif isinstance(cache_raw, dict):
-                cache = cache_raw
-            location = cache.get("location")
+            location = v.get("location")
             if location and isinstance(location, dict):
                 lat = location.get("latitude")
                 lon = location.get("longitude")
@@ -146,7 +126,7 @@ async def get_user_details(user_id: str, user=Depends(require_admin)):
                 }
                 # Get country code from coordinates
                 if lat is not None and lon is not None:
-                    country_code = get_country_code_from_location(lat, lon)
+                    country_code = await asyncio.to_thread(country_geocoder.country_code, lat, lon)
                     if country_code:
                         vehicle_data["country_code"] = country_code
 
@@ -1,13 +1,18 @@
 # backend/app/api/admin/vehicles.py
 """Admin endpoints for managing vehicles."""
 
-import json
 import logging
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Body, Depends, HTTPException
+from pydantic import BaseModel, Field
 from app.auth.supabase_auth import get_supabase_user
 from app.enode.vehicle import get_vehicle_details
 from app.lib.supabase import get_supabase_admin_client
+from app.lib.vehicle_cache import load_vehicle_cache
+from app.services.country_backfill import get_country_backfill_status, start_country_backfill
+from app.services.ha_status import ha_status_cache
 from app.storage.vehicle import save_vehicle_data_with_client
+from app.storage.vehicle_pairing import forget_vehicle_pairing
+from app.storage.vehicle_state import forget_vehicle_state
 from app.storage.enode_account import get_all_enode_accounts, get_enode_account_for_vehicle
 
 logger = logging.getLogger(__name__)
@@ -56,11 +61,7 @@ async def list_all_vehicles(user=Depends(require_admin)):
         vehicles = []
         for v in db_vehicles:
             # Parse cached vehicle data
-            cache = {}
-            try:
-                cache = json.loads(v.get("vehicle_cache", "{}")) if v.get("vehicle_cache") else {}
-            except (json.JSONDecodeError, TypeError):
-                cache = {}
+            cache = load_vehicle_cache(v.get("vehicle_cache"))
 
             user_id = v.get("user_id")
             user_info = user_map.get(user_id, {})
@@ -108,6 +109,36 @@ async def list_all_vehicles(user=Depends(require_admin)):
         raise HTTPException(status_code=500, detail="Failed to fetch vehicles")
 
 
+class CountryBackfillRequest(BaseModel):
+    page_size: int | None = Field(None, gt=0)
+    after_id: str | None = Field(None, description="Resume after this vehicle id")
+
+
+@router.post("/admin/vehicles/country-backfill")
+async def start_vehicle_country_backfill(
+    body: CountryBackfillRequest | None = Body(None),
+    user=Depends(require_admin),
+):
+    """
+    Fill in country_code for vehicles with coordinates but no country, in the background.
+    Body (all optional): page_size, after_id (resume after this vehicle id).
+    """
+    body = body or CountryBackfillRequest()
+    options = {"after_id": body.after_id}
+    if body.page_size:
+        options["page_size"] = body.page_size
+    if not start_country_backfill(**options):
+        raise HTTPException(status_code=409, detail="A country backfill is already running")
+    logger.info(f"[CountryBackfill] Started by admin {user.get('sub') or user.get('id')}: {options}")
+    return {"started": True, "options": options}
+
+
+@router.get("/admin/vehicles/country-backfill")
+async def vehicle_country_backfill_status(user=Depends(require_admin)):
+    """Progress or result of the last country backfill (scanned, updated, unresolved, last_id)."""
+    return get_country_backfill_status()
+
+
 @router.get("/admin/vehicles/debug")
 async def debug_vehicle_cache(user=Depends(require_admin)):
     """
@@ -123,11 +154,7 @@ async def debug_vehicle_cache(user=Depends(require_admin)):
 
         result = []
         for v in vehicles:
-            cache = {}
-            try:
-                cache = json.loads(v.get("vehicle_cache", "{}"))
-            except (json.JSONDecodeError, TypeError):
-                cache = {}
+            cache = load_vehicle_cache(v.get("vehicle_cache"))
 
             location = cache.get("location")
             result.append({
@@ -207,6 +234,9 @@ async def delete_vehicle_from_database(vehicle_id: str, user=Depends(require_adm
 
         # Delete the vehicle
         delete_res = supabase.table("vehicles").delete().eq("vehicle_id", vehicle_id).execute()
+        forget_vehicle_state(vehicle_id)
+        forget_vehicle_pairing(vehicle_id)
+        ha_status_cache.forget_vehicle(vehicle_id)
         logger.info(f"✅ Deleted vehicle {vehicle_id} from database")
 
         # Update user's linked_vehicle_count
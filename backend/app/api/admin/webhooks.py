@@ -2,7 +2,9 @@
 """Admin endpoints for managing webhooks."""
 
 import logging
-from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
+from datetime import datetime
+from fastapi import APIRouter, Body, Depends, HTTPException, Query, Request, Response
+from pydantic import BaseModel, Field
 from app.auth.supabase_auth import get_supabase_user
 from app.storage.webhook import (
     get_all_webhook_subscriptions,
@@ -14,6 +16,7 @@ from app.storage.webhook import (
 from app.enode.webhook import subscribe_to_webhooks, delete_webhook
 from app.storage.webhook_monitor import monitor_webhook_health
 from app.storage.enode_account import get_all_enode_accounts, get_enode_account_by_id
+from app.services.webhook_replay import get_replay_status, start_replay
 
 logger = logging.getLogger(__name__)
 
@@ -148,3 +151,51 @@ async def run_scheduler_now(user=Depends(require_admin)):
     except Exception as e:
         logger.error(f"[❌ run_scheduler_now] {e}")
         raise HTTPException(status_code=500, detail=str(e))
+
+
+class WebhookReplayRequest(BaseModel):
+    since: datetime | None = None
+    until: datetime | None = None
+    user_id: str | None = None
+    vehicle_id: str | None = None
+    rate: float | None = Field(None, gt=0, description="Events per second (default: as fast as possible)")
+    limit: int | None = Field(None, gt=0)
+    stub_sinks: bool = True
+    rebuild_charging: bool = False
+    all_logs: bool = Field(False, description="Must be true to replay the whole table (no filter or limit)")
+
+
+@router.post("/admin/webhook/replay")
+async def start_webhook_replay(body: WebhookReplayRequest = Body(...), user=Depends(require_admin)):
+    """
+    Replay stored webhook_logs through the event pipeline in the background.
+    Body: since, until, user_id, vehicle_id, rate (events/sec), limit,
+    stub_sinks (default true), rebuild_charging (default false). At least one
+    of since/until/user_id/vehicle_id/limit is required unless all_logs is true.
+    """
+    filters = (body.since, body.until, body.user_id, body.vehicle_id, body.limit)
+    if all(value is None for value in filters) and not body.all_logs:
+        raise HTTPException(
+            status_code=400,
+            detail="Refusing to replay all webhook_logs: pass a filter or limit, or all_logs=true",
+        )
+    options = {
+        "since": body.since.isoformat() if body.since else None,
+        "until": body.until.isoformat() if body.until else None,
+        "user_id": body.user_id,
+        "vehicle_id": body.vehicle_id,
+        "rate": body.rate,
+        "limit": body.limit,
+        "stub_sinks": body.stub_sinks,
+        "rebuild_charging": body.rebuild_charging,
+    }
+    if not start_replay(**options):
+        raise HTTPException(status_code=409, detail="A webhook replay is already running")
+    logger.info(f"[Replay] Started by admin {user.get('sub') or user.get('id')}: {options}")
+    return {"started": True, "options": options}
+
+
+@router.get("/admin/webhook/replay")
+async def webhook_replay_status(user=Depends(require_admin)):
+    """Progress or result of the last webhook replay (events/sec, DB requests per event)."""
+    return get_replay_status()
@@ -19,6 +19,7 @@ from pydantic import BaseModel, Field
 
 from app.auth.supabase_auth import get_supabase_user
 from app.config import ANTHROPIC_API_KEY
+from app.lib.vehicle_cache import load_vehicle_cache
 from app.logger import logger
 from app.storage.charging_sessions import (
     get_all_sessions_for_export,
@@ -634,9 +635,7 @@ async def create_manual_session(
     vehicle = vehicle_result.data[0]
 
     # Extract vehicle info from vehicle_cache
-    vehicle_cache = vehicle.get("vehicle_cache") or {}
-    if isinstance(vehicle_cache, str):
-        vehicle_cache = json.loads(vehicle_cache)
+    vehicle_cache = load_vehicle_cache(vehicle.get("vehicle_cache"))
 
     info = vehicle_cache.get("information", {})
     brand = info.get("brand") or vehicle.get("brand")
@@ -7,41 +7,43 @@ from fastapi import Depends, HTTPException, Request, BackgroundTasks
 from app.auth.supabase_auth import get_supabase_user
 from app.auth.api_key_auth import get_api_key_user
 # MODIFIED: Import more specific user functions
-from app.storage.user import get_user_rate_limit_data, decrement_purchased_api_tokens
+from app.storage.user import get_user_rate_limit_data, get_cached_user_rate_limit_data, decrement_purchased_api_tokens
 from app.storage.poll_logs import log_poll, count_polls_since, count_polls_since_for_vehicle
 from app.storage.vehicles import get_vehicle_by_id_and_user_id
-from app.storage.settings import get_setting_by_name
+from app.storage.vehicle_state import get_vehicle_state_by_db_id
+from app.storage.settings import get_setting_by_name, get_cached_setting_by_name
+from app.services.rate_limiter import poll_rate_limiter, user_key, vehicle_key
+from app.config import RATE_LIMIT_CACHE_TTL_SECONDS, RATE_LIMIT_WINDOW_DAYS
 from app.logger import logger # NEW: Import logger
 
+# Endpoints whose calls are logged to poll_logs and count against the allowance
+POLL_LOGGED_ENDPOINTS = [
+    "/api/status/",
+    "/api/ha/status/",
+    "/api/ha/charging/",
+]
+
 # TODO: This function can be removed once pydantic-settings is fully implemented.
 async def _get_setting_value(setting_name: str, default_value: int) -> int:
-    """Retrieves a setting value by name, with a fallback default."""
-    s = await get_setting_by_name(setting_name)
+    """Retrieves a setting value by name (cached), with a fallback default."""
+    s = await get_cached_setting_by_name(setting_name, RATE_LIMIT_CACHE_TTL_SECONDS)
     if s:
         return int(s.get("value", default_value))
     return default_value
 
 # TODO: Define tier names (e.g., "free", "basic", "pro") as constants or an Enum.
 
-async def api_key_rate_limit(
-    request: Request,
-    background_tasks: BackgroundTasks,
-    user=Depends(get_api_key_user)
-) -> None:
+async def _load_rate_limit(user_id: str) -> dict:
     """
-    Rate limit for API-key authenticated users, based on a monthly tier allowance
-    plus a balance of purchased one-time tokens.
+    Tier, allowances and token balance used by the API-key rate limits.
+    Raises 404 if the user does not exist.
     """
-    user_id = user.id
     # MODIFIED: Fetch all required user data in one call
-    record = await get_user_rate_limit_data(user_id)
+    record = await get_cached_user_rate_limit_data(user_id, RATE_LIMIT_CACHE_TTL_SECONDS)
     if not record:
         raise HTTPException(status_code=404, detail="User not found.")
 
     tier = record.get("tier", "free")
-    linked_vehicle_count = record.get("linked_vehicle_count", 0)
-    # NEW: Get purchased token balance
-    purchased_api_tokens = record.get("purchased_api_tokens", 0)
     # NEW: Get the date when the monthly allowance resets
     tier_reset_date_str = record.get("tier_reset_date")
     tier_reset_date = None
@@ -57,8 +59,6 @@ async def api_key_rate_limit(
             tier_reset_date = None # Fallback to default if parsing fails
 
     now = datetime.now(timezone.utc)
-    # Use a 30-day rolling window for monthly rate limits
-    window_start = now - timedelta(days=30)
 
     # Determine the effective tier for rate limiting based on trial/subscription status
     effective_tier = tier
@@ -68,33 +68,84 @@ async def api_key_rate_limit(
         if not tier_reset_date or tier_reset_date <= now:
             effective_tier = "free"
             logger.info(f"[INFO] User {user_id} (original tier: {tier}) is falling back to FREE tier for rate limiting due to expired trial or no active subscription.")
+    elif tier != "free":
+        # Default to free tier
+        effective_tier = "free"
 
-
-    max_calls = 0
+    # Load settings dynamically (monthly limits)
+    max_calls = await _get_setting_value("rate_limit.free.max_calls", 300)
     max_linked_vehicles = 0
-    current_count = 0
-    log_vehicle_id = None
+    if effective_tier == "basic":
+        max_calls = await _get_setting_value("rate_limit.basic.max_calls", 2500)
+        max_linked_vehicles = await _get_setting_value("rate_limit.basic.max_linked_vehicles", 2)
+    elif effective_tier == "pro":
+        max_calls = await _get_setting_value("rate_limit.pro.max_calls", 10000)
+        max_linked_vehicles = await _get_setting_value("rate_limit.pro.max_linked_vehicles", 5)
+
+    return {
+        "tier": tier,
+        "effective_tier": effective_tier,
+        "max_calls": max_calls,
+        "max_linked_vehicles": max_linked_vehicles,
+        "linked_vehicle_count": record.get("linked_vehicle_count", 0),
+        # NEW: Get purchased token balance
+        "purchased_api_tokens": record.get("purchased_api_tokens", 0),
+        "now": now,
+        # Use a 30-day rolling window for monthly rate limits
+        "window_start": now - timedelta(days=RATE_LIMIT_WINDOW_DAYS),
+    }
+
+
+def _poll_keys(user_id: str, vehicle_id: str | None) -> list[str]:
+    """Rate limiter keys a poll_logs row counts for: the user's, then the vehicle's if any."""
+    keys = [user_key(user_id)]
+    if vehicle_id:
+        keys.append(vehicle_key(vehicle_id))
+    return keys
+
+
+async def _owns_vehicle(user_id: str, vehicle_id: str) -> bool:
+    """Ownership check answered from the vehicle state registry, with a DB lookup when it does not know."""
+    state = get_vehicle_state_by_db_id(vehicle_id)
+    if state is not None and state.user_id == user_id:
+        return True
+    return bool(await get_vehicle_by_id_and_user_id(vehicle_id, user_id))
+
+
+def _check_linked_vehicles(limits: dict) -> None:
+    """Paid tiers only allow a limited number of linked vehicles."""
+    if limits["linked_vehicle_count"] > limits["max_linked_vehicles"]:
+        tier = limits["tier"]
+        raise HTTPException(
+            status_code=403,
+            detail=f"{tier.capitalize()} tier allows max {limits['max_linked_vehicles']} linked vehicles. You have {limits['linked_vehicle_count']}.",
+        )
 
-    # Load settings dynamically (monthly limits)
-    free_max_calls = await _get_setting_value("rate_limit.free.max_calls", 300)
-    basic_max_calls = await _get_setting_value("rate_limit.basic.max_calls", 2500)
-    pro_max_calls = await _get_setting_value("rate_limit.pro.max_calls", 10000)
-    basic_max_linked_vehicles = await _get_setting_value("rate_limit.basic.max_linked_vehicles", 2)
-    pro_max_linked_vehicles = await _get_setting_value("rate_limit.pro.max_linked_vehicles", 5)
 
-    path_vehicle_id = request.path_params.get("vehicle_id")
+async def api_key_rate_limit(
+    request: Request,
+    background_tasks: BackgroundTasks,
+    user=Depends(get_api_key_user)
+) -> None:
+    """
+    Rate limit for API-key authenticated users, based on a monthly tier allowance
+    plus a balance of purchased one-time tokens.
+    """
+    user_id = user.id
+    limits = await _load_rate_limit(user_id)
+    tier = limits["tier"]
+    max_calls = limits["max_calls"]
+    purchased_api_tokens = limits["purchased_api_tokens"]
+    now = limits["now"]
+    window_start = limits["window_start"]
+
+    # Basic/pro polls of a vehicle endpoint count against that vehicle, everything else against the user
+    log_vehicle_id = None
+    is_logged = any(request.url.path.startswith(ep) for ep in POLL_LOGGED_ENDPOINTS)
 
-    if effective_tier == "free":
-        max_calls = free_max_calls
-        current_count = await count_polls_since(user_id, window_start)
-    elif effective_tier in ["basic", "pro"]:
-        if tier == "basic":
-            max_calls = basic_max_calls
-            max_linked_vehicles = basic_max_linked_vehicles
-        else: # pro
-            max_calls = pro_max_calls
-            max_linked_vehicles = pro_max_linked_vehicles
+    path_vehicle_id = request.path_params.get("vehicle_id")
 
+    if limits["effective_tier"] in ["basic", "pro"]:
         # Check if the current path is a vehicle-specific endpoint
         is_vehicle_specific_endpoint = request.url.path.startswith("/api/ha/status/") or request.url.path.startswith("/api/ha/charging/")
 
@@ -102,21 +153,27 @@ async def api_key_rate_limit(
             if not path_vehicle_id:
                 raise HTTPException(status_code=400, detail=f"Vehicle ID is required in the URL path for {tier} tier for this endpoint.")
 
-            vehicle = await get_vehicle_by_id_and_user_id(path_vehicle_id, user_id)
-            if not vehicle:
+            if not await _owns_vehicle(user_id, path_vehicle_id):
                 raise HTTPException(status_code=404, detail="Vehicle not found or does not belong to user.")
 
-            if linked_vehicle_count > max_linked_vehicles:
-                raise HTTPException(status_code=403, detail=f"{tier.capitalize()} tier allows max {max_linked_vehicles} linked vehicles. You have {linked_vehicle_count}.")
+            _check_linked_vehicles(limits)
 
-            current_count = await count_polls_since_for_vehicle(path_vehicle_id, window_start)
             log_vehicle_id = path_vehicle_id
-        else: # Not a vehicle-specific endpoint, like /api/ha/vehicles
-            # For non-vehicle specific endpoints, count calls for the user, not a specific vehicle
-            current_count = await count_polls_since(user_id, window_start)
-            log_vehicle_id = None # No specific vehicle for logging this type of call
-    else: # Default to free tier
-        max_calls = free_max_calls
+        # Non-vehicle specific endpoints (like /api/ha/vehicles) count calls for the user, not a specific vehicle
+
+    # Logged polls are counted by the rate limiter right away (undone if the call is rejected)
+    hit_keys = None
+    if poll_rate_limiter.ready:
+        keys = _poll_keys(user_id, log_vehicle_id)
+        if is_logged:
+            totals = await poll_rate_limiter.hit(keys, now)
+            hit_keys = keys
+        else:
+            totals = await poll_rate_limiter.count(keys, now)
+        current_count = totals[-1]
+    elif log_vehicle_id:
+        current_count = await count_polls_since_for_vehicle(log_vehicle_id, window_start)
+    else:
         current_count = await count_polls_since(user_id, window_start)
 
     # Main rate limit logic with token fallback
@@ -127,30 +184,84 @@ async def api_key_rate_limit(
             await decrement_purchased_api_tokens(user_id)
         else:
             # No monthly allowance and no purchased tokens left.
+            if hit_keys:
+                await poll_rate_limiter.undo(hit_keys, now)
             raise HTTPException(
                 status_code=429,
                 detail=f"Rate limit exceeded for {tier} tier. Monthly allowance ({current_count}/{max_calls}) and purchased tokens (0) are exhausted."
             )
-    
-    # Define endpoints that should be rate-limited and logged
-    rate_limited_endpoints = [
-        "/api/status/",
-        "/api/ha/status/",
-        "/api/ha/charging/",
-    ]
 
     # Schedule logging as a background task only for specified endpoints
-    if any(request.url.path.startswith(ep) for ep in rate_limited_endpoints):
+    if is_logged:
         background_tasks.add_task(log_poll, user_id=user_id, endpoint=request.url.path, timestamp=now, vehicle_id=log_vehicle_id)
 
 
+async def charge_vehicle_polls(
+    request: Request,
+    background_tasks: BackgroundTasks,
+    user_id: str,
+    vehicle_ids: list[str],
+) -> None:
+    """
+    Rate limit for multi-vehicle requests (e.g. the /api/ha/status batch):
+    one poll is charged per vehicle, exactly as if each vehicle had been
+    polled on its own. Basic/pro count against each vehicle's allowance,
+    free against the user's. Polls beyond the allowance use purchased tokens.
+    All or nothing: if the tokens do not cover the polls, nothing is charged
+    and 429 is raised. Callers pass vehicle ids already checked for ownership.
+    """
+    if not vehicle_ids:
+        return
+
+    limits = await _load_rate_limit(user_id)
+    tier = limits["tier"]
+    max_calls = limits["max_calls"]
+    now = limits["now"]
+    window_start = limits["window_start"]
+    per_vehicle = limits["effective_tier"] in ["basic", "pro"]
+    if per_vehicle:
+        _check_linked_vehicles(limits)
+
+    hits = []
+    if poll_rate_limiter.ready:
+        # Counted one vehicle at a time, so each poll sees the ones before it
+        over_allowance = 0
+        for vehicle_id in vehicle_ids:
+            keys = _poll_keys(user_id, vehicle_id)
+            totals = await poll_rate_limiter.hit(keys, now)
+            hits.append(keys)
+            if (totals[-1] if per_vehicle else totals[0]) >= max_calls:
+                over_allowance += 1
+    elif per_vehicle:
+        over_allowance = 0
+        for vehicle_id in vehicle_ids:
+            if await count_polls_since_for_vehicle(vehicle_id, window_start) >= max_calls:
+                over_allowance += 1
+    else:
+        current_count = await count_polls_since(user_id, window_start)
+        over_allowance = max(0, current_count + len(vehicle_ids) - max(current_count, max_calls))
+
+    if over_allowance > limits["purchased_api_tokens"]:
+        for keys in hits:
+            await poll_rate_limiter.undo(keys, now)
+        raise HTTPException(
+            status_code=429,
+            detail=f"Rate limit exceeded for {tier} tier. {len(vehicle_ids)} vehicle poll(s) need {over_allowance} purchased token(s), {limits['purchased_api_tokens']} left.",
+        )
+    for _ in range(over_allowance):
+        await decrement_purchased_api_tokens(user_id)
+
+    for vehicle_id in vehicle_ids:
+        background_tasks.add_task(log_poll, user_id=user_id, endpoint=request.url.path, timestamp=now, vehicle_id=vehicle_id)
+
+
 async def require_pro_tier(user=Depends(get_api_key_user)) -> None:
     """
     Dependency to ensure the user has a 'pro' subscription tier.
     """
     user_id = user.id
     # MODIFIED: Use the more efficient data fetcher
-    record = await get_user_rate_limit_data(user_id)
+    record = await get_cached_user_rate_limit_data(user_id, RATE_LIMIT_CACHE_TTL_SECONDS)
     tier = record.get("tier", "free") if record else "free"
 
     if tier != "pro":
@@ -162,7 +273,7 @@ async def require_basic_or_pro_tier(user=Depends(get_api_key_user)) -> None:
     """
     user_id = user.id
     # MODIFIED: Use the more efficient data fetcher
-    record = await get_user_rate_limit_data(user_id)
+    record = await get_cached_user_rate_limit_data(user_id, RATE_LIMIT_CACHE_TTL_SECONDS)
     tier = record.get("tier", "free") if record else "free"
 
     if tier == "free":
@@ -3,17 +3,24 @@
 """
 Home Assistant API endpoints for EVLink backend.
 """
-import json
+import asyncio
+import hashlib
 import logging
-from fastapi import APIRouter, Depends, HTTPException, Body
+from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException, Body, Query, Request, Response
+from fastapi.responses import StreamingResponse
+import orjson
 from pydantic import BaseModel, Field
 from postgrest.exceptions import APIError
 
 from app.auth.api_key_auth import get_api_key_user
+from app.config import HA_STREAM_HEARTBEAT_SECONDS
+from app.lib.vehicle_cache import load_vehicle_cache
 from app.models.user import User
-from app.storage.vehicle import get_all_cached_vehicles, get_vehicle_by_id, get_vehicle_by_vehicle_id
+from app.services.ha_status import etag_matches, ha_status_cache, normalize_location
+from app.services.ha_stream import format_status_event, ha_stream_broker
+from app.storage.vehicle import get_all_cached_vehicles, get_vehicle_by_id, get_vehicle_by_vehicle_id, get_vehicles_for_user
 from app.enode.vehicle import set_vehicle_charging
-from app.api.dependencies import api_key_rate_limit, require_basic_or_pro_tier
+from app.api.dependencies import api_key_rate_limit, charge_vehicle_polls, require_basic_or_pro_tier
 from app.dependencies.auth import get_current_user
 from app.storage.user import get_user_by_id, set_ha_webhook_settings, get_ha_webhook_settings
 from app.storage.enode_account import get_enode_account_for_user
@@ -24,10 +31,6 @@ logger = logging.getLogger(__name__)
 
 router = APIRouter()
 
-# Cache: maps (user_id, enode_vehicle_id) -> the vehicle_id format HA uses for polling.
-# This lets the webhook push use the same ID format that HA expects.
-ha_vehicle_id_cache: dict[str, str] = {}  # key: f"{user_id}:{enode_vehicle_id}", value: polled vehicle_id
-
 def _handle_api_error(e: APIError, vehicle_id: str, context: str):
     """
     Handle APIError from Supabase. Translate common error codes to HTTP responses.
@@ -57,24 +60,6 @@ def _handle_api_error(e: APIError, vehicle_id: str, context: str):
     raise HTTPException(status_code=502, detail="Error fetching vehicle data")
 
 
-def _normalize_location(location_data):
-    """
-    Normalize location data - returns None if location is invalid or has null values.
-    Returns the location dict only if it has valid latitude and longitude.
-    """
-    if not location_data or not isinstance(location_data, dict):
-        return None
-
-    lat = location_data.get("latitude")
-    lon = location_data.get("longitude")
-
-    # Return None if lat/lon are missing or null
-    if lat is None or lon is None:
-        return None
-
-    return location_data
-
-
 @router.get("/ha/me", 
             summary="Get current user information for Home Assistant",
             )
@@ -143,12 +128,6 @@ async def get_vehicle_status_legacy(vehicle_id: str, user: User = Depends(get_ap
         logger.warning("[get_vehicle_status_legacy] Vehicle not found: %s", vehicle_id)
         raise HTTPException(status_code=404, detail="Vehicle not found")
 
-    # Record which vehicle ID format HA is using so webhook pushes can match it
-    enode_vid = vehicle.get("vehicle_id")
-    if enode_vid:
-        cache_key = f"{user.id}:{enode_vid}"
-        ha_vehicle_id_cache[cache_key] = vehicle_id
-
     if vehicle.get("user_id") != user.id:
         logger.warning(
             "[get_vehicle_status_legacy] Access denied for user_id=%s on vehicle_id=%s",
@@ -157,21 +136,15 @@ async def get_vehicle_status_legacy(vehicle_id: str, user: User = Depends(get_ap
         )
         raise HTTPException(status_code=403, detail="Access denied")
 
-    try:
-        cache = json.loads(vehicle["vehicle_cache"])
-    except json.JSONDecodeError as e:
-        logger.error(
-            "[get_vehicle_status_legacy] JSON decode error for vehicle_cache %s: %s",
-            vehicle_id,
-            e,
-            exc_info=True,
-        )
-        raise HTTPException(status_code=500, detail=f"Invalid vehicle cache: {e}")
+    cache = load_vehicle_cache(vehicle.get("vehicle_cache"))
+    if not cache:
+        logger.error("[get_vehicle_status_legacy] Empty or invalid vehicle_cache for %s", vehicle_id)
+        raise HTTPException(status_code=500, detail="Invalid vehicle cache")
 
     charge = cache.get("chargeState", {})
     info = cache.get("information", {})
     raw_location = cache.get("location", {})
-    location = _normalize_location(raw_location)
+    location = normalize_location(raw_location)
     last_seen = cache.get("lastSeen")
     is_reachable = cache.get("isReachable")
     odometer = cache.get("odometer", {})
@@ -249,21 +222,15 @@ def unpack_vehicle(vehicle, vehicle_id):
     """
     Unpack vehicle data from the database format to a more usable format.
     """
-    try:
-        cache = json.loads(vehicle["vehicle_cache"])
-    except json.JSONDecodeError as e:
-        logger.error(
-            "[get_vehicle_status] JSON decode error for vehicle_cache %s: %s",
-            vehicle_id,
-            e,
-            exc_info=True,
-        )
-        raise HTTPException(status_code=500, detail=f"Invalid vehicle cache: {e}")
+    cache = load_vehicle_cache(vehicle.get("vehicle_cache"))
+    if not cache:
+        logger.error("[get_vehicle_status] Empty or invalid vehicle_cache for %s", vehicle_id)
+        raise HTTPException(status_code=500, detail="Invalid vehicle cache")
 
     charge = cache.get("chargeState", {})
     info = cache.get("information", {})
     raw_location = cache.get("location", {})
-    location = _normalize_location(raw_location)
+    location = normalize_location(raw_location)
     last_seen = cache.get("lastSeen")
     is_reachable = cache.get("isReachable")
     odometer = cache.get("odometer", {})
@@ -287,33 +254,119 @@ def unpack_vehicle(vehicle, vehicle_id):
         "smartChargingPolicy": smart_charging_policy,
     }
 
+@router.get("/ha/status",
+            summary="Status of several vehicles in one request",
+            )
+async def get_vehicles_status(
+    request: Request,
+    background_tasks: BackgroundTasks,
+    vehicle_ids: list[str] | None = Query(None, alias="vehicle_id"),
+    user: User = Depends(get_api_key_user),
+):
+    """
+    Status of all of the user's vehicles, or of the ones given as repeated
+    ?vehicle_id= parameters (internal or Enode ids), read with a single query.
+
+    One poll is charged per vehicle returned (see charge_vehicle_polls), so a
+    batch costs the same as polling each vehicle on /ha/status/{vehicle_id}.
+    Returns {"vehicles": {<internal id>: <status>}, "missing": [<requested ids not found>]}
+    with an ETag over all documents; a matching If-None-Match gets 304 (still charged).
+    """
+    logger.info("[get_vehicles_status] Fetching status for user_id=%s, vehicle_ids=%s", user.id, vehicle_ids)
+
+    vehicles = get_vehicles_for_user(user.id, "id, vehicle_id, user_id, vehicle_cache")
+    if vehicles is None:
+        raise HTTPException(status_code=502, detail="Error fetching vehicle data")
+
+    requested = set(vehicle_ids) if vehicle_ids else None
+    docs = []
+    for vehicle in vehicles:
+        matched = requested is None or vehicle.get("id") in requested or vehicle.get("vehicle_id") in requested
+        if not matched:
+            continue
+        if requested is not None:
+            requested.discard(vehicle.get("id"))
+            requested.discard(vehicle.get("vehicle_id"))
+        doc = ha_status_cache.put(
+            vehicle.get("id"), vehicle.get("vehicle_id"), vehicle.get("user_id"),
+            load_vehicle_cache(vehicle.get("vehicle_cache")),
+        )
+        if doc is None:
+            logger.error("[get_vehicles_status] Empty or invalid vehicle_cache for %s", vehicle.get("id"))
+            continue
+        docs.append(doc)
+
+    if vehicle_ids and not docs:
+        raise HTTPException(status_code=404, detail="Vehicle not found")
+
+    await charge_vehicle_polls(request, background_tasks, user.id, [doc.db_id for doc in docs])
+    # Telemetry cost of this request (one token per vehicle)
+    request.state.cost_tokens = len(docs)
+
+    missing = sorted(requested) if requested else []
+    etag_source = "".join(doc.etag for doc in docs) + ",".join(missing)
+    etag = '"' + hashlib.blake2b(etag_source.encode(), digest_size=12).hexdigest() + '"'
+    headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        ha_status_cache.record_not_modified()
+        return Response(status_code=304, headers=headers)
+
+    # Rendered documents are spliced in as-is
+    body = (
+        b'{"vehicles":{'
+        + b",".join(orjson.dumps(doc.db_id) + b":" + doc.body for doc in docs)
+        + b'},"missing":' + orjson.dumps(missing) + b"}"
+    )
+    return Response(content=body, media_type="application/json", headers=headers)
+
+
 @router.get("/ha/status/{vehicle_id}",
             dependencies=[Depends(api_key_rate_limit)],)
-async def get_vehicle_status(vehicle_id: str, user: User = Depends(get_api_key_user)):
-    logger.info(                                                                                                                                                                                                                                            
+async def get_vehicle_status(vehicle_id: str, request: Request, user: User = Depends(get_api_key_user)):
+    """
+    Full status of a vehicle, served from the status document rendered when the
+    vehicle was last saved (read from the database only on a cache miss).
+    Responses carry an ETag; a matching If-None-Match is answered with 304.
+    """
+    logger.info(
         "[get_vehicle_status] Fetching full status for vehicle_id=%s, user_id=%s",
         vehicle_id,
         user.id,
     )
 
-    try:
-        vehicle = await get_vehicle_by_id(vehicle_id)
-    except APIError as e:
-        _handle_api_error(e, vehicle_id, "get_vehicle_status")
-    except Exception as e:
-        logger.error(
-            "[get_vehicle_status] Unexpected error fetching vehicle %s: %s",
-            vehicle_id,
-            e,
-            exc_info=True,
-        )
-        raise HTTPException(status_code=502, detail="Error fetching vehicle data")
-
-    if not vehicle:
-        logger.warning("[get_vehicle_status] Vehicle not found: %s", vehicle_id)
-        raise HTTPException(status_code=404, detail="Vehicle not found")
+    doc = ha_status_cache.get(vehicle_id)
+    if doc is None:
+        try:
+            vehicle = await get_vehicle_by_id(vehicle_id)
+        except APIError as e:
+            _handle_api_error(e, vehicle_id, "get_vehicle_status")
+        except Exception as e:
+            logger.error(
+                "[get_vehicle_status] Unexpected error fetching vehicle %s: %s",
+                vehicle_id,
+                e,
+                exc_info=True,
+            )
+            raise HTTPException(status_code=502, detail="Error fetching vehicle data")
 
-    if vehicle.get("user_id") != user.id:
+        if not vehicle:
+            logger.warning("[get_vehicle_status] Vehicle not found: %s", vehicle_id)
+            raise HTTPException(status_code=404, detail="Vehicle not found")
+
+        if vehicle.get("user_id") != user.id:
+            logger.warning(
+                "[get_vehicle_status] Access denied for user_id=%s on vehicle_id=%s",
+                user.id,
+                vehicle_id,
+            )
+            raise HTTPException(status_code=403, detail="Access denied")
+
+        cache = load_vehicle_cache(vehicle.get("vehicle_cache"))
+        doc = ha_status_cache.put(vehicle.get("id"), vehicle.get("vehicle_id"), vehicle.get("user_id"), cache)
+        if doc is None:
+            logger.error("[get_vehicle_status] Empty or invalid vehicle_cache for %s", vehicle_id)
+            raise HTTPException(status_code=500, detail="Invalid vehicle cache")
+    elif doc.user_id != user.id:
         logger.warning(
             "[get_vehicle_status] Access denied for user_id=%s on vehicle_id=%s",
             user.id,
@@ -321,47 +374,80 @@ async def get_vehicle_status(vehicle_id: str, user: User = Depends(get_api_key_u
         )
         raise HTTPException(status_code=403, detail="Access denied")
 
-    try:
-        cache = json.loads(vehicle["vehicle_cache"])
-    except json.JSONDecodeError as e:
-        logger.error(
-            "[get_vehicle_status] JSON decode error for vehicle_cache %s: %s",
-            vehicle_id,
-            e,
-            exc_info=True,
-        )
-        raise HTTPException(status_code=500, detail=f"Invalid vehicle cache: {e}")
-
-    charge = cache.get("chargeState", {})
-    info = cache.get("information", {})
-    raw_location = cache.get("location", {})
-    location = _normalize_location(raw_location)
-    last_seen = cache.get("lastSeen")
-    is_reachable = cache.get("isReachable")
-    odometer = cache.get("odometer", {})
-    vendor = cache.get("vendor")
-    smart_charging_policy = cache.get("smartChargingPolicy", {})
-    capabilities = cache.get("capabilities", {})
-    abrp_extra = cache.get("abrp_extra", {})
+    headers = {"ETag": doc.etag, "Cache-Control": "private, no-cache"}
+    if etag_matches(request.headers.get("if-none-match"), doc.etag):
+        ha_status_cache.record_not_modified()
+        return Response(status_code=304, headers=headers)
+    return Response(content=doc.body, media_type="application/json", headers=headers)
 
-    result = {
-        "vehicleName": f"{info.get('brand', '')} {info.get('model', '')}",
-        "isReachable": is_reachable,
-        "chargeState": charge,
-        "information": info,
-        "location": location,
-        "locationAvailable": location is not None,
-        "odometer": odometer,
-        "vendor": vendor,
-        "smartChargingPolicy": smart_charging_policy,
-        "capabilities": capabilities,
-        "lastSeen": last_seen,
-    }
+@router.get("/ha/stream",
+            summary="Server-Sent Events stream of vehicle status updates",
+            )
+async def stream_vehicle_status(request: Request, user: User = Depends(get_api_key_user)):
+    """
+    Long-lived text/event-stream with a "status" event (the /ha/status document
+    plus vehicleId/enodeVehicleId) whenever fresh data is saved for one of the
+    user's vehicles. Not counted against the poll quota.
 
-    if abrp_extra:
-        result["abrp_extra"] = abrp_extra
+    Reconnecting with Last-Event-ID resumes after that event; otherwise the
+    stream starts with the current status of every vehicle. Comment lines are
+    sent as heartbeats every HA_STREAM_HEARTBEAT_SECONDS.
+    """
+    subscriber = ha_stream_broker.subscribe(user.id)
+    if subscriber is None and ha_stream_broker.is_closed:
+        raise HTTPException(status_code=503, detail="Server is shutting down")
+    if subscriber is None:
+        logger.warning("[stream_vehicle_status] Too many open streams for user_id=%s", user.id)
+        raise HTTPException(status_code=429, detail="Too many open streams")
+
+    last_event_id = request.headers.get("last-event-id")
+    initial = ha_stream_broker.replay(user.id, last_event_id)
+    if initial is None:
+        # Events published from here on are queued for the subscriber, so the
+        # snapshot is tagged with the current id and nothing is missed on resume
+        event_id = ha_stream_broker.current_event_id()
+        vehicles = get_vehicles_for_user(user.id, "id, vehicle_id, user_id, vehicle_cache")
+        if vehicles is None:
+            ha_stream_broker.unsubscribe(subscriber)
+            raise HTTPException(status_code=502, detail="Error fetching vehicle data")
+        initial = []
+        for vehicle in vehicles:
+            doc = ha_status_cache.put(
+                vehicle.get("id"), vehicle.get("vehicle_id"), vehicle.get("user_id"),
+                load_vehicle_cache(vehicle.get("vehicle_cache")),
+            )
+            if doc:
+                initial.append(format_status_event(doc, event_id))
+    logger.info(
+        "[stream_vehicle_status] Stream opened for user_id=%s (%d initial event(s), resumed=%s)",
+        user.id, len(initial), last_event_id is not None,
+    )
 
-    return result
+    async def _events():
+        try:
+            for frame in initial:
+                yield frame
+            while True:
+                try:
+                    frame = await asyncio.wait_for(subscriber.queue.get(), timeout=HA_STREAM_HEARTBEAT_SECONDS)
+                except asyncio.TimeoutError:
+                    if await request.is_disconnected():
+                        break
+                    yield b": heartbeat\n\n"
+                    continue
+                if frame is None:
+                    # Closed by the broker (slow consumer or shutdown): the client reconnects
+                    break
+                yield frame
+        finally:
+            ha_stream_broker.unsubscribe(subscriber)
+            logger.info("[stream_vehicle_status] Stream closed for user_id=%s", user.id)
+
+    return StreamingResponse(
+        _events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
 
 # -------------------------------------------------------------------
 # Pydantic model for charging action
@@ -404,7 +490,7 @@ async def post_vehicle_charging(
 
     # 1) Fetch vehicle to verify ownership
     try:
-        vehicle = await get_vehicle_by_id(vehicle_id)
+        vehicle = await get_vehicle_by_id(vehicle_id, columns="id, user_id, vehicle_id")
     except APIError as e:
         _handle_api_error(e, vehicle_id, "post_vehicle_charging")
     except Exception as e:
@@ -595,7 +681,7 @@ async def update_session_odometer(
 
     # Verify vehicle ownership
     try:
-        vehicle = await get_vehicle_by_vehicle_id(vehicle_id)
+        vehicle = await get_vehicle_by_vehicle_id(vehicle_id, columns="id, user_id, vehicle_id")
     except APIError as e:
         _handle_api_error(e, vehicle_id, "update_session_odometer")
     except Exception as e:
@@ -7,6 +7,7 @@ from pydantic import BaseModel
 from app.auth.supabase_auth import get_supabase_user
 from app.enode.link import create_link_session
 from app.enode.user import get_user_vehicles_enode, unlink_vendor
+from app.lib.vehicle_cache import load_vehicle_cache
 from app.storage.api_key import create_api_key, get_api_key_info
 from app.storage.enode_account import get_enode_account_for_user, get_best_account_for_new_user, assign_user_to_account
 from app.storage.insights import get_global_stats_row, get_user_stats_row
@@ -18,7 +19,6 @@ import httpx
 from app.api.dependencies import require_pro_tier
 from app.storage.vehicle import delete_vehicles_by_vendor, get_all_cached_vehicles, get_vehicle_by_vehicle_id, get_vehicles_by_country, save_vehicle_data_with_client
 
-import json
 import logging
 
 
@@ -101,7 +101,7 @@ async def get_user_vehicles(user=Depends(get_supabase_user)):
     cached_data = get_all_cached_vehicles(user_id)
     vehicles_from_cache = []
     for row in cached_data:
-        vehicle_obj = json.loads(row["vehicle_cache"]) if isinstance(row["vehicle_cache"], str) else row["vehicle_cache"]
+        vehicle_obj = load_vehicle_cache(row["vehicle_cache"])
         vehicle_obj["db_id"] = row["id"]
         vehicle_obj["source"] = row.get("source") or "enode"
         vehicles_from_cache.append(vehicle_obj)
@@ -3,16 +3,19 @@ import stripe
 from stripe import StripeObject
 
 import copy
-import json
 import time
+from collections import OrderedDict
 from fastapi import APIRouter, Request, Header, HTTPException
 import logging
 
 from fastapi.responses import JSONResponse
 import httpx
+import orjson
 
 from app.api.payments import process_successful_payment_intent
-from app.config import STRIPE_WEBHOOK_SECRET
+from app.config import STRIPE_WEBHOOK_SECRET, WEBHOOK_INGEST_MODE
+from app.lib.enode_vehicle import EnodeVehicle, decode_enode_vehicle
+from app.lib.vehicle_delta import DELTA_NOOP, DELTA_STATE
 from app.lib.webhook_logic import process_event
 from app.storage.user import add_user_sms_credits, add_purchased_api_tokens, get_ha_webhook_settings, get_user_by_id, get_user_id_by_stripe_customer_id, remove_stripe_customer_id, update_user_subscription, update_user, update_ha_push_stats
 from app.services.pushover_service import get_pushover_service
@@ -21,9 +24,14 @@ from app.storage.user import update_abrp_push_stats
 from app.storage.subscription import get_price_id_map, update_subscription_status, upsert_subscription_from_stripe
 from app.enode.verify import verify_signature_multi
 from app.storage.webhook import save_webhook_event
+from app.storage.vehicle_state import vehicle_state_entry
 from app.services.stripe_utils import log_stripe_webhook
 from app.storage.invoice import find_subscription_id, upsert_invoice_from_stripe
 from app.services.metrics import track_ha_push, track_webhook_received
+from app.services.webhook_ingest import webhook_ingest_queue
+from app.services.fanout import SINK_ABRP, SINK_HA, SINK_PUSHOVER, fanout_dispatcher
+from app.services.vehicle_lanes import vehicle_lanes
+from app.services.webhook_idempotency import webhook_idempotency
 
 # Create a module-specific logger
 logger = logging.getLogger(__name__)
@@ -37,16 +45,65 @@ async def _safe_background_task(coro, task_name: str):
         logger.error("[❌ Background %s] %s", task_name, e)
 
 
+class WebhookDedupCache:
+    """
+    Remembers when each (vehicle_id, event_type) was last processed.
+    Entries are kept in an OrderedDict in processing-time order, so expired
+    entries are always at the front and are popped in amortized O(1) per event.
+    A hard size bound evicts the oldest entries if a burst exceeds it.
+    """
+
+    def __init__(self, window_seconds: float, max_entries: int = 50_000):
+        self.window_seconds = window_seconds
+        self.max_entries = max_entries
+        self._entries: OrderedDict[tuple[str, str], float] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _expire(self, now: float):
+        """Drop entries older than the window (they can no longer cause a skip)."""
+        entries = self._entries
+        while entries:
+            key, seen_at = next(iter(entries.items()))
+            if now - seen_at < self.window_seconds:
+                break
+            entries.popitem(last=False)
+
+    def check_and_mark(self, key: tuple[str, str]) -> bool:
+        """Returns True if key was processed within the window; otherwise records it and returns False."""
+        now = time.monotonic()
+        self._expire(now)
+
+        if key in self._entries:
+            self.hits += 1
+            return True
+
+        self.misses += 1
+        self._entries[key] = now
+        if len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+        return False
+
+    def stats(self) -> dict:
+        return {
+            "size": len(self._entries),
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
+
+
 # Webhook deduplication cache: {(vehicle_id, event_type): last_processed_time}
 # Prevents processing the same vehicle update multiple times within DEDUP_WINDOW_SECONDS
-_webhook_dedup_cache: dict[tuple[str, str], float] = {}
 DEDUP_WINDOW_SECONDS = 2.0  # Skip duplicate events within 2 seconds
+_webhook_dedup_cache = WebhookDedupCache(DEDUP_WINDOW_SECONDS)
 
 
 def _should_process_event(event: dict) -> bool:
     """Check if we should process this event or skip as duplicate."""
-    global _webhook_dedup_cache
-
     event_type = event.get("event", "")
     vehicle = event.get("vehicle", {})
     vehicle_id = vehicle.get("id") if vehicle else None
@@ -55,23 +112,18 @@ def _should_process_event(event: dict) -> bool:
     if not vehicle_id or event_type != "user:vehicle:updated":
         return True
 
-    cache_key = (vehicle_id, event_type)
-    now = time.time()
-
-    # Clean old entries (older than 60 seconds)
-    expired_keys = [k for k, v in _webhook_dedup_cache.items() if now - v > 60]
-    for k in expired_keys:
-        del _webhook_dedup_cache[k]
-
-    last_time = _webhook_dedup_cache.get(cache_key)
-    if last_time and (now - last_time) < DEDUP_WINDOW_SECONDS:
+    if _webhook_dedup_cache.check_and_mark((vehicle_id, event_type)):
         logger.debug("[⏭️ Dedup] Skipping duplicate event for vehicle %s", vehicle_id)
         return False
 
-    _webhook_dedup_cache[cache_key] = now
     return True
 
 
+def get_dedup_stats() -> dict:
+    """Size and hit/miss counters of the webhook dedup cache (for admin metrics)."""
+    return _webhook_dedup_cache.stats()
+
+
 def _dedupe_batch_by_latest(events: list[dict]) -> list[dict]:
     """
     Pre-process a batch of webhook events to keep only the most recent event per vehicle.
@@ -118,13 +170,45 @@ def _dedupe_batch_by_latest(events: list[dict]) -> list[dict]:
 
 router = APIRouter()
 
-# Cache for tracking vehicle state changes (for Pushover notifications)
-# Format: {vehicle_id: {"isCharging": bool, "isReachable": bool, "isFullyCharged": bool, "batteryLevel": int|None}}
-_vehicle_state_cache: dict[str, dict] = {}
-
-
-async def send_pushover_notification(event: dict, user_id: str | None):
-    """Sends Pushover notification based on vehicle state changes and user preferences."""
+def _record_vehicle_state(decoded: EnodeVehicle | None) -> dict | None:
+    """
+    Store the latest notification-relevant state for a vehicle and return the previous one.
+    Called from the vehicle's processing lane, so transitions are recorded in event order
+    even though the notifications themselves are sent from background tasks.
+    """
+    if decoded is None or not decoded.id:
+        return None
+
+    state = vehicle_state_entry(decoded.id)
+    prev_state = {
+        "isCharging": state.is_charging,
+        "isReachable": state.is_reachable,
+        "isFullyCharged": state.is_fully_charged,
+        "batteryLevel": state.battery_level,
+    } if state.notified else None
+    state.notified = True
+    state.is_charging = decoded.is_charging
+    state.is_reachable = decoded.is_reachable
+    state.is_fully_charged = decoded.is_fully_charged
+    state.battery_level = decoded.battery_level
+    return prev_state
+
+
+def _decoded_vehicle(event: dict, decoded: EnodeVehicle | None) -> EnodeVehicle:
+    """The event's vehicle as decoded by the webhook pipeline, decoding it here if it was not passed."""
+    return decoded if decoded is not None else decode_enode_vehicle(event.get("vehicle") or {})
+
+
+async def send_pushover_notification(
+    event: dict,
+    user_id: str | None,
+    prev_state: dict | None,
+    decoded: EnodeVehicle | None = None,
+):
+    """
+    Sends Pushover notification based on vehicle state changes and user preferences.
+    prev_state is the state recorded by _record_vehicle_state before this event.
+    """
     if not user_id:
         return
 
@@ -141,29 +225,16 @@ async def send_pushover_notification(event: dict, user_id: str | None):
         if not pushover_enabled or not pushover_user_key:
             return
 
-        vehicle = event.get("vehicle", {})
-        vehicle_id = vehicle.get("id")
+        decoded = _decoded_vehicle(event, decoded)
+        vehicle_id = decoded.id
         if not vehicle_id:
             return
 
-        charge_state = vehicle.get("chargeState", {})
-        is_charging = charge_state.get("isCharging")
-        is_fully_charged = charge_state.get("isFullyCharged")
-        is_reachable = vehicle.get("isReachable")
-        battery_level = charge_state.get("batteryLevel")
-        vehicle_info = vehicle.get("information", {})
-        vehicle_name = vehicle_info.get("displayName") or f"{vehicle_info.get('brand', '')} {vehicle_info.get('model', '')}".strip() or "Your vehicle"
-
-        # Get previous state
-        prev_state = _vehicle_state_cache.get(vehicle_id)
-
-        # Update cache with current state
-        _vehicle_state_cache[vehicle_id] = {
-            "isCharging": is_charging,
-            "isReachable": is_reachable,
-            "isFullyCharged": is_fully_charged,
-            "batteryLevel": battery_level,
-        }
+        is_charging = decoded.is_charging
+        is_fully_charged = decoded.is_fully_charged
+        is_reachable = decoded.is_reachable
+        battery_level = decoded.battery_level
+        vehicle_name = decoded.name or "Your vehicle"
 
         # Skip notifications when we have no previous state (e.g. first event after
         # container restart).  The first event only seeds the cache so we can detect
@@ -284,15 +355,21 @@ async def send_pushover_notification(event: dict, user_id: str | None):
         logger.error(f"[❌ Pushover] Error sending notification for user {user_id}: {e}")
 
 
-async def _enrich_ha_event(ha_event: dict, user_id: str):
-    """Look up internal DB ID for the vehicle and enrich the event with cached data."""
+async def _enrich_ha_event(ha_event: dict, user_id: str, decoded: EnodeVehicle):
+    """
+    Look up internal DB ID for the vehicle and enrich the event with cached data.
+    decoded is the (unmodified) event vehicle; ha_event is the copy that gets enriched.
+    """
     vehicle = ha_event.get("vehicle", {})
-    enode_vehicle_id = vehicle.get("id")
+    enode_vehicle_id = decoded.id
     internal_id = None
 
     if enode_vehicle_id:
         from app.storage.vehicle import get_vehicle_by_vehicle_id
-        db_vehicle = await get_vehicle_by_vehicle_id(enode_vehicle_id)
+        db_vehicle = await get_vehicle_by_vehicle_id(
+            enode_vehicle_id,
+            columns="id, abrp_extra:vehicle_cache->abrp_extra, odometer:vehicle_cache->odometer",
+        )
         if db_vehicle:
             internal_id = db_vehicle.get("id")
             # Add both IDs as extra fields
@@ -304,33 +381,26 @@ async def _enrich_ha_event(ha_event: dict, user_id: str):
 
             # Enrich with data from DB cache
             try:
-                db_cache_str = db_vehicle.get("vehicle_cache")
-                if db_cache_str:
-                    db_cache = json.loads(db_cache_str) if isinstance(db_cache_str, str) else db_cache_str
-                    abrp_extra = db_cache.get("abrp_extra")
-                    if abrp_extra:
-                        vehicle["abrp_extra"] = abrp_extra
-                        logger.info("HA push: Enriched event with abrp_extra for user %s", user_id)
-                    enode_odometer = vehicle.get("odometer") or {}
-                    if not enode_odometer.get("distance") and db_cache.get("odometer"):
-                        db_odo = db_cache["odometer"]
-                        if isinstance(db_odo, dict) and db_odo.get("distance"):
-                            vehicle["odometer"] = db_odo
-                            logger.info("HA push: Enriched odometer from DB cache (%s km) for user %s", db_odo.get("distance"), user_id)
-                        elif isinstance(db_odo, (int, float)) and db_odo > 0:
-                            vehicle["odometer"] = {"distance": db_odo, "lastUpdated": None}
-                            logger.info("HA push: Enriched odometer from DB cache (%s km) for user %s", db_odo, user_id)
+                abrp_extra = db_vehicle.get("abrp_extra")
+                if abrp_extra:
+                    vehicle["abrp_extra"] = abrp_extra
+                    logger.info("HA push: Enriched event with abrp_extra for user %s", user_id)
+                if not decoded.odometer_km and db_vehicle.get("odometer"):
+                    db_odo = db_vehicle["odometer"]
+                    if isinstance(db_odo, dict) and db_odo.get("distance"):
+                        vehicle["odometer"] = db_odo
+                        logger.info("HA push: Enriched odometer from DB cache (%s km) for user %s", db_odo.get("distance"), user_id)
+                    elif isinstance(db_odo, (int, float)) and db_odo > 0:
+                        vehicle["odometer"] = {"distance": db_odo, "lastUpdated": None}
+                        logger.info("HA push: Enriched odometer from DB cache (%s km) for user %s", db_odo, user_id)
             except Exception as e:
                 logger.warning("HA push: Failed to enrich from DB cache: %s", e)
         else:
             logger.warning("HA push: Could not find DB vehicle for Enode ID %s", enode_vehicle_id)
 
     # Ensure displayName is set
-    info = vehicle.get("information", {})
-    if not info.get("displayName"):
-        brand = info.get("brand", "")
-        model = info.get("model", "")
-        fallback_name = f"{brand} {model}".strip()
+    if not decoded.display_name:
+        fallback_name = decoded.name
         if fallback_name:
             if "information" not in vehicle:
                 vehicle["information"] = {}
@@ -368,7 +438,7 @@ async def _send_to_ha_webhook(ha_event: dict, url: str, vehicle: dict, user_id:
         return False
 
 
-async def push_to_homeassistant(event: dict, user_id: str | None):
+async def push_to_homeassistant(event: dict, user_id: str | None, decoded: EnodeVehicle | None = None):
     """Pushes a single event to Home Assistant via webhook settings in the DB.
     Supports multi-vehicle: if ha_webhooks array has entries, push to the
     webhook matching this vehicle. Falls back to legacy single webhook."""
@@ -389,18 +459,18 @@ async def push_to_homeassistant(event: dict, user_id: str | None):
         return
 
     # Create a copy and enrich the event
+    decoded = _decoded_vehicle(event, decoded)
     ha_event = copy.deepcopy(event)
     vehicle = ha_event.get("vehicle", {})
-    enode_vehicle_id, internal_id = await _enrich_ha_event(ha_event, user_id)
+    enode_vehicle_id, internal_id = await _enrich_ha_event(ha_event, user_id, decoded)
 
     # Log chargeState
-    charge_state = vehicle.get("chargeState", {})
     logger.info(
         "HA push chargeState for user %s: chargeRate=%s, batteryLevel=%s, isCharging=%s",
         user_id,
-        charge_state.get("chargeRate"),
-        charge_state.get("batteryLevel"),
-        charge_state.get("isCharging"),
+        decoded.charge_rate,
+        decoded.battery_level,
+        decoded.is_charging,
     )
 
     # Try ha_webhooks array first (multi-vehicle support)
@@ -445,7 +515,7 @@ async def push_to_homeassistant(event: dict, user_id: str | None):
         update_ha_push_stats(user_id, success=False, error="vehicle_id_mismatch")
 
 
-async def push_to_abrp(event: dict, user_id: str | None):
+async def push_to_abrp(event: dict, user_id: str | None, decoded: EnodeVehicle | None = None):
     """Sends vehicle telemetry to ABRP if enabled for the user."""
     if not user_id:
         return
@@ -461,18 +531,15 @@ async def push_to_abrp(event: dict, user_id: str | None):
         if not abrp_enabled or not abrp_token:
             return
 
-        vehicle = event.get("vehicle", {})
-        charge_state = vehicle.get("chargeState", {})
-        location = vehicle.get("location", {})
-        odometer_data = vehicle.get("odometer", {})
+        decoded = _decoded_vehicle(event, decoded)
 
         # Extract telemetry data from Enode webhook
-        soc = charge_state.get("batteryLevel")
-        is_charging = charge_state.get("isCharging")
-        charge_rate = charge_state.get("chargeRate")  # kW
-        lat = location.get("latitude")
-        lon = location.get("longitude")
-        odometer = odometer_data.get("distance")  # km (may be None)
+        soc = decoded.battery_level
+        is_charging = decoded.is_charging
+        charge_rate = decoded.charge_rate  # kW
+        lat = decoded.latitude
+        lon = decoded.longitude
+        odometer = decoded.odometer_km  # km (may be None)
 
         # Only send if we have at least SOC
         if soc is None:
@@ -503,6 +570,139 @@ async def push_to_abrp(event: dict, user_id: str | None):
         logger.error("[ABRP] Error sending telemetry for user %s: %s", user_id, e)
 
 
+async def _process_webhook_event(event: dict, fan_out: bool = True) -> int:
+    """
+    Processes one webhook event and fans out to HA, Pushover and ABRP
+    (fan_out=False skips the pushes, e.g. for webhook replays).
+    Runs inside the vehicle's lane, so events for the same vehicle never overlap.
+    Telemetry-only updates skip Pushover (its notifications are all state transitions);
+    no-op updates are neither saved nor pushed.
+    The vehicle is decoded once here and shared with every stage.
+    Returns the handled count from process_event.
+    """
+    vehicle = event.get("vehicle")
+    decoded = decode_enode_vehicle(vehicle) if isinstance(vehicle, dict) else None
+    count, was_saved, delta = await process_event(event, detect_changes=True, decoded=decoded)
+    user_id = event.get('user', {}).get('id')
+    # Only push to HA if fresh data was saved (not stale)
+    # Queued on the per-sink fan-out pools to respond to Enode within 5s timeout
+    if was_saved and not fan_out:
+        _record_vehicle_state(decoded)
+    elif was_saved:
+        prev_state = _record_vehicle_state(decoded)
+        fanout_dispatcher.dispatch(SINK_HA, push_to_homeassistant, event, user_id, decoded)
+        if delta == DELTA_STATE:
+            fanout_dispatcher.dispatch(SINK_PUSHOVER, send_pushover_notification, event, user_id, prev_state, decoded)
+        fanout_dispatcher.dispatch(SINK_ABRP, push_to_abrp, event, user_id, decoded)
+    elif delta == DELTA_NOOP:
+        logger.info("[⏭️ Skip fan-out] No meaningful changes for user %s", user_id)
+    else:
+        logger.info("[⏭️ Skip HA push] Stale data not pushed for user %s", user_id)
+    return count
+
+
+async def _process_claimed_event(event: dict) -> int:
+    """
+    _process_webhook_event for an event claimed by _claim_new_events: the claim
+    is confirmed once the event is processed, and released if processing fails
+    or is cancelled (e.g. at the lane drain timeout), so Enode's retry of the
+    event is processed instead of dropped as a duplicate.
+    """
+    event_id = event.get("id")
+    try:
+        count = await _process_webhook_event(event)
+    except BaseException:
+        if event_id:
+            await webhook_idempotency.release(event_id)
+        raise
+    if event_id:
+        await webhook_idempotency.confirm_batch([event_id])
+    return count
+
+
+def _event_lane_key(event: dict) -> str | None:
+    """Vehicle id used to pick the processing lane (None for non-vehicle events)."""
+    vehicle = event.get("vehicle")
+    return vehicle.get("id") if isinstance(vehicle, dict) else None
+
+
+async def _claim_new_events(events: list[dict]) -> list[dict]:
+    """
+    Drops events whose Enode event id was already claimed (redeliveries and
+    retries, possibly handled by another worker). Events without an id are kept.
+    """
+    event_ids = list(dict.fromkeys(e["id"] for e in events if e.get("id")))
+    claims = dict(zip(event_ids, await webhook_idempotency.claim_batch(event_ids)))
+
+    fresh = []
+    for event in events:
+        event_id = event.get("id")
+        if event_id and not claims.pop(event_id, False):
+            logger.info("[⏭️ Idempotency] Skipping already processed event %s", event_id)
+            continue
+        fresh.append(event)
+    return fresh
+
+
+async def process_webhook_payload(incoming: dict | list) -> int:
+    """
+    Saves and processes a verified Enode webhook payload (single event or batch).
+    Runs inline for sync ingest, or on a worker from the webhook ingest queue.
+    Each event is executed in its vehicle's lane to keep per-vehicle ordering;
+    events for vehicles in different lanes run concurrently, so the lane count
+    (VEHICLE_LANE_COUNT) bounds a batch's concurrency.
+    Events already processed (by event id) are dropped before any storage call.
+    Returns the number of handled events.
+    """
+    fresh_events = await _claim_new_events(incoming if isinstance(incoming, list) else [incoming])
+    if not fresh_events:
+        logger.info("[⏭️ Idempotency] All events in delivery already processed")
+        return 0
+
+    save_webhook_event(incoming)
+
+    handled = 0
+
+    if isinstance(incoming, list):
+        # Pre-process batch to keep only the most recent event per vehicle
+        # This ensures we process the freshest data when Enode sends events out of order
+        deduped_events = _dedupe_batch_by_latest(fresh_events)
+
+        # Submit everything up front: lane submission is synchronous, so per-vehicle
+        # order follows batch order even though the events run concurrently
+        futures = []
+        submitted_ids = set()
+        for idx, event in enumerate(deduped_events):
+            if not _should_process_event(event):
+                continue  # Skip duplicate (cross-batch dedup)
+            logger.info("[📥 #%d/%d] Processing webhook event: %s", idx+1, len(deduped_events), event.get("event"))
+            submitted_ids.add(event.get("id"))
+            futures.append(vehicle_lanes.submit(_event_lane_key(event), _process_claimed_event, event))
+
+        # Events superseded in this batch or skipped are done with: keep their claims
+        await webhook_idempotency.confirm_batch(
+            [e["id"] for e in fresh_events if e.get("id") and e["id"] not in submitted_ids]
+        )
+
+        # Let every event finish before surfacing a failure, so one bad vehicle
+        # does not leave the others half-processed
+        results = await asyncio.gather(*futures, return_exceptions=True)
+        errors = [r for r in results if isinstance(r, BaseException)]
+        handled += sum(r for r in results if not isinstance(r, BaseException))
+        if errors:
+            logger.error("[❌ Webhook batch] %d of %d event(s) failed", len(errors), len(results))
+            raise errors[0]
+    else:
+        if _should_process_event(incoming):
+            logger.info("[📥 Single] Processing webhook event: %s", incoming.get("event"))
+            handled += await vehicle_lanes.run(_event_lane_key(incoming), _process_claimed_event, incoming)
+        elif incoming.get("id"):
+            await webhook_idempotency.confirm_batch([incoming["id"]])
+
+    logger.info("Handled total %d events", handled)
+    return handled
+
+
 @router.post("/webhook/enode")
 async def handle_webhook(
     request: Request,
@@ -519,55 +719,25 @@ async def handle_webhook(
             raise HTTPException(status_code=401, detail="Invalid signature")
 
         # Convert to JSON after verification
-        incoming  = json.loads(raw_body)
+        incoming  = orjson.loads(raw_body)
         logger.info("[Verified webhook from account %s] %s", matched_account_id, incoming)
 
         # Track webhook received
         track_webhook_received()
 
-        # Save and process
-        save_webhook_event(incoming)
-
-        handled = 0
-
-        if isinstance(incoming, list):
-            # Pre-process batch to keep only the most recent event per vehicle
-            # This ensures we process the freshest data when Enode sends events out of order
-            deduped_events = _dedupe_batch_by_latest(incoming)
-
-            for idx, event in enumerate(deduped_events):
-                if not _should_process_event(event):
-                    continue  # Skip duplicate (cross-batch dedup)
-                logger.info("[📥 #%d/%d] Processing webhook event: %s", idx+1, len(deduped_events), event.get("event"))
-                count, was_saved = await process_event(event)
-                handled += count
-                user_id = event.get('user', {}).get('id')
-                # Only push to HA if fresh data was saved (not stale)
-                # Fire-and-forget to respond to Enode within 5s timeout
-                if was_saved:
-                    asyncio.create_task(_safe_background_task(push_to_homeassistant(event, user_id), "HA push"))
-                    asyncio.create_task(_safe_background_task(send_pushover_notification(event, user_id), "Pushover"))
-                    asyncio.create_task(_safe_background_task(push_to_abrp(event, user_id), "ABRP"))
-                else:
-                    logger.info("[⏭️ Skip HA push] Stale data not pushed for user %s", user_id)
-        else:
-            if _should_process_event(incoming):
-                logger.info("[📥 Single] Processing webhook event: %s", incoming.get("event"))
-                count, was_saved = await process_event(incoming)
-                handled += count
-                user_id = incoming.get('user', {}).get('id')
-                # Only push to HA if fresh data was saved (not stale)
-                # Fire-and-forget to respond to Enode within 5s timeout
-                if was_saved:
-                    asyncio.create_task(_safe_background_task(push_to_homeassistant(incoming, user_id), "HA push"))
-                    asyncio.create_task(_safe_background_task(send_pushover_notification(incoming, user_id), "Pushover"))
-                    asyncio.create_task(_safe_background_task(push_to_abrp(incoming, user_id), "ABRP"))
-                else:
-                    logger.info("[⏭️ Skip HA push] Stale data not pushed for user %s", user_id)
+        # Queue mode: acknowledge right away and let the ingest workers do the DB work
+        if WEBHOOK_INGEST_MODE == "queue" and webhook_ingest_queue.is_running:
+            if not webhook_ingest_queue.submit(incoming):
+                # Backpressure – Enode retries failed deliveries
+                raise HTTPException(status_code=503, detail="Webhook queue full", headers={"Retry-After": "5"})
+            queued = len(incoming) if isinstance(incoming, list) else 1
+            return {"status": "ok", "queued": queued}
 
-        logger.info("Handled total %d events", handled)
+        handled = await process_webhook_payload(incoming)
         return {"status": "ok", "handled": handled}
 
+    except HTTPException:
+        raise
     except Exception as e:
         logging.exception("❌ Failed to handle webhook")
         raise HTTPException(status_code=400, detail=str(e))
@@ -59,6 +59,88 @@ PUSHOVER_API_TOKEN = os.getenv("PUSHOVER_API_TOKEN")
 # ABRP Configuration
 ABRP_API_KEY = os.getenv("ABRP_API_KEY")
 
+# Enode webhook ingest: "sync" processes batches inside the request,
+# "queue" verifies, enqueues and returns 200 immediately
+WEBHOOK_INGEST_MODE = os.getenv("WEBHOOK_INGEST_MODE", "sync").lower()
+# Safe above 1 because events for the same vehicle are serialised by the vehicle lanes
+WEBHOOK_INGEST_WORKERS = int(os.getenv("WEBHOOK_INGEST_WORKERS", 4))
+WEBHOOK_INGEST_MAX_QUEUE = int(os.getenv("WEBHOOK_INGEST_MAX_QUEUE", 500))
+
+# How long a processed Enode event id is remembered for idempotency (Redis SET NX EX)
+WEBHOOK_IDEMPOTENCY_TTL_SECONDS = int(os.getenv("WEBHOOK_IDEMPOTENCY_TTL_SECONDS", 86400))
+# How long a claim lasts while its event is still being processed: if the worker dies or restarts
+# before confirming it, Enode's redelivery is processed once this has passed
+WEBHOOK_IDEMPOTENCY_PROCESSING_TTL_SECONDS = int(os.getenv("WEBHOOK_IDEMPOTENCY_PROCESSING_TTL_SECONDS", 300))
+# Local record of claimed ids used while Redis is down: how long an id is kept and max ids kept
+# (size it for the event rate, e.g. 1k vehicles at 1 event/min is 60k ids per hour)
+WEBHOOK_IDEMPOTENCY_LOCAL_TTL_SECONDS = int(os.getenv("WEBHOOK_IDEMPOTENCY_LOCAL_TTL_SECONDS", 3600))
+WEBHOOK_IDEMPOTENCY_LOCAL_MAX_IDS = int(os.getenv("WEBHOOK_IDEMPOTENCY_LOCAL_MAX_IDS", 200000))
+
+# Batched webhook_logs writer: flush when BATCH_SIZE rows are buffered or every FLUSH_SECONDS.
+# When MAX_BUFFER rows are pending the oldest are dropped.
+WEBHOOK_LOG_BATCH_SIZE = int(os.getenv("WEBHOOK_LOG_BATCH_SIZE", 50))
+WEBHOOK_LOG_FLUSH_SECONDS = float(os.getenv("WEBHOOK_LOG_FLUSH_SECONDS", 2.0))
+WEBHOOK_LOG_MAX_BUFFER = int(os.getenv("WEBHOOK_LOG_MAX_BUFFER", 5000))
+
+# Batched poll_logs writer: flush when BATCH_SIZE rows are buffered or every FLUSH_SECONDS.
+# Rows are never dropped: failed batches are retried and a full buffer falls back to direct inserts.
+POLL_LOG_BATCH_SIZE = int(os.getenv("POLL_LOG_BATCH_SIZE", 200))
+POLL_LOG_FLUSH_SECONDS = float(os.getenv("POLL_LOG_FLUSH_SECONDS", 2.0))
+POLL_LOG_MAX_BUFFER = int(os.getenv("POLL_LOG_MAX_BUFFER", 20000))
+
+# Post-save fan-out (HA, Pushover, ABRP): workers and max pending jobs per sink
+FANOUT_SINK_WORKERS = int(os.getenv("FANOUT_SINK_WORKERS", 10))
+FANOUT_SINK_MAX_QUEUE = int(os.getenv("FANOUT_SINK_MAX_QUEUE", 1000))
+
+# Delta detection for vehicle updates: flattened paths (fnmatch patterns) that do not count
+# as a change, and the longest a no-op update may be skipped before a save is forced
+# (keep well below the 30 minute staleness threshold used by the poller)
+VEHICLE_DELTA_IGNORED_FIELDS = tuple(
+    f.strip() for f in os.getenv("VEHICLE_DELTA_IGNORED_FIELDS", "lastSeen,*.lastUpdated").split(",") if f.strip()
+)
+VEHICLE_DELTA_MAX_SKIP_SECONDS = int(os.getenv("VEHICLE_DELTA_MAX_SKIP_SECONDS", 600))
+
+# Country reverse-geocoding cache: geohash precision of a cache cell (6 ≈ 1.2 x 0.6 km),
+# max cached cells, and the file it is saved to on shutdown (empty = not persisted).
+# The /tmp default survives a restart of the container but not a redeploy; point it
+# at a mounted volume to keep the cache across deploys.
+GEOCODE_GEOHASH_PRECISION = int(os.getenv("GEOCODE_GEOHASH_PRECISION", 6))
+GEOCODE_CACHE_SIZE = int(os.getenv("GEOCODE_CACHE_SIZE", 50000))
+GEOCODE_CACHE_PATH = os.getenv("GEOCODE_CACHE_PATH", "/tmp/evconduit_geocode_cache.json")
+
+# Max vehicles kept in the in-process vehicle state registry (least recently used are evicted)
+VEHICLE_STATE_MAX_ENTRIES = int(os.getenv("VEHICLE_STATE_MAX_ENTRIES", 100000))
+# Registry snapshot written on shutdown and loaded on startup if younger than MAX_AGE
+# (empty path = always warm from the database)
+VEHICLE_STATE_SNAPSHOT_PATH = os.getenv("VEHICLE_STATE_SNAPSHOT_PATH", "/tmp/evconduit_vehicle_state.json")
+VEHICLE_STATE_SNAPSHOT_MAX_AGE_SECONDS = int(os.getenv("VEHICLE_STATE_SNAPSHOT_MAX_AGE_SECONDS", 900))
+
+# Rendered /api/ha/status documents: max cached vehicles, and how long a document may be
+# served before it is re-read (bounds staleness when another worker saved the vehicle)
+HA_STATUS_CACHE_SIZE = int(os.getenv("HA_STATUS_CACHE_SIZE", 20000))
+HA_STATUS_CACHE_TTL_SECONDS = int(os.getenv("HA_STATUS_CACHE_TTL_SECONDS", 120))
+
+# /api/ha/stream (Server-Sent Events): events kept per user for Last-Event-ID resume,
+# max frames queued for one stream before it is disconnected, open streams per user,
+# and the interval of heartbeat comments
+HA_STREAM_BUFFER_SIZE = int(os.getenv("HA_STREAM_BUFFER_SIZE", 100))
+HA_STREAM_QUEUE_SIZE = int(os.getenv("HA_STREAM_QUEUE_SIZE", 100))
+HA_STREAM_MAX_STREAMS_PER_USER = int(os.getenv("HA_STREAM_MAX_STREAMS_PER_USER", 5))
+HA_STREAM_HEARTBEAT_SECONDS = float(os.getenv("HA_STREAM_HEARTBEAT_SECONDS", 15))
+# How long a user's event buffer is kept after their last stream closed (resume window)
+HA_STREAM_RESUME_GRACE_SECONDS = int(os.getenv("HA_STREAM_RESUME_GRACE_SECONDS", 300))
+
+# API-key rate limits: poll counters kept in "memory" (per process) or "redis" (shared by workers),
+# rebuilt from poll_logs every REBUILD_SECONDS over a rolling WINDOW_DAYS window; tier data and
+# rate limit settings are cached for CACHE_TTL_SECONDS
+RATE_LIMIT_BACKEND = os.getenv("RATE_LIMIT_BACKEND", "memory").lower()
+RATE_LIMIT_REBUILD_SECONDS = int(os.getenv("RATE_LIMIT_REBUILD_SECONDS", 3600))
+RATE_LIMIT_WINDOW_DAYS = int(os.getenv("RATE_LIMIT_WINDOW_DAYS", 30))
+RATE_LIMIT_CACHE_TTL_SECONDS = int(os.getenv("RATE_LIMIT_CACHE_TTL_SECONDS", 300))
+
+# Per-vehicle ordered processing lanes (vehicle id is hashed to a lane)
+VEHICLE_LANE_COUNT = int(os.getenv("VEHICLE_LANE_COUNT", 16))
+
 ENDPOINT_COST = {
     "/api/ha/status/": 1,
     "/api/ha/charging/":1,
@@ -1,9 +1,17 @@
 import hmac
 import hashlib
 import logging
+import time
+from collections import OrderedDict
 
 logger = logging.getLogger(__name__)
 
+# Webhook secret registry: {account_id: webhook_secret}, most recently matched first
+_account_secrets: OrderedDict[str, str] = OrderedDict()
+_secrets_loaded_at: float | None = None
+# Minimum time between reloads triggered by unmatched signatures
+SECRETS_RELOAD_MIN_INTERVAL_SECONDS = 60.0
+
 
 def verify_signature_with_secret(payload: bytes, signature: str, secret: str) -> bool:
     """Verifies the HMAC-SHA1 signature of an incoming Enode webhook against a specific secret."""
@@ -18,21 +26,73 @@ def verify_signature_with_secret(payload: bytes, signature: str, secret: str) ->
     return hmac.compare_digest(expected_signature, signature)
 
 
-async def verify_signature_multi(payload: bytes, signature: str) -> str | None:
+async def refresh_account_secrets() -> int:
     """
-    Verifies the HMAC-SHA1 signature against all active Enode account secrets.
-    Returns the matched enode_account_id, or None if no match.
+    (Re)loads the webhook secrets of all active Enode accounts into the in-memory registry.
+    Accounts that were already known keep their position so the most recently
+    matched account is still tried first; deactivated accounts are dropped. If the
+    query fails the cached registry is kept. Returns the number of accounts loaded.
     """
     from app.storage.enode_account import get_all_active_accounts
 
+    global _secrets_loaded_at
+
     accounts = await get_all_active_accounts()
-    for account in accounts:
-        secret = account.get("webhook_secret")
-        if not secret:
-            continue
+
+    # Query failed – keep serving the known secrets (an empty list means every account was deactivated)
+    if accounts is None:
+        logger.warning("[verify] Could not load account secrets, keeping cached registry")
+        _secrets_loaded_at = time.monotonic()
+        return len(_account_secrets)
+
+    fresh = {a["id"]: a["webhook_secret"] for a in accounts if a.get("webhook_secret")}
+
+    registry: OrderedDict[str, str] = OrderedDict()
+    for account_id in _account_secrets:
+        if account_id in fresh:
+            registry[account_id] = fresh.pop(account_id)
+    registry.update(fresh)
+
+    _account_secrets.clear()
+    _account_secrets.update(registry)
+    _secrets_loaded_at = time.monotonic()
+    logger.info(f"[verify] Loaded webhook secrets for {len(_account_secrets)} active account(s)")
+    return len(_account_secrets)
+
+
+def _match_cached_secret(payload: bytes, signature: str) -> str | None:
+    """Tries cached secrets in most-recently-matched order and promotes the match."""
+    for account_id, secret in _account_secrets.items():
         if verify_signature_with_secret(payload, signature, secret):
-            logger.info(f"[verify] Webhook signature matched account {account['id']}")
-            return account["id"]
+            _account_secrets.move_to_end(account_id, last=False)
+            return account_id
+    return None
+
+
+async def verify_signature_multi(payload: bytes, signature: str) -> str | None:
+    """
+    Verifies the HMAC-SHA1 signature against all active Enode account secrets.
+    Secrets come from the in-memory registry; on a miss the registry is reloaded
+    (at most once per SECRETS_RELOAD_MIN_INTERVAL_SECONDS) in case an account was
+    changed by another worker.
+    Returns the matched enode_account_id, or None if no match.
+    """
+    if not signature:
+        logger.warning("[verify] Webhook received without signature")
+        return None
+
+    if _secrets_loaded_at is None:
+        await refresh_account_secrets()
+
+    account_id = _match_cached_secret(payload, signature)
+
+    if not account_id and time.monotonic() - (_secrets_loaded_at or 0.0) >= SECRETS_RELOAD_MIN_INTERVAL_SECONDS:
+        await refresh_account_secrets()
+        account_id = _match_cached_secret(payload, signature)
+
+    if account_id:
+        logger.info(f"[verify] Webhook signature matched account {account_id}")
+        return account_id
 
     logger.warning("[verify] Webhook signature did not match any active account")
     return None
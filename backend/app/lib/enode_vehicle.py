@@ -0,0 +1,85 @@
+"""
+Typed view of an Enode vehicle object.
+
+A webhook event's vehicle is decoded once into an EnodeVehicle, and the
+result is handed to every stage of the pipeline (charging sample,
+notification state, Pushover, ABRP, Home Assistant) instead of each stage
+walking the raw dict again. Values are taken as-is from the payload (no coercion), so stages
+see exactly what they saw before. The original dict stays available as raw
+for passthrough (vehicle_cache, HA payloads).
+"""
+from dataclasses import dataclass
+
+
+@dataclass(slots=True)
+class EnodeVehicle:
+    id: str | None
+    raw: dict
+    last_seen: str | None = None
+    vendor: str | None = None
+    is_reachable: bool | None = None
+    # information
+    vin: str | None = None
+    brand: str | None = None
+    model: str | None = None
+    year: int | None = None
+    display_name: str | None = None
+    # chargeState (has_charge_state is False when it was missing or empty)
+    has_charge_state: bool = False
+    battery_level: float | None = None
+    is_charging: bool | None = None
+    is_fully_charged: bool | None = None
+    is_plugged_in: bool | None = None
+    charge_rate: float | None = None
+    charge_limit: float | None = None
+    charge_time_remaining: float | None = None
+    battery_capacity: float | None = None
+    range_km: float | None = None
+    power_delivery_state: str | None = None
+    # location
+    has_location: bool = False
+    latitude: float | None = None
+    longitude: float | None = None
+    # odometer
+    odometer_km: float | None = None
+
+    @property
+    def name(self) -> str:
+        """displayName, else "brand model" (empty string if neither is known)."""
+        return self.display_name or f"{self.brand or ''} {self.model or ''}".strip()
+
+
+def decode_enode_vehicle(vehicle: dict) -> EnodeVehicle:
+    """Extracts the fields the webhook pipeline reads from an Enode vehicle dict."""
+    info = vehicle.get("information") or {}
+    charge = vehicle.get("chargeState") or {}
+    location = vehicle.get("location") or {}
+    odometer = vehicle.get("odometer")
+    return EnodeVehicle(
+        id=vehicle.get("id") or vehicle.get("vehicle_id"),
+        raw=vehicle,
+        last_seen=vehicle.get("lastSeen"),
+        vendor=vehicle.get("vendor"),
+        is_reachable=vehicle.get("isReachable"),
+        vin=info.get("vin"),
+        brand=info.get("brand"),
+        model=info.get("model"),
+        year=info.get("year"),
+        display_name=info.get("displayName"),
+        has_charge_state=bool(charge),
+        battery_level=charge.get("batteryLevel"),
+        is_charging=charge.get("isCharging"),
+        is_fully_charged=charge.get("isFullyCharged"),
+        is_plugged_in=charge.get("isPluggedIn"),
+        charge_rate=charge.get("chargeRate"),
+        charge_limit=charge.get("chargeLimit"),
+        charge_time_remaining=charge.get("chargeTimeRemaining"),
+        battery_capacity=charge.get("batteryCapacity"),
+        range_km=charge.get("range"),
+        power_delivery_state=charge.get("powerDeliveryState"),
+        has_location=bool(location),
+        latitude=location.get("latitude"),
+        longitude=location.get("longitude"),
+        odometer_km=odometer.get("distance") if isinstance(odometer, dict) else None,
+    )
+
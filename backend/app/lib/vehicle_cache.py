@@ -0,0 +1,58 @@
+"""
+vehicles.vehicle_cache helpers.
+
+vehicle_cache is a JSONB column: writers pass the vehicle dict as-is and
+PostgREST returns it as a dict. Rows written before the migration held a
+JSON-encoded string inside the JSONB value; load_vehicle_cache() decodes
+those too, so readers keep working until the backfill in
+supabase/sql_definitions/vehicle_cache_jsonb.sql has run.
+
+hot_columns() derives the typed columns that mirror the most read fields.
+"""
+import json
+from typing import Any
+
+
+def load_vehicle_cache(value: Any) -> dict:
+    """Returns a vehicle_cache value as a dict ({} if missing or undecodable)."""
+    if isinstance(value, dict):
+        return value
+    if isinstance(value, (str, bytes)) and value:
+        try:
+            decoded = json.loads(value)
+        except (json.JSONDecodeError, TypeError, ValueError):
+            return {}
+        return decoded if isinstance(decoded, dict) else {}
+    return {}
+
+
+def _as_float(value: Any) -> float | None:
+    if isinstance(value, bool):
+        return None
+    try:
+        return float(value) if value is not None else None
+    except (TypeError, ValueError):
+        return None
+
+
+def hot_columns(vehicle: dict) -> dict:
+    """
+    Typed copies of the frequently read vehicle_cache fields, for the
+    battery_level, is_charging, latitude, longitude, odometer_km, brand and
+    model columns (supabase/sql_definitions/vehicle_hot_columns.sql).
+    Written together with vehicle_cache so the two never disagree.
+    """
+    charge = vehicle.get("chargeState") or {}
+    location = vehicle.get("location") or {}
+    odometer = vehicle.get("odometer") or {}
+    info = vehicle.get("information") or {}
+    is_charging = charge.get("isCharging")
+    return {
+        "battery_level": _as_float(charge.get("batteryLevel")),
+        "is_charging": is_charging if isinstance(is_charging, bool) else None,
+        "latitude": _as_float(location.get("latitude")),
+        "longitude": _as_float(location.get("longitude")),
+        "odometer_km": _as_float(odometer.get("distance") if isinstance(odometer, dict) else odometer),
+        "brand": info.get("brand") or None,
+        "model": info.get("model") or None,
+    }
@@ -0,0 +1,116 @@
+"""
+Vehicle delta detection.
+
+Compares an incoming Enode vehicle object with the last one saved for the
+same vehicle and classifies the update:
+
+- noop:      nothing but ignored fields (lastSeen, *.lastUpdated) changed
+- telemetry: measurements changed (battery level, range, location, odometer...)
+- state:     a state field changed (reachability, charging/plugged-in state,
+             charge settings, vehicle information) or the vehicle is unknown
+
+Downstream stages are gated on the class: no-ops skip the DB write and all
+fan-outs, telemetry skips state-change notifications (Pushover).
+
+The last saved copy lives on the vehicle's VehicleState record, so it is
+bounded, evicted and forgotten (forget_vehicle_state) with the rest of the
+registry; an unknown vehicle's next update counts as a state change.
+"""
+import logging
+import time
+from fnmatch import fnmatchcase
+from typing import Any
+
+from app.config import VEHICLE_DELTA_IGNORED_FIELDS, VEHICLE_DELTA_MAX_SKIP_SECONDS
+from app.storage.vehicle_state import get_vehicle_state, vehicle_state_entry
+
+logger = logging.getLogger(__name__)
+
+DELTA_NOOP = "noop"
+DELTA_TELEMETRY = "telemetry"
+DELTA_STATE = "state"
+
+# Flattened paths (or prefixes) whose change is a state change; everything else is telemetry
+STATE_FIELDS = (
+    "isReachable",
+    "chargeState.isCharging",
+    "chargeState.isPluggedIn",
+    "chargeState.isFullyCharged",
+    "chargeState.powerDeliveryState",
+    "chargeState.chargeLimit",
+    "chargeState.maxCurrent",
+    "smartChargingPolicy",
+    "information",
+    "capabilities",
+    "userId",
+    "vendor",
+)
+
+
+def flatten_vehicle(obj: Any, prefix: str = "") -> dict[str, Any]:
+    """Flattens nested dicts into {"a.b.c": value}. Lists are compared as whole values."""
+    if not isinstance(obj, dict):
+        return {prefix: obj}
+    flat: dict[str, Any] = {}
+    for key, value in obj.items():
+        path = f"{prefix}.{key}" if prefix else str(key)
+        if isinstance(value, dict) and value:
+            flat.update(flatten_vehicle(value, path))
+        else:
+            flat[path] = value
+    return flat
+
+
+def _is_ignored(path: str, ignored: tuple[str, ...]) -> bool:
+    return any(fnmatchcase(path, pattern) for pattern in ignored)
+
+
+def _is_state_field(path: str) -> bool:
+    return any(path == field or path.startswith(field + ".") for field in STATE_FIELDS)
+
+
+def diff_vehicle(
+    old: dict[str, Any],
+    new: dict[str, Any],
+    ignored: tuple[str, ...] = VEHICLE_DELTA_IGNORED_FIELDS,
+) -> list[str]:
+    """Returns the flattened paths that differ between two flattened vehicles, minus ignored fields."""
+    return [
+        path
+        for path in old.keys() | new.keys()
+        if old.get(path) != new.get(path) and not _is_ignored(path, ignored)
+    ]
+
+
+def classify_vehicle_update(vehicle: dict, ignored: tuple[str, ...] = VEHICLE_DELTA_IGNORED_FIELDS) -> str:
+    """
+    Classifies an incoming vehicle against the last saved copy.
+    A no-op is promoted to telemetry once VEHICLE_DELTA_MAX_SKIP_SECONDS have passed
+    since the last save, so updated_at keeps moving and the vehicle is not
+    treated as stale by the poller.
+    """
+    vehicle_id = vehicle.get("id")
+    state = get_vehicle_state(vehicle_id) if vehicle_id else None
+    if state is None or state.delta_fields is None:
+        return DELTA_STATE
+
+    changed = diff_vehicle(state.delta_fields, flatten_vehicle(vehicle), ignored)
+
+    if any(_is_state_field(path) for path in changed):
+        return DELTA_STATE
+    if changed:
+        return DELTA_TELEMETRY
+    if time.monotonic() - state.delta_saved_at >= VEHICLE_DELTA_MAX_SKIP_SECONDS:
+        logger.debug(f"[Δ delta] Vehicle {vehicle_id}: no changes, forcing refresh save")
+        return DELTA_TELEMETRY
+    return DELTA_NOOP
+
+
+def remember_vehicle(vehicle: dict) -> None:
+    """Records the vehicle as the last saved copy (call after a successful save)."""
+    vehicle_id = vehicle.get("id")
+    if vehicle_id:
+        state = vehicle_state_entry(vehicle_id)
+        state.delta_fields = flatten_vehicle(vehicle)
+        state.delta_saved_at = time.monotonic()
+
@@ -1,20 +1,33 @@
 import logging
+from app.lib.enode_vehicle import EnodeVehicle, decode_enode_vehicle
 from app.storage.vehicle import save_vehicle_data_with_client
 from app.storage.charging import save_charging_sample, check_and_create_charging_session
+from app.lib.vehicle_delta import DELTA_NOOP, DELTA_STATE, classify_vehicle_update
 
 logger = logging.getLogger(__name__)
 
-async def process_event(event: dict) -> tuple[int, bool]:
+async def process_event(
+    event: dict,
+    detect_changes: bool = False,
+    decoded: EnodeVehicle | None = None,
+) -> tuple[int, bool, str]:
     """
     Processes an incoming webhook event and dispatches it to appropriate handlers.
-    Returns (count, was_saved) where was_saved indicates if fresh data was saved (not stale).
+    Returns (count, was_saved, delta) where was_saved indicates if fresh data was saved
+    (not stale) and delta is "noop", "telemetry" or "state".
+
+    With detect_changes=True the vehicle is first compared with the last saved copy
+    (see app.lib.vehicle_delta) and no-op updates are not saved; without it every
+    update is saved and reported as a state change.
+
+    decoded is the event's vehicle as decoded by the caller (decoded here if not passed).
     """
     event_type = event.get("event")
     logger.info(f"[🔔 WEBHOOK] Event: {event_type}")
 
     if event_type == "system:heartbeat":
         logger.info("💓 Heartbeat received")
-        return (1, True)
+        return 1, True, DELTA_STATE
 
     if event_type in ["user:vehicle:discovered", "user:vehicle:updated"]:
         vehicle = event.get("vehicle")
@@ -24,33 +37,40 @@ async def process_event(event: dict) -> tuple[int, bool]:
 
         if vehicle and user_id:
             vehicle["userId"] = user_id
-            vehicle_id = vehicle.get("id")
+            if decoded is None:
+                decoded = decode_enode_vehicle(vehicle)
+            vehicle_id = decoded.id
 
             # Log location data presence for debugging
-            location = vehicle.get("location")
-            if location:
-                logger.info(f"[📍 Location data] Vehicle {vehicle_id}: lat={location.get('latitude')}, lon={location.get('longitude')}")
+            if decoded.has_location:
+                logger.info(f"[📍 Location data] Vehicle {vehicle_id}: lat={decoded.latitude}, lon={decoded.longitude}")
             else:
                 logger.warning(f"[⚠️ No location] Vehicle {vehicle_id} has no location data in webhook event")
 
+            delta = DELTA_STATE
+            if detect_changes:
+                delta = classify_vehicle_update(vehicle)
+                if delta == DELTA_NOOP:
+                    logger.info(f"[⏭️ No changes] Vehicle {vehicle_id}: only ignored fields changed, skipping save")
+                    return 1, False, delta
+
             # Save vehicle cache (returns False if skipped due to stale data)
-            logger.info(f"[🚗 Saving vehicle] Vehicle ID: {vehicle_id} User ID: {user_id}")
+            logger.info(f"[🚗 Saving vehicle] Vehicle ID: {vehicle_id} User ID: {user_id} ({delta})")
             was_saved = await save_vehicle_data_with_client(vehicle)
 
             # Save charging sample for insights (only if data was fresh)
             if was_saved:
-                charge_state = vehicle.get("chargeState", {})
-                if charge_state:
-                    logger.info(f"[🔋 Charging data] Vehicle {vehicle_id}: charging={charge_state.get('isCharging')}, battery={charge_state.get('batteryLevel')}%")
-                    sample_id = await save_charging_sample(vehicle, user_id, event_id)
+                if decoded.has_charge_state:
+                    logger.info(f"[🔋 Charging data] Vehicle {vehicle_id}: charging={decoded.is_charging}, battery={decoded.battery_level}%")
+                    sample_id = await save_charging_sample(vehicle, user_id, event_id, decoded=decoded)
                     if sample_id:
                         # Check if a charging session should be created/finalized
                         await check_and_create_charging_session(vehicle_id, user_id)
 
-            return (1, was_saved)
+            return 1, was_saved, delta
         else:
             logger.warning(f"[⚠️ Missing data] vehicle or user_id missing in event: {event}")
-            return (0, False)
+            return 0, False, DELTA_STATE
 
     logger.warning(f"[⚠️ Unhandled event] type: {event_type}")
-    return (0, False)
\ No newline at end of file
+    return 0, False, DELTA_STATE
\ No newline at end of file
@@ -19,14 +19,31 @@ from fastapi.security import HTTPAuthorizationCredentials
 from app.api import charging, ha, me, news, newsletter, payments, private, public, user_updates, webhook
 from app.api.phone_verification import router as phone_router
 from app.api.admin import routers as admin_routers
-from app.config import ENDPOINT_COST, IS_PROD, SENTRY_DSN
+from app.config import ENDPOINT_COST, IS_PROD, SENTRY_DSN, WEBHOOK_INGEST_MODE
 from app.dependencies.auth import get_current_user
+from app.enode.verify import refresh_account_secrets
 from app.logger import logger
 from app.storage.telemetry import log_api_telemetry
 from app.services.webhook_scheduler import webhook_scheduler
 from app.services.vehicle_polling import vehicle_polling_scheduler
 from app.services.inactive_user_cleanup import inactive_user_cleanup_scheduler
 from app.services.abrp_pull_scheduler import abrp_pull_scheduler
+from app.services.webhook_ingest import webhook_ingest_queue
+from app.services.vehicle_lanes import vehicle_lanes
+from app.services.fanout import fanout_dispatcher
+from app.storage.webhook import webhook_log_writer
+from app.storage.poll_logs import poll_log_writer
+from app.storage.vehicle_state import (
+    is_warm,
+    load_vehicle_state_snapshot,
+    reconcile_vehicle_state_snapshot,
+    save_vehicle_state_snapshot,
+    warm_vehicle_state_store,
+)
+from app.storage.vehicle_pairing import warm_vehicle_pairings
+from app.services.geocoding import country_geocoder
+from app.services.ha_stream import close_streams_on_server_exit, ha_stream_broker
+from app.services.rate_limiter import poll_rate_limiter
 from app.services.metrics import track_api_request
 
 # Initialize Sentry
@@ -44,6 +61,53 @@ logger.info("🚀 Starting EVLink Backend...")
 async def lifespan(app: FastAPI):
     """Manage application lifespan - startup and shutdown events."""
     # Startup
+    logger.info("🔄 Loading Enode webhook secrets...")
+    await refresh_account_secrets()
+    logger.info("✅ Enode webhook secrets loaded")
+
+    logger.info("🔄 Restoring vehicle state registry...")
+    if load_vehicle_state_snapshot() and is_warm() and await reconcile_vehicle_state_snapshot():
+        logger.info("✅ Vehicle state registry restored from snapshot")
+    else:
+        await warm_vehicle_state_store()
+        logger.info("✅ Vehicle state registry warmed from database")
+
+    logger.info("🔄 Loading geocoding cache...")
+    await asyncio.to_thread(country_geocoder.load)
+    # Build the KD-tree in the background: startup does not wait for it
+    geocoder_load_task = asyncio.create_task(asyncio.to_thread(country_geocoder.load_geocoder))
+    logger.info("✅ Geocoding cache loaded")
+
+    logger.info("🔄 Loading vehicle pairings...")
+    await warm_vehicle_pairings()
+    logger.info("✅ Vehicle pairings loaded")
+
+    logger.info("🔄 Seeding poll rate limiter...")
+    await poll_rate_limiter.start()
+    logger.info("✅ Poll rate limiter started")
+
+    logger.info("🔄 Starting webhook log writer...")
+    await webhook_log_writer.start()
+    logger.info("✅ Webhook log writer started")
+
+    logger.info("🔄 Starting poll log writer...")
+    await poll_log_writer.start()
+    logger.info("✅ Poll log writer started")
+
+    logger.info("🔄 Starting fan-out dispatcher...")
+    await fanout_dispatcher.start()
+    logger.info("✅ Fan-out dispatcher started")
+
+    logger.info("🔄 Starting vehicle processing lanes...")
+    await vehicle_lanes.start()
+    logger.info("✅ Vehicle processing lanes started")
+
+    if WEBHOOK_INGEST_MODE == "queue":
+        logger.info("🔄 Starting webhook ingest queue...")
+        await webhook_ingest_queue.start()
+        logger.info("✅ Webhook ingest queue started")
+
+    # Schedulers save vehicles through the lanes and push through the fan-out, so they start last
     logger.info("🔄 Starting webhook health scheduler...")
     await webhook_scheduler.start()
     logger.info("✅ Webhook health scheduler started")
@@ -60,9 +124,18 @@ async def lifespan(app: FastAPI):
     await abrp_pull_scheduler.start()
     logger.info("✅ ABRP pull scheduler started")
 
+    # Open streams must end when uvicorn starts exiting: it waits for them before this shutdown runs
+    if close_streams_on_server_exit():
+        logger.info("✅ HA event streams close on server exit")
+
     yield
 
-    # Shutdown
+    # Shutdown (streams were normally ended by the exit handler already)
+    logger.info("🛑 Closing HA event streams...")
+    ha_stream_broker.close_all()
+    logger.info("✅ HA event streams closed")
+
+    # Producers first: nothing may submit to the lanes or the fan-out once they are draining
     logger.info("🛑 Stopping ABRP pull scheduler...")
     await abrp_pull_scheduler.stop()
     logger.info("✅ ABRP pull scheduler stopped")
@@ -79,6 +152,39 @@ async def lifespan(app: FastAPI):
     await webhook_scheduler.stop()
     logger.info("✅ Webhook health scheduler stopped")
 
+    if webhook_ingest_queue.is_running:
+        logger.info("🛑 Draining webhook ingest queue...")
+        await webhook_ingest_queue.stop()
+        logger.info("✅ Webhook ingest queue stopped")
+
+    logger.info("🛑 Stopping vehicle processing lanes...")
+    await vehicle_lanes.stop()
+    logger.info("✅ Vehicle processing lanes stopped")
+
+    logger.info("🛑 Draining fan-out dispatcher...")
+    await fanout_dispatcher.stop()
+    logger.info("✅ Fan-out dispatcher stopped")
+
+    logger.info("🛑 Flushing webhook log writer...")
+    await webhook_log_writer.stop()
+    logger.info("✅ Webhook log writer stopped")
+
+    logger.info("🛑 Flushing poll log writer...")
+    await poll_log_writer.stop()
+    logger.info("✅ Poll log writer stopped")
+
+    logger.info("🛑 Stopping poll rate limiter...")
+    await poll_rate_limiter.stop()
+    logger.info("✅ Poll rate limiter stopped")
+
+    logger.info("🛑 Saving vehicle state snapshot...")
+    save_vehicle_state_snapshot()
+    logger.info("✅ Vehicle state snapshot saved")
+
+    logger.info("🛑 Saving geocoding cache...")
+    country_geocoder.save()
+    logger.info("✅ Geocoding cache saved")
+
 
 app = FastAPI(
     title="EVLink Backend",
@@ -151,21 +257,23 @@ async def telemetry_middleware(request: Request, call_next):
         status = response.status_code
 
         # Start by collecting all parts from response.body_iterator
+        # (not for event streams: they only end when the client disconnects)
         body_chunks: list[bytes] = []
-        try:
-            # NOTE: body_iterator can be an async iterator
-            async for chunk in response.body_iterator:
-                body_chunks.append(chunk)
-        except Exception:
-            # If it fails, ignore the response payload
-            body_chunks = []
+        if not response.headers.get("content-type", "").startswith("text/event-stream"):
+            try:
+                # NOTE: body_iterator can be an async iterator
+                async for chunk in response.body_iterator:
+                    body_chunks.append(chunk)
+            except Exception:
+                # If it fails, ignore the response payload
+                body_chunks = []
 
-        # Set the iterator back as an async generator
-        async def _replay_body() -> AsyncIterator[bytes]:
-            for chunk in body_chunks:
-                yield chunk
+            # Set the iterator back as an async generator
+            async def _replay_body() -> AsyncIterator[bytes]:
+                for chunk in body_chunks:
+                    yield chunk
 
-        response.body_iterator = _replay_body()
+            response.body_iterator = _replay_body()
 
         # Calculate size + payload
         response_payload = None
@@ -178,9 +286,9 @@ async def telemetry_middleware(request: Request, call_next):
             except:
                 response_payload = None
 
-        # Cost
-        cost_tokens = 0
-        if user_id:
+        # Cost (endpoints that charge per item, like the HA status batch, set it themselves)
+        cost_tokens = getattr(request.state, "cost_tokens", 0)
+        if user_id and not cost_tokens:
             for prefix, cost in ENDPOINT_COST.items():
                 if path.startswith(prefix):
                     cost_tokens = cost
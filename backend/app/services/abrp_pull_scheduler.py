@@ -17,6 +17,7 @@ from app.services.abrp_pull_service import get_abrp_pull_service
 from app.storage.vehicle import save_abrp_vehicle, get_internal_vehicle_id
 from app.storage.charging import save_charging_sample, check_and_create_charging_session
 from app.storage.user import update_abrp_pull_stats, disable_abrp_pull, get_user_by_id, get_ha_webhook_settings, update_ha_push_stats
+from app.storage.vehicle_pairing import get_vehicle_pairing
 
 logger = logging.getLogger(__name__)
 
@@ -122,7 +123,7 @@ async def pull_abrp_for_user(user: dict) -> int:
             if saved:
                 saved_count += 1
                 # Save charging sample for Insights (skip if Enode handles this car)
-                if not has_enode_vehicles or not _abrp_vehicle_has_enode_counterpart(vehicle_cache, user_id):
+                if not has_enode_vehicles or not _abrp_vehicle_has_enode_counterpart(vehicle_cache, user_id, vid):
                     internal_id = await get_internal_vehicle_id(user_id, vid)
                     if internal_id:
                         vehicle_cache["id"] = internal_id
@@ -156,8 +157,10 @@ async def _user_has_enode_vehicles(user_id: str) -> bool:
         return False
 
 
-def _abrp_vehicle_has_enode_counterpart(vehicle_cache: dict, user_id: str) -> bool:
+def _abrp_vehicle_has_enode_counterpart(vehicle_cache: dict, user_id: str, abrp_vehicle_id: str) -> bool:
     """Check if this ABRP vehicle has a matching Enode vehicle (same user + brand)."""
+    if get_vehicle_pairing(abrp_vehicle_id):
+        return True
     brand = (vehicle_cache.get("information", {}).get("brand") or vehicle_cache.get("vendor") or "").upper()
     if not brand:
         return False
@@ -0,0 +1,162 @@
+"""
+Country Code Backfill
+
+Fills vehicles.country_code for vehicles that have coordinates but no
+country yet, so the insights endpoints only ever count stored codes.
+
+Vehicles are paged by id (keyset), each page is geocoded in one batch and
+written back with one UPDATE per country. Rows that are filled in drop out of
+the filter, so an interrupted run simply continues where it stopped when
+started again; after_id skips ahead explicitly.
+
+Usage (CLI):
+    python -m app.services.country_backfill --page-size 500
+"""
+import argparse
+import asyncio
+import logging
+import time
+from collections import defaultdict
+from datetime import datetime, timezone
+from typing import Any
+
+from app.lib.supabase import get_supabase_admin_client
+from app.services.geocoding import country_geocoder
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PAGE_SIZE = 500
+
+# Status of the backfill started from the admin API or insights (one at a time per process)
+_backfill_status: dict[str, Any] = {"running": False}
+_backfill_task: asyncio.Task | None = None
+
+
+def _fetch_page(after_id: str | None, page_size: int) -> list[dict]:
+    """One keyset page of vehicles with coordinates and no country_code, ordered by id."""
+    supabase = get_supabase_admin_client()
+    query = supabase.table("vehicles") \
+        .select("id, latitude, longitude") \
+        .is_("country_code", "null") \
+        .not_.is_("latitude", "null") \
+        .not_.is_("longitude", "null") \
+        .order("id") \
+        .limit(page_size)
+    if after_id:
+        query = query.gt("id", after_id)
+    return query.execute().data or []
+
+
+def _write_country(country_code: str, ids: list[str]) -> int:
+    """Sets country_code on all ids that still have none. Returns the number of rows updated."""
+    supabase = get_supabase_admin_client()
+    res = supabase.table("vehicles") \
+        .update({"country_code": country_code}) \
+        .in_("id", ids) \
+        .is_("country_code", "null") \
+        .execute()
+    return len(res.data or [])
+
+
+async def backfill_country_codes(
+    page_size: int = DEFAULT_PAGE_SIZE,
+    after_id: str | None = None,
+    status: dict[str, Any] | None = None,
+) -> dict[str, Any]:
+    """
+    Geocodes and stores country_code for every vehicle missing one.
+
+    Args:
+        page_size: vehicles per page (one geocode batch)
+        after_id: only process vehicles with a larger id (resume point)
+        status: optional dict updated in place with progress
+    """
+    status = status if status is not None else {}
+    status.update({
+        "running": True,
+        "started_at": datetime.now(timezone.utc).isoformat(),
+        "pages": 0,
+        "scanned": 0,
+        "updated": 0,
+        "unresolved": 0,
+        "last_id": after_id,
+    })
+    start = time.perf_counter()
+
+    while True:
+        page = await asyncio.to_thread(_fetch_page, status["last_id"], page_size)
+        if not page:
+            break
+
+        coords = [(row["latitude"], row["longitude"]) for row in page]
+        results = await asyncio.to_thread(country_geocoder.lookup_many, coords)
+
+        ids_by_country: dict[str, list[str]] = defaultdict(list)
+        for row, result in zip(page, results):
+            if result:
+                ids_by_country[result[0]].append(row["id"])
+            else:
+                status["unresolved"] += 1
+
+        for country_code, ids in ids_by_country.items():
+            status["updated"] += await asyncio.to_thread(_write_country, country_code, ids)
+
+        status["pages"] += 1
+        status["scanned"] += len(page)
+        status["last_id"] = page[-1]["id"]
+        status["elapsed_seconds"] = round(time.perf_counter() - start, 2)
+
+        if len(page) < page_size:
+            break
+
+    status.update({
+        "running": False,
+        "finished_at": datetime.now(timezone.utc).isoformat(),
+        "elapsed_seconds": round(time.perf_counter() - start, 2),
+    })
+    logger.info(
+        f"[CountryBackfill] {status['updated']} vehicle(s) updated, {status['unresolved']} unresolved, "
+        f"{status['scanned']} scanned in {status['elapsed_seconds']}s"
+    )
+    return status
+
+
+def start_country_backfill(**kwargs) -> bool:
+    """Start a backfill in the background. Returns False if one is already running."""
+    global _backfill_task, _backfill_status
+
+    if _backfill_task and not _backfill_task.done():
+        return False
+
+    _backfill_status = {"running": True}
+
+    async def _run():
+        try:
+            await backfill_country_codes(status=_backfill_status, **kwargs)
+        except Exception as e:
+            logger.error(f"[CountryBackfill] Failed: {e}", exc_info=True)
+            _backfill_status.update({"running": False, "error": str(e)})
+
+    _backfill_task = asyncio.create_task(_run())
+    return True
+
+
+def get_country_backfill_status() -> dict[str, Any]:
+    """Progress or result of the last backfill started in this process."""
+    return dict(_backfill_status)
+
+
+def _main():
+    parser = argparse.ArgumentParser(description="Fill vehicles.country_code from vehicle coordinates")
+    parser.add_argument("--page-size", type=int, default=DEFAULT_PAGE_SIZE)
+    parser.add_argument("--after-id", help="resume after this vehicle id")
+    args = parser.parse_args()
+
+    result = asyncio.run(backfill_country_codes(page_size=args.page_size, after_id=args.after_id))
+    country_geocoder.save()
+    print(result)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    _main()
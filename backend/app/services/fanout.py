@@ -0,0 +1,149 @@
+"""
+Fan-out Dispatcher
+
+Runs post-save side effects (Home Assistant push, Pushover, ABRP) on a
+bounded worker pool per sink instead of one unbounded task per event.
+Each sink has its own queue limit: when a sink falls behind, its oldest
+pending job is dropped, so a slow sink cannot grow memory without limit
+or delay the other sinks.
+"""
+import asyncio
+import logging
+import time
+from typing import Any, Awaitable, Callable
+
+from app.config import FANOUT_SINK_MAX_QUEUE, FANOUT_SINK_WORKERS
+from app.services.metrics import track_sink_drop, track_sink_job
+
+logger = logging.getLogger(__name__)
+
+SINK_HA = "ha"
+SINK_PUSHOVER = "pushover"
+SINK_ABRP = "abrp"
+
+# How long shutdown waits for pending side effects before cancelling them
+DEFAULT_DRAIN_TIMEOUT_SECONDS = 10.0
+
+
+class FanoutDispatcher:
+    """Per-sink bounded queues, each drained by its own pool of workers."""
+
+    def __init__(
+        self,
+        sinks: tuple[str, ...] = (SINK_HA, SINK_PUSHOVER, SINK_ABRP),
+        workers: int = FANOUT_SINK_WORKERS,
+        max_queue: int = FANOUT_SINK_MAX_QUEUE,
+        drain_timeout: float = DEFAULT_DRAIN_TIMEOUT_SECONDS,
+    ):
+        self.sinks = sinks
+        self.workers = max(1, workers)
+        self.max_queue = max(1, max_queue)
+        self.drain_timeout = drain_timeout
+        self._queues: dict[str, asyncio.Queue] = {}
+        self._tasks: list[asyncio.Task] = []
+        self._running = False
+
+    @property
+    def is_running(self) -> bool:
+        return self._running
+
+    async def start(self):
+        """Create the sink queues and start their workers."""
+        if self._running:
+            logger.warning("[Fanout] Already running, skipping start")
+            return
+
+        self._queues = {sink: asyncio.Queue(maxsize=self.max_queue) for sink in self.sinks}
+        self._tasks = [
+            asyncio.create_task(self._worker_loop(sink))
+            for sink in self.sinks
+            for _ in range(self.workers)
+        ]
+        self._running = True
+        logger.info(f"[Fanout] Started {self.workers} worker(s) per sink for {', '.join(self.sinks)}")
+
+    async def stop(self):
+        """Finish pending jobs (bounded by drain_timeout), then stop the workers."""
+        if not self._running:
+            return
+        self._running = False
+
+        try:
+            await asyncio.wait_for(
+                asyncio.gather(*(q.join() for q in self._queues.values())),
+                timeout=self.drain_timeout,
+            )
+        except asyncio.TimeoutError:
+            pending = sum(q.qsize() for q in self._queues.values())
+            logger.error(f"[Fanout] Drain timed out after {self.drain_timeout}s, {pending} job(s) dropped")
+
+        for task in self._tasks:
+            task.cancel()
+        for task in self._tasks:
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+        self._tasks = []
+        logger.info("[Fanout] Stopped")
+
+    def dispatch(self, sink: str, fn: Callable[..., Awaitable[Any]], *args) -> bool:
+        """
+        Queue fn(*args) on a sink without waiting. If the sink's queue is full the
+        oldest pending job is dropped to make room. When the dispatcher is not
+        running the job runs as a plain background task.
+        Returns False if a job had to be dropped.
+        """
+        if not self._running:
+            from app.api.webhook import _safe_background_task
+            asyncio.create_task(_safe_background_task(fn(*args), sink))
+            return True
+
+        queue = self._queues[sink]
+        dropped = False
+        if queue.full():
+            try:
+                queue.get_nowait()
+                queue.task_done()
+                dropped = True
+                track_sink_drop(sink)
+                logger.warning(f"[Fanout] {sink} queue full ({self.max_queue}), dropped oldest job")
+            except asyncio.QueueEmpty:
+                pass
+        queue.put_nowait((fn, args, time.monotonic()))
+        return not dropped
+
+    def stats(self) -> dict[str, Any]:
+        """Pending jobs per sink."""
+        return {
+            "running": self._running,
+            "workers_per_sink": self.workers,
+            "max_queue": self.max_queue,
+            "pending": {sink: q.qsize() for sink, q in self._queues.items()},
+        }
+
+    async def _worker_loop(self, sink: str):
+        """Run jobs for one sink, logging (not raising) failures."""
+        queue = self._queues[sink]
+        while True:
+            fn, args, queued_at = await queue.get()
+            start = time.monotonic()
+            success = True
+            try:
+                await fn(*args)
+            except Exception as e:
+                success = False
+                logger.error("[❌ Background %s] %s", sink, e)
+            finally:
+                finished = time.monotonic()
+                track_sink_job(
+                    sink,
+                    success=success,
+                    latency_ms=(finished - start) * 1000,
+                    queue_wait_ms=(start - queued_at) * 1000,
+                )
+                queue.task_done()
+
+
+# Global dispatcher instance
+fanout_dispatcher = FanoutDispatcher()
@@ -0,0 +1,206 @@
+"""
+Country Geocoding
+
+Resolves vehicle coordinates to ISO 3166-1 alpha-2 country codes with the
+offline reverse_geocode package. The package builds its KD-tree when it is
+imported, which takes a few seconds of CPU: load_geocoder() is started in a
+worker thread in the background at startup (a lookup arriving before it has
+finished loads the package itself), and callers on the event loop run lookups
+with asyncio.to_thread.
+
+Results are memoized by geohash cell (a parked car keeps hitting the same
+cell) in a bounded LRU, which can be saved to local disk on shutdown and
+loaded again on startup.
+"""
+import json
+import logging
+import os
+import threading
+from collections import OrderedDict
+from typing import Any
+
+from app.config import GEOCODE_CACHE_PATH, GEOCODE_CACHE_SIZE, GEOCODE_GEOHASH_PRECISION
+
+logger = logging.getLogger(__name__)
+
+_GEOHASH_ALPHABET = "0123456789bcdefghjkmnpqrstuvwxyz"
+
+
+def geohash(lat: float, lon: float, precision: int) -> str:
+    """Standard base32 geohash of a point (precision 6 is a cell of about 1.2 x 0.6 km)."""
+    lat_range = [-90.0, 90.0]
+    lon_range = [-180.0, 180.0]
+    chars = []
+    bits = 0
+    bit_count = 0
+    even = True
+    while len(chars) < precision:
+        rng, value = (lon_range, lon) if even else (lat_range, lat)
+        mid = (rng[0] + rng[1]) / 2
+        bits <<= 1
+        if value >= mid:
+            bits |= 1
+            rng[0] = mid
+        else:
+            rng[1] = mid
+        even = not even
+        bit_count += 1
+        if bit_count == 5:
+            chars.append(_GEOHASH_ALPHABET[bits])
+            bits = 0
+            bit_count = 0
+    return "".join(chars)
+
+
+class CountryGeocoder:
+    """Geohash-keyed LRU in front of a lazily loaded reverse_geocode."""
+
+    def __init__(
+        self,
+        max_entries: int = GEOCODE_CACHE_SIZE,
+        precision: int = GEOCODE_GEOHASH_PRECISION,
+        cache_path: str = GEOCODE_CACHE_PATH,
+    ):
+        self.max_entries = max(1, max_entries)
+        self.precision = precision
+        self.cache_path = cache_path
+        # {geohash: [country_code, country_name]}
+        self._cache: OrderedDict[str, list] = OrderedDict()
+        # {country_code: country_name} for every country seen (not bounded by the LRU: ~250 entries)
+        self._names: dict[str, str] = {}
+        self._lock = threading.Lock()
+        self._geocoder = None
+        self._hits = 0
+        self._misses = 0
+        self._failures = 0
+
+    def load_geocoder(self) -> bool:
+        """Import reverse_geocode (building its KD-tree). Blocking; returns False if it cannot be loaded."""
+        if self._geocoder is None:
+            try:
+                import reverse_geocode
+            except Exception as e:
+                logger.warning(f"[Geocoding] Could not load reverse_geocode: {e}")
+                return False
+            self._geocoder = reverse_geocode
+            logger.info("[Geocoding] reverse_geocode loaded")
+        return True
+
+    def _search(self, coords: list[tuple[float, float]]) -> list[dict]:
+        """reverse_geocode.search, loading it first if the startup load did not run."""
+        if not self.load_geocoder():
+            raise RuntimeError("reverse_geocode is not available")
+        return self._geocoder.search(coords)
+
+    def lookup_many(self, coords: list[tuple[float, float]]) -> list[tuple[str, str] | None]:
+        """
+        (country_code, country_name) for each coordinate, in order; None where
+        geocoding failed. Cache misses are geocoded in a single search call.
+        """
+        results: list[tuple[str, str] | None] = [None] * len(coords)
+        missing: dict[str, list[int]] = {}
+        missing_coords: list[tuple[float, float]] = []
+
+        with self._lock:
+            for i, (lat, lon) in enumerate(coords):
+                key = geohash(lat, lon, self.precision)
+                cached = self._cache.get(key)
+                if cached is not None:
+                    self._cache.move_to_end(key)
+                    self._hits += 1
+                    results[i] = (cached[0], cached[1])
+                    continue
+                self._misses += 1
+                if key not in missing:
+                    missing[key] = []
+                    missing_coords.append((lat, lon))
+                missing[key].append(i)
+
+        if not missing_coords:
+            return results
+
+        try:
+            found = self._search(missing_coords)
+        except Exception as e:
+            self._failures += len(missing_coords)
+            logger.warning(f"[⚠️ Reverse geocode failed] {len(missing_coords)} point(s): {e}")
+            return results
+
+        with self._lock:
+            for key, result in zip(missing, found):
+                code = result.get("country_code")
+                if not code:
+                    continue
+                entry = [code, result.get("country") or code]
+                self._cache[key] = entry
+                self._names.setdefault(code, entry[1])
+                self._cache.move_to_end(key)
+                for i in missing[key]:
+                    results[i] = (entry[0], entry[1])
+            while len(self._cache) > self.max_entries:
+                self._cache.popitem(last=False)
+
+        return results
+
+    def country_code(self, lat: float, lon: float) -> str | None:
+        """ISO country code for one coordinate, or None if geocoding fails."""
+        result = self.lookup_many([(lat, lon)])[0]
+        return result[0] if result else None
+
+    def country_name(self, code: str) -> str | None:
+        """Country name reverse_geocode gave for a code, or None if no lookup has returned it yet."""
+        return self._names.get(code)
+
+    def load(self) -> int:
+        """Load a cache saved by save(). Returns the number of cells loaded."""
+        if not self.cache_path or not os.path.exists(self.cache_path):
+            return 0
+        try:
+            with open(self.cache_path, encoding="utf-8") as f:
+                data = json.load(f)
+            if data.get("precision") != self.precision:
+                logger.info("[Geocoding] Ignoring saved cache with a different geohash precision")
+                return 0
+            with self._lock:
+                for key, entry in list(data.get("cells", {}).items())[-self.max_entries:]:
+                    self._cache[key] = entry
+                    self._names.setdefault(entry[0], entry[1])
+            logger.info(f"[Geocoding] Loaded {len(self._cache)} cached cell(s) from {self.cache_path}")
+            return len(self._cache)
+        except Exception as e:
+            logger.warning(f"[Geocoding] Could not load cache from {self.cache_path}: {e}")
+            return 0
+
+    def save(self) -> int:
+        """Write the cache to cache_path (atomically). Returns the number of cells saved."""
+        if not self.cache_path:
+            return 0
+        with self._lock:
+            cells = dict(self._cache)
+        tmp_path = f"{self.cache_path}.tmp"
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump({"precision": self.precision, "cells": cells}, f)
+            os.replace(tmp_path, self.cache_path)
+            logger.info(f"[Geocoding] Saved {len(cells)} cached cell(s) to {self.cache_path}")
+            return len(cells)
+        except Exception as e:
+            logger.warning(f"[Geocoding] Could not save cache to {self.cache_path}: {e}")
+            return 0
+
+    def stats(self) -> dict[str, Any]:
+        lookups = self._hits + self._misses
+        return {
+            "geocoder_loaded": self._geocoder is not None,
+            "cells": len(self._cache),
+            "max_cells": self.max_entries,
+            "precision": self.precision,
+            "hits": self._hits,
+            "misses": self._misses,
+            "failures": self._failures,
+            "hit_rate": round(self._hits / lookups, 3) if lookups else 0.0,
+        }
+
+
+# Global geocoder instance
+country_geocoder = CountryGeocoder()
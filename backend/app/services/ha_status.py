@@ -0,0 +1,184 @@
+"""
+Home Assistant Status Documents
+
+The /api/ha/status/{vehicle_id} response is rendered once, when the vehicle
+is saved, and kept here as serialized JSON together with an ETag (a hash of
+the body). Polls are answered from this cache, and a poll whose
+If-None-Match matches the ETag gets a 304 without touching Supabase.
+
+The cache is keyed by the internal vehicle id (vehicles.id), bounded (least
+recently used documents are evicted) and entries expire after
+HA_STATUS_CACHE_TTL_SECONDS: with several workers another process may have
+saved newer data, so a document is never served for longer than that.
+"""
+import hashlib
+import logging
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any
+
+import orjson
+
+from app.config import HA_STATUS_CACHE_SIZE, HA_STATUS_CACHE_TTL_SECONDS
+
+logger = logging.getLogger(__name__)
+
+
+def normalize_location(location_data):
+    """
+    Normalize location data - returns None if location is invalid or has null values.
+    Returns the location dict only if it has valid latitude and longitude.
+    """
+    if not location_data or not isinstance(location_data, dict):
+        return None
+
+    lat = location_data.get("latitude")
+    lon = location_data.get("longitude")
+
+    # Return None if lat/lon are missing or null
+    if lat is None or lon is None:
+        return None
+
+    return location_data
+
+
+def render_ha_status(cache: dict) -> dict:
+    """The /api/ha/status response for a vehicle_cache."""
+    charge = cache.get("chargeState", {})
+    info = cache.get("information", {})
+    location = normalize_location(cache.get("location", {}))
+    abrp_extra = cache.get("abrp_extra", {})
+
+    result = {
+        "vehicleName": f"{info.get('brand', '')} {info.get('model', '')}",
+        "isReachable": cache.get("isReachable"),
+        "chargeState": charge,
+        "information": info,
+        "location": location,
+        "locationAvailable": location is not None,
+        "odometer": cache.get("odometer", {}),
+        "vendor": cache.get("vendor"),
+        "smartChargingPolicy": cache.get("smartChargingPolicy", {}),
+        "capabilities": cache.get("capabilities", {}),
+        "lastSeen": cache.get("lastSeen"),
+    }
+
+    if abrp_extra:
+        result["abrp_extra"] = abrp_extra
+
+    return result
+
+
+@dataclass(slots=True)
+class HAStatusDocument:
+    db_id: str
+    vehicle_id: str
+    user_id: str
+    body: bytes
+    etag: str
+    rendered_at: float  # time.monotonic()
+
+
+class HAStatusCache:
+    """Bounded, expiring map of vehicles.id -> rendered status document."""
+
+    def __init__(self, max_entries: int = HA_STATUS_CACHE_SIZE, ttl_seconds: float = HA_STATUS_CACHE_TTL_SECONDS):
+        self.max_entries = max(1, max_entries)
+        self.ttl_seconds = ttl_seconds
+        self._docs: OrderedDict[str, HAStatusDocument] = OrderedDict()
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+        self._not_modified = 0
+        self._renders = 0
+
+    def put(self, db_id: str, vehicle_id: str, user_id: str, cache: dict) -> HAStatusDocument | None:
+        """Render and store the document for a saved vehicle_cache. Returns the document."""
+        if not db_id or not user_id or not cache:
+            return None
+        try:
+            body = orjson.dumps(render_ha_status(cache))
+        except Exception as e:
+            logger.warning(f"[HAStatus] Could not render status for {vehicle_id}: {e}")
+            self.invalidate(db_id)
+            return None
+        doc = HAStatusDocument(
+            db_id=db_id,
+            vehicle_id=vehicle_id,
+            user_id=user_id,
+            body=body,
+            etag=f'"{hashlib.blake2b(body, digest_size=12).hexdigest()}"',
+            rendered_at=time.monotonic(),
+        )
+        with self._lock:
+            self._docs[db_id] = doc
+            self._docs.move_to_end(db_id)
+            while len(self._docs) > self.max_entries:
+                self._docs.popitem(last=False)
+            self._renders += 1
+        return doc
+
+    def get(self, db_id: str) -> HAStatusDocument | None:
+        """The cached document, or None if there is none or it has expired."""
+        with self._lock:
+            doc = self._docs.get(db_id)
+            if doc is not None and time.monotonic() - doc.rendered_at > self.ttl_seconds:
+                del self._docs[db_id]
+                doc = None
+            if doc is None:
+                self._misses += 1
+                return None
+            self._docs.move_to_end(db_id)
+            self._hits += 1
+            return doc
+
+    def record_not_modified(self) -> None:
+        self._not_modified += 1
+
+    def invalidate(self, db_id: str) -> None:
+        with self._lock:
+            self._docs.pop(db_id, None)
+
+    def forget_vehicle(self, vehicle_id: str) -> None:
+        """Drop the document of a deleted vehicle (by Enode/ABRP vehicle id)."""
+        with self._lock:
+            for db_id, doc in list(self._docs.items()):
+                if doc.vehicle_id == vehicle_id:
+                    del self._docs[db_id]
+
+    def forget_user(self, user_id: str) -> None:
+        """Drop all documents of a user after a bulk delete."""
+        with self._lock:
+            for db_id, doc in list(self._docs.items()):
+                if doc.user_id == user_id:
+                    del self._docs[db_id]
+
+    def stats(self) -> dict[str, Any]:
+        lookups = self._hits + self._misses
+        return {
+            "documents": len(self._docs),
+            "max_documents": self.max_entries,
+            "ttl_seconds": self.ttl_seconds,
+            "renders": self._renders,
+            "hits": self._hits,
+            "misses": self._misses,
+            "not_modified": self._not_modified,
+            "hit_rate": round(self._hits / lookups, 3) if lookups else 0.0,
+        }
+
+
+def etag_matches(if_none_match: str | None, etag: str) -> bool:
+    """True if an If-None-Match header value matches etag (weak comparison, "*" matches)."""
+    if not if_none_match:
+        return False
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate == "*" or candidate.removeprefix("W/") == etag:
+            return True
+    return False
+
+
+# Global status document cache instance
+ha_status_cache = HAStatusCache()
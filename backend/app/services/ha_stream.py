@@ -0,0 +1,268 @@
+"""
+Home Assistant Event Stream
+
+Per-user broker behind the /api/ha/stream Server-Sent Events endpoint. When
+a vehicle save renders a new HA status document (app.services.ha_status) the
+document is published here and sent to every open stream of the vehicle's
+owner.
+
+Each user has a ring buffer of the last HA_STREAM_BUFFER_SIZE events, so a
+client that reconnects with Last-Event-ID gets what it missed. Event ids
+carry a per-process epoch: an id from before a restart (or one that has
+already left the buffer) cannot be resumed from, and the client gets the
+current document of each of its vehicles instead.
+
+Documents are only buffered for users with an open stream in this
+process, or whose last stream closed less than HA_STREAM_RESUME_GRACE_SECONDS
+ago; after that the user's buffer is dropped. A subscriber that falls
+HA_STREAM_QUEUE_SIZE events behind is disconnected; it reconnects and
+resumes from the buffer. Streams only see saves made by this process.
+
+uvicorn only runs the lifespan shutdown once every response has finished,
+and a stream never finishes by itself, so the streams are ended from
+uvicorn's exit handler instead (see close_streams_on_server_exit).
+"""
+import asyncio
+import logging
+import time
+import uuid
+from collections import deque
+from typing import Any
+
+import orjson
+
+from app.config import (
+    HA_STREAM_BUFFER_SIZE,
+    HA_STREAM_MAX_STREAMS_PER_USER,
+    HA_STREAM_QUEUE_SIZE,
+    HA_STREAM_RESUME_GRACE_SECONDS,
+)
+from app.services.ha_status import HAStatusDocument
+
+logger = logging.getLogger(__name__)
+
+# Last published ETags remembered per user (oldest are forgotten; a forgotten one is just sent again)
+MAX_ETAGS_PER_USER = 100
+# Idle channels are looked for at most this often
+SWEEP_INTERVAL_SECONDS = 60.0
+
+
+def format_status_event(doc: HAStatusDocument, event_id: str | None = None) -> bytes:
+    """One SSE "status" frame for a status document."""
+    # The rendered body is spliced in as-is instead of being parsed and dumped again
+    data = orjson.dumps({
+        "vehicleId": doc.db_id,
+        "enodeVehicleId": doc.vehicle_id,
+        "etag": doc.etag,
+    })[:-1] + b',"status":' + doc.body + b"}"
+    id_line = f"id: {event_id}\n".encode() if event_id else b""
+    return id_line + b"event: status\ndata: " + data + b"\n\n"
+
+
+class HAStreamSubscriber:
+    """One open stream: frames are queued here until the response writes them."""
+
+    __slots__ = ("user_id", "queue", "closed")
+
+    def __init__(self, user_id: str, max_queue: int):
+        self.user_id = user_id
+        self.queue: asyncio.Queue[bytes | None] = asyncio.Queue(maxsize=max_queue)
+        self.closed = False
+
+    def close(self):
+        """Ends the stream after the frames already queued."""
+        if self.closed:
+            return
+        self.closed = True
+        try:
+            self.queue.put_nowait(None)
+        except asyncio.QueueFull:
+            # Make room for the end marker: the client resumes from the ring buffer anyway
+            self.queue.get_nowait()
+            self.queue.put_nowait(None)
+
+
+class _UserChannel:
+    __slots__ = ("buffer", "dropped_through", "subscribers", "etags", "idle_since")
+
+    def __init__(self, buffer_size: int):
+        # (sequence number, frame); sequence numbers are global, so they have gaps per user
+        self.buffer: deque[tuple[int, bytes]] = deque(maxlen=buffer_size)
+        # Sequence number of the newest event that no longer fits in the buffer
+        self.dropped_through = 0
+        self.subscribers: set[HAStreamSubscriber] = set()
+        # Last published ETag per vehicle (unchanged documents are not sent again)
+        self.etags: dict[str, str] = {}
+        # time.monotonic() when the last subscriber left (None while streams are open)
+        self.idle_since: float | None = None
+
+
+class HAStreamBroker:
+    """Routes published status documents to the owner's open streams."""
+
+    def __init__(
+        self,
+        buffer_size: int = HA_STREAM_BUFFER_SIZE,
+        max_queue: int = HA_STREAM_QUEUE_SIZE,
+        max_streams_per_user: int = HA_STREAM_MAX_STREAMS_PER_USER,
+        resume_grace_seconds: float = HA_STREAM_RESUME_GRACE_SECONDS,
+    ):
+        self.buffer_size = max(1, buffer_size)
+        self.max_queue = max(1, max_queue)
+        self.max_streams_per_user = max(1, max_streams_per_user)
+        self.resume_grace_seconds = resume_grace_seconds
+        self.epoch = uuid.uuid4().hex[:8]
+        self._channels: dict[str, _UserChannel] = {}
+        self._closed = False
+        self._swept_at = time.monotonic()
+        self._sequence = 0
+        self._published = 0
+        self._delivered = 0
+        self._disconnected_slow = 0
+
+    def _event_id(self, sequence: int) -> str:
+        return f"{self.epoch}-{sequence}"
+
+    def current_event_id(self) -> str:
+        """Id of the newest event published so far (a stream resuming from it misses nothing)."""
+        return self._event_id(self._sequence)
+
+    def _is_expired(self, channel: _UserChannel, now: float) -> bool:
+        return channel.idle_since is not None and now - channel.idle_since > self.resume_grace_seconds
+
+    def _sweep(self) -> None:
+        """Drop the channels of users whose last stream closed longer than the resume grace ago."""
+        now = time.monotonic()
+        if now - self._swept_at < SWEEP_INTERVAL_SECONDS:
+            return
+        self._swept_at = now
+        for user_id, channel in list(self._channels.items()):
+            if self._is_expired(channel, now):
+                del self._channels[user_id]
+
+    def publish(self, doc: HAStatusDocument | None) -> None:
+        """Buffer a freshly rendered document and send it to the owner's open streams."""
+        if doc is None:
+            return
+        self._sweep()
+        channel = self._channels.get(doc.user_id)
+        if channel is None:
+            return
+        if self._is_expired(channel, time.monotonic()):
+            del self._channels[doc.user_id]
+            return
+        if channel.etags.get(doc.db_id) == doc.etag:
+            return
+        channel.etags.pop(doc.db_id, None)
+        channel.etags[doc.db_id] = doc.etag
+        if len(channel.etags) > MAX_ETAGS_PER_USER:
+            del channel.etags[next(iter(channel.etags))]
+
+        self._sequence += 1
+        frame = format_status_event(doc, self._event_id(self._sequence))
+        if len(channel.buffer) == self.buffer_size:
+            channel.dropped_through = channel.buffer[0][0]
+        channel.buffer.append((self._sequence, frame))
+        self._published += 1
+
+        for subscriber in list(channel.subscribers):
+            try:
+                subscriber.queue.put_nowait(frame)
+                self._delivered += 1
+            except asyncio.QueueFull:
+                logger.info(f"[HAStream] Disconnecting slow stream of user {doc.user_id}")
+                self._disconnected_slow += 1
+                self.unsubscribe(subscriber)
+                subscriber.close()
+
+    def subscribe(self, user_id: str) -> HAStreamSubscriber | None:
+        """
+        Open a stream for a user. Returns None if the user already has the
+        maximum number open, or the server is shutting down.
+        """
+        if self._closed:
+            return None
+        self._sweep()
+        channel = self._channels.get(user_id)
+        if channel is None:
+            channel = self._channels[user_id] = _UserChannel(self.buffer_size)
+        if len(channel.subscribers) >= self.max_streams_per_user:
+            return None
+        subscriber = HAStreamSubscriber(user_id, self.max_queue)
+        channel.subscribers.add(subscriber)
+        channel.idle_since = None
+        return subscriber
+
+    def unsubscribe(self, subscriber: HAStreamSubscriber) -> None:
+        channel = self._channels.get(subscriber.user_id)
+        if channel is not None:
+            channel.subscribers.discard(subscriber)
+            if not channel.subscribers and channel.idle_since is None:
+                channel.idle_since = time.monotonic()
+
+    def replay(self, user_id: str, last_event_id: str | None) -> list[bytes] | None:
+        """
+        Frames published after last_event_id, or None if the stream cannot be
+        resumed from it (no id, another process epoch, or already out of the buffer).
+        """
+        if not last_event_id:
+            return None
+        epoch, _, sequence = last_event_id.partition("-")
+        if epoch != self.epoch or not sequence.isdigit():
+            return None
+        last = int(sequence)
+        channel = self._channels.get(user_id)
+        if channel is None or last > self._sequence or last < channel.dropped_through:
+            return None
+        if self._is_expired(channel, time.monotonic()):
+            return None
+        return [frame for sequence_number, frame in channel.buffer if sequence_number > last]
+
+    @property
+    def is_closed(self) -> bool:
+        return self._closed
+
+    def close_all(self) -> None:
+        """End every open stream and refuse new ones (shutdown), so the server can finish its responses."""
+        self._closed = True
+        for channel in self._channels.values():
+            for subscriber in list(channel.subscribers):
+                subscriber.close()
+            channel.subscribers.clear()
+
+    def stats(self) -> dict[str, Any]:
+        return {
+            "users": len(self._channels),
+            "streams": sum(len(c.subscribers) for c in self._channels.values()),
+            "buffered_events": sum(len(c.buffer) for c in self._channels.values()),
+            "published": self._published,
+            "delivered": self._delivered,
+            "disconnected_slow": self._disconnected_slow,
+        }
+
+
+# Global HA stream broker instance
+ha_stream_broker = HAStreamBroker()
+
+
+def close_streams_on_server_exit() -> bool:
+    """
+    End the open streams as soon as uvicorn is told to exit (SIGINT/SIGTERM),
+    before it waits for open responses; same approach as sse-starlette.
+    Returns False when not running under uvicorn.
+    """
+    try:
+        from uvicorn.main import Server
+    except ImportError:
+        return False
+    original = Server.handle_exit
+    if getattr(original, "closes_ha_streams", False):
+        return True
+
+    def handle_exit(self, sig, frame):
+        ha_stream_broker.close_all()
+        return original(self, sig, frame)
+
+    handle_exit.closes_ha_streams = True
+    Server.handle_exit = handle_exit
+    return True
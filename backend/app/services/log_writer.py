@@ -0,0 +1,261 @@
+"""
+Buffered Log Writer
+
+Background writer for append-only log tables (webhook_logs, poll_logs).
+Rows are buffered in memory and flushed as one multi-row insert when the
+batch is full or the flush interval elapses, so request handlers never wait
+on audit logging. The buffer is bounded: when it is full the oldest row is
+dropped and counted.
+
+Ledger tables (poll_logs feeds the rate limits) use lossless=True instead:
+a failed batch is retried row by row, so one bad row cannot take the
+others with it. A row the database rejects (a 4xx PostgREST error or a
+Postgres data, constraint or schema error such as 23503) is passed to
+repair_row and retried once; if it is still rejected it is dropped and
+counted, since it can never be written. Any other failure (connection
+errors, 5xx) means the database is unavailable: the rows are put back at the
+head of the buffer for the next flush. Nothing is dropped when the buffer is
+full: put() inserts the row directly.
+"""
+import asyncio
+import logging
+import time
+from collections import deque
+from typing import Any, Callable
+
+from postgrest.exceptions import APIError
+
+from app.lib.supabase import get_supabase_admin_client
+
+logger = logging.getLogger(__name__)
+supabase = get_supabase_admin_client()
+
+# How long shutdown waits for the final flush
+DEFAULT_DRAIN_TIMEOUT_SECONDS = 10.0
+# Error code prefixes of rows the database rejects for good: Postgres data exceptions (22),
+# integrity constraint violations (23), schema errors (42) and PostgREST request errors (4xx)
+PERMANENT_ERROR_PREFIXES = ("22", "23", "42", "PGRST1", "PGRST2")
+
+
+def is_permanent_error(e: Exception) -> bool:
+    """True if retrying the same insert cannot succeed (as opposed to the database being unavailable)."""
+    code = getattr(e, "code", None) if isinstance(e, APIError) else None
+    return isinstance(code, str) and code.startswith(PERMANENT_ERROR_PREFIXES)
+
+
+class BufferedLogWriter:
+    """Buffers rows for one table and writes them in batches from a background task."""
+
+    def __init__(
+        self,
+        table: str,
+        batch_size: int = 50,
+        flush_interval: float = 2.0,
+        max_buffer: int = 5000,
+        drain_timeout: float = DEFAULT_DRAIN_TIMEOUT_SECONDS,
+        lossless: bool = False,
+        repair_row: Callable[[dict], dict | None] | None = None,
+    ):
+        self.table = table
+        self.batch_size = max(1, batch_size)
+        self.flush_interval = flush_interval
+        self.max_buffer = max(self.batch_size, max_buffer)
+        self.drain_timeout = drain_timeout
+        self.lossless = lossless
+        self.repair_row = repair_row
+        self._buffer: deque[dict] = deque()
+        self._wakeup: asyncio.Event | None = None
+        self._task: asyncio.Task | None = None
+        self._running = False
+        self._written = 0
+        self._dropped = 0
+        self._failed = 0
+        self._flushes = 0
+        self._last_flush_ms = 0.0
+        self._requeued = 0
+        self._repaired = 0
+        self._direct = 0
+        self._rejected = 0
+
+    @property
+    def is_running(self) -> bool:
+        return self._running
+
+    async def start(self):
+        """Start the background flush loop."""
+        if self._running:
+            logger.warning(f"[LogWriter:{self.table}] Already running, skipping start")
+            return
+
+        self._wakeup = asyncio.Event()
+        self._running = True
+        self._task = asyncio.create_task(self._flush_loop())
+        logger.info(
+            f"[LogWriter:{self.table}] Started (batch {self.batch_size}, "
+            f"every {self.flush_interval}s, max buffer {self.max_buffer})"
+        )
+
+    async def stop(self):
+        """Stop the flush loop and write whatever is still buffered."""
+        if not self._running:
+            return
+        self._running = False
+
+        if self._task:
+            # Let a flush in progress finish: cancelling it would lose the rows it has taken
+            self._wakeup.set()
+            try:
+                await asyncio.wait_for(self._task, timeout=self.drain_timeout)
+            except (asyncio.TimeoutError, asyncio.CancelledError):
+                pass
+            self._task = None
+
+        try:
+            await asyncio.wait_for(self._flush_all(), timeout=self.drain_timeout)
+        except asyncio.TimeoutError:
+            logger.error(f"[LogWriter:{self.table}] Final flush timed out, {len(self._buffer)} row(s) lost")
+        if self._buffer:
+            logger.error(f"[LogWriter:{self.table}] Database unavailable at shutdown, {len(self._buffer)} row(s) lost")
+        logger.info(f"[LogWriter:{self.table}] Stopped")
+
+    def write(self, row: dict) -> bool:
+        """
+        Buffer a row for insertion. Never blocks.
+        When the writer is not running the row is inserted synchronously instead,
+        so scripts and tests that skip the app lifespan still persist their logs.
+        Returns False if the row could not be written.
+        """
+        if not self._running:
+            return self._insert([row])
+
+        if len(self._buffer) >= self.max_buffer and not self.lossless:
+            self._buffer.popleft()
+            self._dropped += 1
+            if self._dropped % 100 == 1:
+                logger.warning(f"[LogWriter:{self.table}] Buffer full ({self.max_buffer}), dropped {self._dropped} row(s) so far")
+
+        self._buffer.append(row)
+        if len(self._buffer) >= self.batch_size and self._wakeup is not None:
+            self._wakeup.set()
+        return True
+
+    async def put(self, row: dict) -> None:
+        """
+        Like write, but a lossless writer with a full buffer inserts the row
+        directly (off the event loop) instead of growing the buffer further.
+        """
+        if self.lossless and self._running and len(self._buffer) >= self.max_buffer:
+            self._direct += 1
+            if await asyncio.to_thread(self._insert, [row], False):
+                return
+        self.write(row)
+
+    def stats(self) -> dict[str, Any]:
+        """Buffer depth and write/drop counters."""
+        stats = {
+            "running": self._running,
+            "buffered": len(self._buffer),
+            "max_buffer": self.max_buffer,
+            "written": self._written,
+            "dropped": self._dropped,
+            "failed": self._failed,
+            "flushes": self._flushes,
+            "last_flush_ms": round(self._last_flush_ms, 1),
+        }
+        if self.lossless:
+            stats.update(
+                requeued=self._requeued,
+                repaired=self._repaired,
+                rejected=self._rejected,
+                direct_inserts=self._direct,
+            )
+        return stats
+
+    def _try_insert(self, rows: list[dict]) -> Exception | None:
+        """Multi-row insert (blocking). Returns the error, or None if the rows were written."""
+        start = time.perf_counter()
+        try:
+            supabase.table(self.table).insert(rows).execute()
+            self._written += len(rows)
+            return None
+        except Exception as e:
+            logger.error(f"[❌ LogWriter:{self.table}] Failed to insert {len(rows)} row(s): {e}")
+            return e
+        finally:
+            self._last_flush_ms = (time.perf_counter() - start) * 1000
+
+    def _insert(self, rows: list[dict], count_failure: bool = True) -> bool:
+        """Multi-row insert (blocking – called directly or via asyncio.to_thread)."""
+        if self._try_insert(rows) is None:
+            return True
+        if count_failure:
+            self._failed += len(rows)
+        return False
+
+    def _insert_lossless(self, rows: list[dict]) -> list[dict]:
+        """
+        Insert rows without losing any the database would accept (blocking).
+        Returns the rows that could not be written yet and must be retried later.
+        """
+        if self._try_insert(rows) is None:
+            return []
+        for i, row in enumerate(rows):
+            error = self._try_insert([row])
+            if error is None:
+                continue
+            if not is_permanent_error(error):
+                # Database unavailable: keep this row and the rest for the next flush
+                return rows[i:]
+            repaired = self.repair_row(row) if self.repair_row else None
+            if repaired is not None:
+                error = self._try_insert([repaired])
+                if error is None:
+                    self._repaired += 1
+                    continue
+                if not is_permanent_error(error):
+                    return rows[i:]
+            self._failed += 1
+            self._rejected += 1
+            logger.error(f"[❌ LogWriter:{self.table}] Row rejected ({getattr(error, 'code', None)}), dropped: {row}")
+        return []
+
+    async def _flush_once(self) -> int:
+        """
+        Write up to batch_size buffered rows. Returns the number written,
+        dropped or rejected; rows put back for a retry are not counted.
+        """
+        if not self._buffer:
+            return 0
+        count = min(self.batch_size, len(self._buffer))
+        rows = [self._buffer.popleft() for _ in range(count)]
+        self._flushes += 1
+        if not self.lossless:
+            await asyncio.to_thread(self._insert, rows)
+            return count
+        pending = await asyncio.to_thread(self._insert_lossless, rows)
+        if pending:
+            self._requeued += len(pending)
+            self._buffer.extendleft(reversed(pending))
+        return count - len(pending)
+
+    async def _flush_all(self):
+        """Flush until the buffer is empty (or the rows left have to wait for a retry)."""
+        while self._buffer:
+            if await self._flush_once() == 0:
+                break
+
+    async def _flush_loop(self):
+        """Flush when a batch fills up or the flush interval elapses."""
+        while self._running:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+
+            try:
+                await self._flush_all()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"[LogWriter:{self.table}] Flush loop error: {e}")
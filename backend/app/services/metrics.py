@@ -18,6 +18,10 @@ _lock = Lock()
 WINDOW_SECONDS = 300
 
 
+def _new_sink_stats() -> dict:
+    return {"jobs": 0, "errors": 0, "drops": 0, "latency_ms_total": 0.0, "latency_ms_max": 0.0, "queue_wait_ms_max": 0.0}
+
+
 @dataclass
 class MetricsBucket:
     """Stores metrics for a time window."""
@@ -34,6 +38,9 @@ class MetricsBucket:
     # Per-endpoint tracking
     endpoint_counts: dict = field(default_factory=lambda: defaultdict(int))
 
+    # Per-sink fan-out tracking (HA, Pushover, ABRP)
+    sink_stats: dict = field(default_factory=lambda: defaultdict(_new_sink_stats))
+
     def is_expired(self) -> bool:
         return datetime.utcnow() > self.start_time + timedelta(seconds=WINDOW_SECONDS)
 
@@ -88,6 +95,40 @@ def track_webhook_received():
         _current_bucket.webhook_received += 1
 
 
+def track_sink_job(sink: str, success: bool = True, latency_ms: float = 0, queue_wait_ms: float = 0):
+    """Track a completed fan-out job (HA push, Pushover, ABRP)."""
+    with _lock:
+        _rotate_if_needed()
+        stats = _current_bucket.sink_stats[sink]
+        stats["jobs"] += 1
+        if not success:
+            stats["errors"] += 1
+        stats["latency_ms_total"] += latency_ms
+        stats["latency_ms_max"] = max(stats["latency_ms_max"], latency_ms)
+        stats["queue_wait_ms_max"] = max(stats["queue_wait_ms_max"], queue_wait_ms)
+
+
+def track_sink_drop(sink: str):
+    """Track a fan-out job dropped because the sink's queue was full."""
+    with _lock:
+        _rotate_if_needed()
+        _current_bucket.sink_stats[sink]["drops"] += 1
+
+
+def _summarize_sinks(bucket: MetricsBucket) -> dict[str, dict]:
+    return {
+        sink: {
+            "jobs": stats["jobs"],
+            "errors": stats["errors"],
+            "drops": stats["drops"],
+            "avg_latency_ms": round(stats["latency_ms_total"] / stats["jobs"], 1) if stats["jobs"] else 0,
+            "max_latency_ms": round(stats["latency_ms_max"], 1),
+            "max_queue_wait_ms": round(stats["queue_wait_ms_max"], 1),
+        }
+        for sink, stats in bucket.sink_stats.items()
+    }
+
+
 def get_metrics() -> dict[str, Any]:
     """Get current metrics snapshot."""
     with _lock:
@@ -124,6 +165,7 @@ def get_metrics() -> dict[str, Any]:
             "webhook_per_min": round(_current_bucket.webhook_received / elapsed_min, 1),
             "avg_response_time_ms": round(avg_response_time, 1),
             "top_endpoints": [{"endpoint": e, "count": c} for e, c in top_endpoints],
+            "sinks": _summarize_sinks(_current_bucket),
         }
 
         # Add previous window comparison if available
@@ -137,6 +179,7 @@ def get_metrics() -> dict[str, Any]:
                 "db_queries": _previous_bucket.db_queries,
                 "ha_pushes": _previous_bucket.ha_pushes,
                 "webhook_received": _previous_bucket.webhook_received,
+                "sinks": _summarize_sinks(_previous_bucket),
             }
 
         return {
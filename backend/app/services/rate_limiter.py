@@ -0,0 +1,349 @@
+"""
+Poll Rate Limiter
+
+Keeps the 30-day poll counts behind the API-key rate limits in memory (or in
+Redis, shared by all workers) so a rate-limited request needs no count query
+on poll_logs. Polls are counted per user ("u:<user_id>") and per vehicle
+("v:<vehicles.id>"), exactly like the poll_logs rows the old count queries
+matched.
+
+Counts are kept in hourly buckets: a window covers the buckets from the hour
+containing its start up to now, so the oldest hour is counted in full and a
+limit can apply up to an hour early, never late.
+
+The counters are seeded from poll_logs (get_poll_hourly_counts RPC) on
+startup and rebuilt from it every RATE_LIMIT_REBUILD_SECONDS. The database
+is authoritative for buckets older than the previous hour; for the last two
+hours the higher of the database and counter values is kept, since recent
+polls may not have been written yet. Until the first seed has succeeded
+ready is False and callers use the count queries.
+"""
+import asyncio
+import logging
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Any
+
+import redis.asyncio as redis
+
+from app.config import (
+    RATE_LIMIT_BACKEND,
+    RATE_LIMIT_REBUILD_SECONDS,
+    RATE_LIMIT_WINDOW_DAYS,
+    REDIS_URL,
+)
+from app.storage.poll_logs import fetch_poll_hourly_counts
+
+logger = logging.getLogger(__name__)
+
+# After a Redis error, stay on the in-process counters for this long before trying Redis again
+REDIS_RETRY_SECONDS = 30.0
+REDIS_KEY_PREFIX = "poll_count:"
+# Keys merged per Redis pipeline when loading the database counts
+REDIS_LOAD_CHUNK = 500
+
+# KEYS: counter hashes; ARGV: window start hour, current hour, increment, ttl seconds.
+# Drops buckets older than the window, adds the increment to the current hour and
+# returns each key's window total before the increment.
+_HIT_SCRIPT = """
+local totals = {}
+for i, key in ipairs(KEYS) do
+    local fields = redis.call('HGETALL', key)
+    local total = 0
+    for j = 1, #fields, 2 do
+        if tonumber(fields[j]) < tonumber(ARGV[1]) then
+            redis.call('HDEL', key, fields[j])
+        else
+            total = total + tonumber(fields[j + 1])
+        end
+    end
+    totals[i] = total
+    if tonumber(ARGV[3]) ~= 0 then
+        redis.call('HINCRBY', key, ARGV[2], ARGV[3])
+        redis.call('EXPIRE', key, ARGV[4])
+    end
+end
+return totals
+"""
+
+# KEYS[1]: counter hash; ARGV: first hour the database may be missing polls for,
+# ttl seconds, then hour/count pairs from the database.
+_LOAD_SCRIPT = """
+local key = KEYS[1]
+local recent_from = tonumber(ARGV[1])
+local fields = redis.call('HGETALL', key)
+local merged = {}
+for j = 1, #fields, 2 do
+    if tonumber(fields[j]) >= recent_from then
+        merged[fields[j]] = tonumber(fields[j + 1])
+    end
+end
+for i = 3, #ARGV, 2 do
+    local hour = ARGV[i]
+    local count = tonumber(ARGV[i + 1])
+    if tonumber(hour) < recent_from or (merged[hour] or 0) < count then
+        merged[hour] = count
+    end
+end
+redis.call('DEL', key)
+for hour, count in pairs(merged) do
+    redis.call('HSET', key, hour, count)
+end
+if next(merged) ~= nil then
+    redis.call('EXPIRE', key, ARGV[2])
+end
+return 1
+"""
+
+
+def hour_of(moment: datetime) -> int:
+    """Hourly bucket of a datetime (hours since the epoch)."""
+    return int(moment.timestamp()) // 3600
+
+
+def user_key(user_id: str) -> str:
+    return f"u:{user_id}"
+
+
+def vehicle_key(db_id: str) -> str:
+    return f"v:{db_id}"
+
+
+def hourly_counts_by_key(entries: list[dict]) -> dict[str, dict[int, int]]:
+    """{counter key: {hour: polls}} from get_poll_hourly_counts entries (one per user and vehicle)."""
+    counts: dict[str, dict[int, int]] = {}
+    for entry in entries:
+        keys = [user_key(entry["user_id"])]
+        if entry.get("vehicle_id"):
+            keys.append(vehicle_key(entry["vehicle_id"]))
+        for hour, polls in (entry.get("hours") or {}).items():
+            hour, polls = int(hour), int(polls)
+            for key in keys:
+                buckets = counts.setdefault(key, {})
+                buckets[hour] = buckets.get(hour, 0) + polls
+    return counts
+
+
+class MemoryPollCounter:
+    """Hourly poll buckets per key in this process. Every method is synchronous, so each call is atomic."""
+
+    def __init__(self):
+        self._counts: dict[str, dict[int, int]] = {}
+
+    def _total(self, key: str, start_hour: int) -> int:
+        buckets = self._counts.get(key)
+        if not buckets:
+            return 0
+        total = 0
+        for hour in list(buckets):
+            if hour < start_hour:
+                del buckets[hour]
+            else:
+                total += buckets[hour]
+        return total
+
+    def hit(self, keys: list[str], start_hour: int, hour: int, amount: int = 1) -> list[int]:
+        """Window totals of keys before adding amount polls to the current hour."""
+        totals = [self._total(key, start_hour) for key in keys]
+        if amount:
+            for key in keys:
+                buckets = self._counts.setdefault(key, {})
+                buckets[hour] = buckets.get(hour, 0) + amount
+                if buckets[hour] <= 0:
+                    del buckets[hour]
+        return totals
+
+    def load(self, counts: dict[str, dict[int, int]], recent_from: int) -> None:
+        """Replace the counters with database counts, keeping higher counter values from recent_from on."""
+        merged = {key: dict(buckets) for key, buckets in counts.items()}
+        for key, buckets in self._counts.items():
+            for hour, polls in buckets.items():
+                if hour >= recent_from and polls > merged.get(key, {}).get(hour, 0):
+                    merged.setdefault(key, {})[hour] = polls
+        self._counts = merged
+
+    def __len__(self) -> int:
+        return len(self._counts)
+
+
+class PollRateLimiter:
+    """Per-user and per-vehicle 30-day poll counts for the API-key rate limits."""
+
+    def __init__(
+        self,
+        backend: str = RATE_LIMIT_BACKEND,
+        rebuild_seconds: int = RATE_LIMIT_REBUILD_SECONDS,
+        window_days: int = RATE_LIMIT_WINDOW_DAYS,
+    ):
+        self.backend = backend if backend in ("memory", "redis") else "memory"
+        self.rebuild_seconds = rebuild_seconds
+        self.window = timedelta(days=window_days)
+        self.redis_client = None
+        self._redis_retry_at = 0.0
+        self._hit_script = None
+        self._load_script = None
+        self._memory = MemoryPollCounter()
+        self._ready = False
+        self._running = False
+        self._task: asyncio.Task | None = None
+        self._hits = 0
+        self._undone = 0
+        self._rebuilds = 0
+        self._failed_rebuilds = 0
+        self._fallbacks = 0
+        self._last_rebuild_ms = 0.0
+
+    @property
+    def is_running(self) -> bool:
+        return self._running
+
+    @property
+    def ready(self) -> bool:
+        """True once the counters have been seeded from poll_logs."""
+        return self._ready
+
+    async def start(self):
+        """Seed the counters and start the periodic rebuild."""
+        if self._running:
+            logger.warning("[RateLimiter] Already running, skipping start")
+            return
+        self._running = True
+        await self.rebuild()
+        self._task = asyncio.create_task(self._rebuild_loop())
+        logger.info(f"[RateLimiter] Started ({self.backend}, rebuild every {self.rebuild_seconds}s, ready={self._ready})")
+
+    async def stop(self):
+        if not self._running:
+            return
+        self._running = False
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        logger.info("[RateLimiter] Stopped")
+
+    async def _rebuild_loop(self):
+        while self._running:
+            try:
+                await asyncio.sleep(self.rebuild_seconds)
+                await self.rebuild()
+            except asyncio.CancelledError:
+                break
+            except Exception as e:
+                logger.error(f"[RateLimiter] Rebuild loop error: {e}")
+
+    async def rebuild(self) -> bool:
+        """Reload the counters from poll_logs. Returns False if the counts could not be read."""
+        started = time.monotonic()
+        now = datetime.now(timezone.utc)
+        try:
+            rows = await asyncio.to_thread(fetch_poll_hourly_counts, now - self.window)
+        except Exception as e:
+            logger.error(f"[RateLimiter] Could not read poll counts: {e}")
+            rows = None
+        if rows is None:
+            self._failed_rebuilds += 1
+            return False
+
+        counts = hourly_counts_by_key(rows)
+        recent_from = hour_of(now) - 1
+        self._memory.load(counts, recent_from)
+        if self.backend == "redis" and self._redis_available():
+            try:
+                await self._load_redis(counts, recent_from)
+            except Exception as e:
+                self._redis_failed(e)
+        self._ready = True
+        self._rebuilds += 1
+        self._last_rebuild_ms = (time.monotonic() - started) * 1000
+        logger.info(f"[RateLimiter] Loaded counts of {len(rows)} user/vehicle pairs ({len(counts)} keys) in {self._last_rebuild_ms:.0f}ms")
+        return True
+
+    async def _get_redis_client(self):
+        """Get Redis client and register the counter scripts"""
+        if not self.redis_client:
+            self.redis_client = redis.from_url(
+                REDIS_URL,
+                decode_responses=True,
+                socket_timeout=0.5,
+                socket_connect_timeout=0.5,
+            )
+            self._hit_script = self.redis_client.register_script(_HIT_SCRIPT)
+            self._load_script = self.redis_client.register_script(_LOAD_SCRIPT)
+        return self.redis_client
+
+    def _redis_available(self) -> bool:
+        return time.monotonic() >= self._redis_retry_at
+
+    def _redis_failed(self, e: Exception) -> None:
+        logger.warning(f"[RateLimiter] Redis unavailable, using in-process counters for {REDIS_RETRY_SECONDS}s: {e}")
+        self._redis_retry_at = time.monotonic() + REDIS_RETRY_SECONDS
+
+    def _ttl_seconds(self) -> int:
+        return int(self.window.total_seconds()) + 7200
+
+    async def _load_redis(self, counts: dict[str, dict[int, int]], recent_from: int) -> None:
+        await self._get_redis_client()
+        items = list(counts.items())
+        for i in range(0, len(items), REDIS_LOAD_CHUNK):
+            pipeline = self.redis_client.pipeline(transaction=False)
+            for key, buckets in items[i:i + REDIS_LOAD_CHUNK]:
+                args = [recent_from, self._ttl_seconds()]
+                for hour, polls in buckets.items():
+                    args.extend((hour, polls))
+                await self._load_script(keys=[REDIS_KEY_PREFIX + key], args=args, client=pipeline)
+            await pipeline.execute()
+
+    async def _apply(self, keys: list[str], now: datetime, amount: int) -> list[int]:
+        start_hour = hour_of(now - self.window)
+        hour = hour_of(now)
+        # The in-process counters are kept up to date in Redis mode too: they take over on Redis errors
+        totals = self._memory.hit(keys, start_hour, hour, amount)
+        if self.backend == "redis" and self._redis_available():
+            try:
+                await self._get_redis_client()
+                result = await self._hit_script(
+                    keys=[REDIS_KEY_PREFIX + key for key in keys],
+                    args=[start_hour, hour, amount, self._ttl_seconds()],
+                )
+                return [int(total) for total in result]
+            except Exception as e:
+                self._redis_failed(e)
+        if self.backend == "redis":
+            self._fallbacks += 1
+        return totals
+
+    async def hit(self, keys: list[str], now: datetime) -> list[int]:
+        """Count one poll for each key. Returns each key's window total before this poll."""
+        self._hits += 1
+        return await self._apply(keys, now, 1)
+
+    async def undo(self, keys: list[str], now: datetime) -> None:
+        """Take back a hit whose request was rejected."""
+        self._undone += 1
+        await self._apply(keys, now, -1)
+
+    async def count(self, keys: list[str], now: datetime) -> list[int]:
+        """Window totals of keys without counting a poll."""
+        return await self._apply(keys, now, 0)
+
+    def stats(self) -> dict[str, Any]:
+        redis_down = self.backend == "redis" and not self._redis_available()
+        return {
+            "backend": "memory (redis unavailable)" if redis_down else self.backend,
+            "ready": self._ready,
+            "keys": len(self._memory),
+            "hits": self._hits,
+            "undone": self._undone,
+            "rebuilds": self._rebuilds,
+            "failed_rebuilds": self._failed_rebuilds,
+            "redis_fallbacks": self._fallbacks,
+            "last_rebuild_ms": round(self._last_rebuild_ms, 1),
+        }
+
+
+# Global poll rate limiter instance
+poll_rate_limiter = PollRateLimiter()
@@ -0,0 +1,129 @@
+"""
+Vehicle Lane Executor
+
+Sharded executor that runs work keyed by vehicle id. Each key is hashed to
+one of a fixed number of lanes and every lane is drained by a single worker,
+so jobs for the same vehicle run strictly in submission order while
+different vehicles are processed in parallel.
+"""
+import asyncio
+import logging
+import zlib
+from typing import Any, Awaitable, Callable
+
+from app.config import VEHICLE_LANE_COUNT
+
+logger = logging.getLogger(__name__)
+
+# How long shutdown waits for queued lane jobs before cancelling them
+DEFAULT_DRAIN_TIMEOUT_SECONDS = 20.0
+
+
+class VehicleLaneExecutor:
+    """Runs coroutines in per-vehicle FIFO lanes."""
+
+    def __init__(self, lanes: int = VEHICLE_LANE_COUNT, drain_timeout: float = DEFAULT_DRAIN_TIMEOUT_SECONDS):
+        self.lanes = max(1, lanes)
+        self.drain_timeout = drain_timeout
+        self._queues: list[asyncio.Queue] = []
+        self._tasks: list[asyncio.Task] = []
+        self._running = False
+        self._completed = 0
+        self._failed = 0
+
+    @property
+    def is_running(self) -> bool:
+        return self._running
+
+    async def start(self):
+        """Start one worker per lane."""
+        if self._running:
+            logger.warning("[VehicleLanes] Already running, skipping start")
+            return
+
+        # Lanes are unbounded: the webhook ingest queue in front of them is the bounded stage
+        self._queues = [asyncio.Queue() for _ in range(self.lanes)]
+        self._tasks = [asyncio.create_task(self._lane_loop(i)) for i in range(self.lanes)]
+        self._running = True
+        logger.info(f"[VehicleLanes] Started {self.lanes} lane(s)")
+
+    async def stop(self):
+        """Finish queued jobs (bounded by drain_timeout), then stop the lane workers."""
+        if not self._running:
+            return
+        self._running = False
+
+        try:
+            await asyncio.wait_for(
+                asyncio.gather(*(q.join() for q in self._queues)),
+                timeout=self.drain_timeout,
+            )
+        except asyncio.TimeoutError:
+            logger.error(f"[VehicleLanes] Drain timed out after {self.drain_timeout}s")
+
+        for task in self._tasks:
+            task.cancel()
+        for task in self._tasks:
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+        self._tasks = []
+        self._queues = []
+        logger.info("[VehicleLanes] Stopped")
+
+    def lane_for(self, key: str) -> int:
+        """Stable lane index for a key (same vehicle → same lane across calls)."""
+        return zlib.crc32(key.encode("utf-8")) % self.lanes
+
+    def submit(self, key: str | None, fn: Callable[..., Awaitable[Any]], *args, **kwargs) -> asyncio.Future:
+        """
+        Queue fn(*args, **kwargs) in the lane for key and return a future for its result.
+        Submission is synchronous, so the order of submit() calls is the order
+        in which jobs for the same key run. Jobs without a key, or submitted
+        while the executor is stopped, are scheduled as plain tasks.
+        """
+        if not key or not self._running:
+            return asyncio.ensure_future(fn(*args, **kwargs))
+
+        future = asyncio.get_running_loop().create_future()
+        self._queues[self.lane_for(key)].put_nowait((fn, args, kwargs, future))
+        return future
+
+    async def run(self, key: str | None, fn: Callable[..., Awaitable[Any]], *args, **kwargs) -> Any:
+        """Run fn in the lane for key and wait for its result."""
+        return await self.submit(key, fn, *args, **kwargs)
+
+    def stats(self) -> dict[str, Any]:
+        """Pending jobs per lane and completion counters."""
+        depths = [q.qsize() for q in self._queues]
+        return {
+            "running": self._running,
+            "lanes": self.lanes,
+            "pending": sum(depths),
+            "max_lane_depth": max(depths) if depths else 0,
+            "completed": self._completed,
+            "failed": self._failed,
+        }
+
+    async def _lane_loop(self, lane: int):
+        """Execute jobs for one lane, one at a time."""
+        queue = self._queues[lane]
+        while True:
+            fn, args, kwargs, future = await queue.get()
+            try:
+                result = await fn(*args, **kwargs)
+                self._completed += 1
+                if not future.done():
+                    future.set_result(result)
+            except Exception as e:
+                self._failed += 1
+                logger.error(f"[VehicleLanes] Job failed in lane {lane}: {e}")
+                if not future.done():
+                    future.set_exception(e)
+            finally:
+                queue.task_done()
+
+
+# Global lane executor instance
+vehicle_lanes = VehicleLaneExecutor()
@@ -13,6 +13,8 @@ from app.storage.vehicle import save_vehicle_data_with_client
 from app.storage.charging import save_charging_sample, check_and_create_charging_session
 from app.lib.supabase import get_supabase_admin_client
 from app.storage.enode_account import get_enode_account_for_user
+from app.services.fanout import SINK_HA, fanout_dispatcher
+from app.services.vehicle_lanes import vehicle_lanes
 
 logger = logging.getLogger(__name__)
 
@@ -44,7 +46,8 @@ async def poll_vehicle_for_user(user_id: str) -> list[dict]:
             vehicle_id = vehicle.get("id")
 
             # Save vehicle data (will skip if stale based on lastSeen comparison)
-            was_saved = await save_vehicle_data_with_client(vehicle)
+            # Runs in the vehicle's lane so it cannot interleave with a webhook save
+            was_saved = await vehicle_lanes.run(vehicle_id, save_vehicle_data_with_client, vehicle)
 
             if was_saved:
                 logger.info(f"[✅ Poll] Vehicle {vehicle_id}: new data saved")
@@ -69,7 +72,7 @@ async def poll_and_push_to_ha(user_id: str) -> int:
     Poll Enode for a user's vehicles and push any updates to Home Assistant.
     Returns the number of vehicles that were updated and pushed.
     """
-    from app.api.webhook import push_to_homeassistant, _safe_background_task
+    from app.api.webhook import push_to_homeassistant
 
     updated_vehicles = await poll_vehicle_for_user(user_id)
 
@@ -82,11 +85,8 @@ async def poll_and_push_to_ha(user_id: str) -> int:
             "createdAt": datetime.now(timezone.utc).isoformat(),
             "source": "polling"  # Mark as from polling, not webhook
         }
-        # Fire-and-forget HA push
-        asyncio.create_task(_safe_background_task(
-            push_to_homeassistant(event, user_id),
-            "HA push (poll)"
-        ))
+        # Fire-and-forget HA push (shares the HA sink pool with webhook pushes)
+        fanout_dispatcher.dispatch(SINK_HA, push_to_homeassistant, event, user_id)
 
     return len(updated_vehicles)
 
@@ -0,0 +1,188 @@
+"""
+Webhook Idempotency
+
+Drops redelivered Enode webhook events by their event id, across uvicorn
+workers and restarts. Claims are made in Redis with SET NX EX (one pipeline
+per batch) for WEBHOOK_IDEMPOTENCY_PROCESSING_TTL_SECONDS, and extended to
+WEBHOOK_IDEMPOTENCY_TTL_SECONDS once the event has been processed (confirm),
+so an event whose worker died or restarted mid-processing is not dropped as
+a duplicate for a whole day. A failed event's claim is released. Each process also keeps an exact, bounded record of the ids it
+claimed recently, which takes over when Redis is unreachable: it has no
+false positives, so the fallback never drops a legitimate event, and ids
+older than WEBHOOK_IDEMPOTENCY_LOCAL_TTL_SECONDS (or beyond
+WEBHOOK_IDEMPOTENCY_LOCAL_MAX_IDS) are forgotten, so a redelivery that old
+is processed again while Redis is down.
+"""
+import logging
+import time
+from collections import OrderedDict
+from typing import Any
+
+import redis.asyncio as redis
+
+from app.config import (
+    REDIS_URL,
+    WEBHOOK_IDEMPOTENCY_LOCAL_MAX_IDS,
+    WEBHOOK_IDEMPOTENCY_LOCAL_TTL_SECONDS,
+    WEBHOOK_IDEMPOTENCY_PROCESSING_TTL_SECONDS,
+    WEBHOOK_IDEMPOTENCY_TTL_SECONDS,
+)
+
+logger = logging.getLogger(__name__)
+
+# After a Redis error, stay on the local record for this long before trying Redis again
+REDIS_RETRY_SECONDS = 30.0
+
+
+class RecentIdSet:
+    """
+    Exact set of ids with a fixed time-to-live, bounded to max_entries.
+    Ids are kept in insertion order, which is also expiry order, so expired
+    and excess ids are dropped from the front.
+    """
+
+    def __init__(self, ttl_seconds: float, max_entries: int):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max(1, max_entries)
+        self._entries: OrderedDict[str, float] = OrderedDict()
+        self.evictions = 0
+
+    def _expire(self, now: float):
+        entries = self._entries
+        while entries:
+            _, added_at = next(iter(entries.items()))
+            if now - added_at < self.ttl_seconds:
+                break
+            entries.popitem(last=False)
+
+    def add(self, key: str):
+        now = time.monotonic()
+        self._expire(now)
+        self._entries.pop(key, None)
+        self._entries[key] = now
+        if len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def discard(self, key: str):
+        self._entries.pop(key, None)
+
+    def __contains__(self, key: str) -> bool:
+        self._expire(time.monotonic())
+        return key in self._entries
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+class WebhookIdempotency:
+    """Claims Enode event ids so each event is processed once."""
+
+    def __init__(
+        self,
+        ttl_seconds: int = WEBHOOK_IDEMPOTENCY_TTL_SECONDS,
+        processing_ttl_seconds: int = WEBHOOK_IDEMPOTENCY_PROCESSING_TTL_SECONDS,
+        local_ttl_seconds: int = WEBHOOK_IDEMPOTENCY_LOCAL_TTL_SECONDS,
+        local_max_ids: int = WEBHOOK_IDEMPOTENCY_LOCAL_MAX_IDS,
+    ):
+        self.ttl_seconds = ttl_seconds
+        self.processing_ttl_seconds = min(processing_ttl_seconds, ttl_seconds)
+        self.redis_client = None
+        self._redis_retry_at = 0.0
+        self._local = RecentIdSet(min(local_ttl_seconds, ttl_seconds), local_max_ids)
+        self._claimed = 0
+        self._duplicates = 0
+        self._fallbacks = 0
+
+    async def _get_redis_client(self):
+        """Get Redis client for event id claims"""
+        if not self.redis_client:
+            self.redis_client = redis.from_url(
+                REDIS_URL,
+                decode_responses=True,
+                socket_timeout=0.5,
+                socket_connect_timeout=0.5,
+            )
+        return self.redis_client
+
+    def _key(self, event_id: str) -> str:
+        return f"webhook_event:{event_id}"
+
+    async def claim_batch(self, event_ids: list[str]) -> list[bool]:
+        """
+        Claim a batch of event ids for processing (processing_ttl_seconds; call
+        confirm_batch or release when done). Returns one flag per id: True if
+        this call claimed it (process the event), False if it was already claimed.
+        Uses one Redis pipeline for the whole batch; falls back to the local
+        record of recently claimed ids when Redis is unavailable.
+        """
+        if not event_ids:
+            return []
+
+        results = None
+        if time.monotonic() >= self._redis_retry_at:
+            try:
+                redis_client = await self._get_redis_client()
+                pipeline = redis_client.pipeline(transaction=False)
+                for event_id in event_ids:
+                    pipeline.set(self._key(event_id), "1", nx=True, ex=self.processing_ttl_seconds)
+                results = [bool(r) for r in await pipeline.execute()]
+            except Exception as e:
+                logger.warning(f"[Idempotency] Redis unavailable, using local record for {REDIS_RETRY_SECONDS}s: {e}")
+                self._redis_retry_at = time.monotonic() + REDIS_RETRY_SECONDS
+
+        if results is None:
+            self._fallbacks += 1
+            results = []
+            for event_id in event_ids:
+                claimed = event_id not in self._local
+                if claimed:
+                    # Recorded right away so a repeat within the same batch is a duplicate
+                    self._local.add(event_id)
+                results.append(claimed)
+
+        for event_id, claimed in zip(event_ids, results):
+            if claimed:
+                self._local.add(event_id)
+                self._claimed += 1
+            else:
+                self._duplicates += 1
+        return results
+
+    async def confirm_batch(self, event_ids: list[str]):
+        """Keep the claims of processed events for the full ttl_seconds (one pipeline)."""
+        if not event_ids or time.monotonic() < self._redis_retry_at:
+            return
+        try:
+            redis_client = await self._get_redis_client()
+            pipeline = redis_client.pipeline(transaction=False)
+            for event_id in event_ids:
+                pipeline.set(self._key(event_id), "1", ex=self.ttl_seconds)
+            await pipeline.execute()
+        except Exception as e:
+            logger.warning(f"[Idempotency] Failed to confirm {len(event_ids)} claim(s): {e}")
+
+    async def release(self, event_id: str):
+        """Drop a claim after processing failed, so Enode's retry is processed."""
+        self._local.discard(event_id)
+        if time.monotonic() < self._redis_retry_at:
+            return
+        try:
+            redis_client = await self._get_redis_client()
+            await redis_client.delete(self._key(event_id))
+        except Exception as e:
+            logger.warning(f"[Idempotency] Failed to release claim for event {event_id}: {e}")
+
+    def stats(self) -> dict[str, Any]:
+        return {
+            "backend": "local" if time.monotonic() < self._redis_retry_at else "redis",
+            "claimed": self._claimed,
+            "duplicates": self._duplicates,
+            "fallbacks": self._fallbacks,
+            "local_ids": len(self._local),
+            "local_evictions": self._local.evictions,
+        }
+
+
+# Global idempotency instance
+webhook_idempotency = WebhookIdempotency()
@@ -0,0 +1,146 @@
+"""
+Webhook Ingest Queue
+
+In-process queue with a bounded worker pool for verified Enode webhook
+batches. The /webhook/enode handler enqueues the batch and returns right
+away, so Enode's 5 second delivery timeout no longer depends on how long
+the Supabase writes for a batch take.
+"""
+import asyncio
+import logging
+import time
+from collections import deque
+from typing import Any
+
+from app.config import WEBHOOK_INGEST_MAX_QUEUE, WEBHOOK_INGEST_WORKERS
+
+logger = logging.getLogger(__name__)
+
+# How long shutdown waits for queued batches to be processed before giving up
+DEFAULT_DRAIN_TIMEOUT_SECONDS = 20.0
+
+
+class WebhookIngestQueue:
+    """Bounded queue of verified webhook payloads, drained by a pool of workers."""
+
+    def __init__(
+        self,
+        workers: int = WEBHOOK_INGEST_WORKERS,
+        max_queue: int = WEBHOOK_INGEST_MAX_QUEUE,
+        drain_timeout: float = DEFAULT_DRAIN_TIMEOUT_SECONDS,
+    ):
+        self.workers = max(1, workers)
+        self.max_queue = max(1, max_queue)
+        self.drain_timeout = drain_timeout
+        self._queue: asyncio.Queue | None = None
+        self._tasks: list[asyncio.Task] = []
+        self._running = False
+        # Enqueue timestamps of pending batches, oldest first (mirrors queue order)
+        self._pending_since: deque[float] = deque()
+        self._enqueued = 0
+        self._processed = 0
+        self._rejected = 0
+        self._failed = 0
+        self._max_wait_seconds = 0.0
+
+    @property
+    def is_running(self) -> bool:
+        return self._running
+
+    async def start(self):
+        """Start the worker pool."""
+        if self._running:
+            logger.warning("[WebhookIngest] Already running, skipping start")
+            return
+
+        self._queue = asyncio.Queue(maxsize=self.max_queue)
+        self._running = True
+        self._tasks = [
+            asyncio.create_task(self._worker_loop(i)) for i in range(self.workers)
+        ]
+        logger.info(f"[WebhookIngest] Started {self.workers} worker(s), max queue {self.max_queue}")
+
+    async def stop(self):
+        """Stop accepting new batches, drain what is queued, then stop the workers."""
+        if not self._running:
+            return
+        self._running = False
+
+        if self._queue is not None and not self._queue.empty():
+            logger.info(f"[WebhookIngest] Draining {self._queue.qsize()} queued batch(es)...")
+            try:
+                await asyncio.wait_for(self._queue.join(), timeout=self.drain_timeout)
+            except asyncio.TimeoutError:
+                logger.error(
+                    f"[WebhookIngest] Drain timed out after {self.drain_timeout}s, "
+                    f"{self._queue.qsize()} batch(es) dropped"
+                )
+
+        for task in self._tasks:
+            task.cancel()
+        for task in self._tasks:
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+        self._tasks = []
+        logger.info("[WebhookIngest] Stopped")
+
+    def submit(self, payload: dict | list) -> bool:
+        """
+        Enqueue a verified webhook payload without waiting.
+        Returns False when the queue is full (backpressure) or not running,
+        in which case the caller should ask Enode to retry later.
+        """
+        if not self._running or self._queue is None:
+            return False
+        try:
+            self._queue.put_nowait((payload, time.monotonic()))
+        except asyncio.QueueFull:
+            self._rejected += 1
+            logger.warning(f"[WebhookIngest] Queue full ({self.max_queue}), rejecting batch")
+            return False
+        self._pending_since.append(time.monotonic())
+        self._enqueued += 1
+        return True
+
+    def stats(self) -> dict[str, Any]:
+        """Queue depth, age of the oldest pending batch and throughput counters."""
+        now = time.monotonic()
+        oldest_age = now - self._pending_since[0] if self._pending_since else 0.0
+        return {
+            "running": self._running,
+            "workers": self.workers,
+            "depth": self._queue.qsize() if self._queue is not None else 0,
+            "max_queue": self.max_queue,
+            "oldest_age_seconds": round(oldest_age, 3),
+            "max_wait_seconds": round(self._max_wait_seconds, 3),
+            "enqueued": self._enqueued,
+            "processed": self._processed,
+            "rejected": self._rejected,
+            "failed": self._failed,
+        }
+
+    async def _worker_loop(self, worker_id: int):
+        """Take batches off the queue and run them through the webhook pipeline."""
+        from app.api.webhook import process_webhook_payload
+
+        while True:
+            payload, enqueued_at = await self._queue.get()
+            if self._pending_since:
+                self._pending_since.popleft()
+            wait = time.monotonic() - enqueued_at
+            self._max_wait_seconds = max(self._max_wait_seconds, wait)
+            try:
+                handled = await process_webhook_payload(payload)
+                self._processed += 1
+                logger.info(f"[WebhookIngest] Worker {worker_id} handled {handled} event(s) after {wait:.2f}s in queue")
+            except Exception as e:
+                self._failed += 1
+                logger.error(f"[WebhookIngest] Worker {worker_id} failed to process batch: {e}", exc_info=True)
+            finally:
+                self._queue.task_done()
+
+
+# Global ingest queue instance
+webhook_ingest_queue = WebhookIngestQueue()
@@ -0,0 +1,300 @@
+"""
+Webhook Replay
+
+Streams stored payloads from webhook_logs back through the webhook event
+pipeline, for throughput benchmarks and for rebuilding derived state
+(charging samples/sessions) after logic changes.
+
+Events are replayed in created_at order, through the same per-vehicle lanes
+as live traffic, at a fixed rate or as fast as possible. Outbound sinks
+(HA, Pushover, ABRP) are stubbed by default. Webhook-level idempotency and
+dedup are bypassed, since every stored event has already been claimed.
+
+Usage (CLI):
+    python -m app.services.webhook_replay --since 2025-01-01T00:00:00Z --rate 50
+"""
+import argparse
+import asyncio
+import contextvars
+import logging
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from typing import Any, Iterator
+from urllib.parse import urlparse
+
+import httpx
+
+from app.config import SUPABASE_URL
+from app.lib.supabase import get_supabase_admin_client
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PAGE_SIZE = 200
+
+# Status of the replay started from the admin API (one at a time per process)
+_replay_status: dict[str, Any] = {"running": False}
+_replay_task: asyncio.Task | None = None
+
+# Counter of the replay the current task works for (None outside a replay)
+_request_counter: contextvars.ContextVar[dict[str, int] | None] = contextvars.ContextVar(
+    "replay_request_counter", default=None
+)
+
+
+@contextmanager
+def count_supabase_requests() -> Iterator[dict[str, int]]:
+    """
+    Counts HTTP requests sent to the Supabase host by the replay, by
+    temporarily wrapping httpx.Client.send (the sync client used by
+    supabase-py). Only requests made in the replay's context are counted:
+    the replay task itself, threads it starts with asyncio.to_thread and
+    jobs it runs through counted(); concurrent live traffic is not.
+    """
+    counter = {"requests": 0}
+    supabase_host = urlparse(SUPABASE_URL or "").hostname
+    original_send = httpx.Client.send
+
+    def counting_send(self, request, *args, **kwargs):
+        active = _request_counter.get()
+        if active is not None and request.url.host == supabase_host:
+            active["requests"] += 1
+        return original_send(self, request, *args, **kwargs)
+
+    httpx.Client.send = counting_send
+    token = _request_counter.set(counter)
+    try:
+        yield counter
+    finally:
+        _request_counter.reset(token)
+        httpx.Client.send = original_send
+
+
+async def counted(counter: dict[str, int], fn, *args):
+    """Run fn with counter active (for jobs executed in another task, e.g. a vehicle lane)."""
+    token = _request_counter.set(counter)
+    try:
+        return await fn(*args)
+    finally:
+        _request_counter.reset(token)
+
+
+def _fetch_page(
+    after: tuple[str, str] | None,
+    since: str | None,
+    until: str | None,
+    user_id: str | None,
+    vehicle_id: str | None,
+    page_size: int,
+) -> list[dict]:
+    """One keyset page of webhook_logs ordered by (created_at, id)."""
+    supabase = get_supabase_admin_client()
+    query = supabase.table("webhook_logs") \
+        .select("id, created_at, payload") \
+        .order("created_at") \
+        .order("id") \
+        .limit(page_size)
+
+    if since:
+        query = query.gte("created_at", since)
+    if until:
+        query = query.lt("created_at", until)
+    if user_id:
+        query = query.eq("user_id", user_id)
+    if vehicle_id:
+        query = query.eq("vehicle_id", vehicle_id)
+    if after:
+        created_at, log_id = after
+        query = query.or_(f'created_at.gt."{created_at}",and(created_at.eq."{created_at}",id.gt.{log_id})')
+
+    return query.execute().data or []
+
+
+def _iter_events(payload: Any) -> list[dict]:
+    """Events contained in a stored payload (single event or batch)."""
+    if isinstance(payload, list):
+        return [e for e in payload if isinstance(e, dict)]
+    if isinstance(payload, dict):
+        return [payload]
+    return []
+
+
+async def _rebuild_charging(event: dict) -> int:
+    """
+    Re-derives the charging sample (and session) for a vehicle event without re-saving the vehicle.
+    Returns 1 if a sample was written, 0 otherwise.
+    """
+    from app.storage.charging import check_and_create_charging_session, save_charging_sample
+
+    vehicle = event.get("vehicle") or {}
+    user_id = (event.get("user") or {}).get("id")
+    vehicle_id = vehicle.get("id")
+    # Without an event id the sample cannot be matched to the one saved live, and would be duplicated
+    if not vehicle_id or not user_id or not vehicle.get("chargeState") or not event.get("id"):
+        return 0
+
+    sample_id = await save_charging_sample(vehicle, user_id, event.get("id"), replace=True)
+    if not sample_id:
+        return 0
+    await check_and_create_charging_session(vehicle_id, user_id)
+    return 1
+
+
+async def replay_webhook_logs(
+    since: str | None = None,
+    until: str | None = None,
+    user_id: str | None = None,
+    vehicle_id: str | None = None,
+    rate: float | None = None,
+    limit: int | None = None,
+    stub_sinks: bool = True,
+    rebuild_charging: bool = False,
+    page_size: int = DEFAULT_PAGE_SIZE,
+    status: dict[str, Any] | None = None,
+) -> dict[str, Any]:
+    """
+    Replays stored webhook events and returns throughput statistics.
+
+    Args:
+        since / until: created_at range (ISO timestamps, until is exclusive)
+        user_id / vehicle_id: only replay logs for this user / vehicle
+        rate: target events per second (None = as fast as possible)
+        limit: stop after this many events
+        stub_sinks: skip HA/Pushover/ABRP pushes (default) instead of sending them
+        rebuild_charging: only re-derive charging samples/sessions instead of running the full pipeline
+        status: optional dict updated in place with progress
+    """
+    from app.api.webhook import _event_lane_key, _process_webhook_event
+    from app.services.vehicle_lanes import vehicle_lanes
+
+    status = status if status is not None else {}
+    status.update({
+        "running": True,
+        "started_at": datetime.now(timezone.utc).isoformat(),
+        "filters": {"since": since, "until": until, "user_id": user_id, "vehicle_id": vehicle_id},
+        "rate": rate,
+        "stub_sinks": stub_sinks,
+        "rebuild_charging": rebuild_charging,
+        "logs": 0,
+        "events": 0,
+        "handled": 0,
+        "errors": 0,
+    })
+
+    interval = 1.0 / rate if rate and rate > 0 else 0.0
+    start = time.perf_counter()
+    next_at = start
+    after = None
+    done = False
+
+    with count_supabase_requests() as db:
+        while not done:
+            page = await asyncio.to_thread(_fetch_page, after, since, until, user_id, vehicle_id, page_size)
+            if not page:
+                break
+            after = (page[-1]["created_at"], page[-1]["id"])
+
+            for row in page:
+                status["logs"] += 1
+                for event in _iter_events(row.get("payload")):
+                    if limit and status["events"] >= limit:
+                        done = True
+                        break
+
+                    if interval:
+                        next_at += interval
+                        delay = next_at - time.perf_counter()
+                        if delay > 0:
+                            await asyncio.sleep(delay)
+
+                    status["events"] += 1
+                    try:
+                        if rebuild_charging:
+                            status["handled"] += await _rebuild_charging(event)
+                        else:
+                            status["handled"] += await vehicle_lanes.run(
+                                _event_lane_key(event), counted, db, _process_webhook_event, event, not stub_sinks
+                            )
+                    except Exception as e:
+                        status["errors"] += 1
+                        logger.error(f"[Replay] Event {event.get('id')} failed: {e}")
+                if done:
+                    break
+
+            elapsed = time.perf_counter() - start
+            status["db_requests"] = db["requests"]
+            status["elapsed_seconds"] = round(elapsed, 2)
+            status["events_per_second"] = round(status["events"] / elapsed, 1) if elapsed else 0.0
+
+            if len(page) < page_size:
+                break
+
+    elapsed = time.perf_counter() - start
+    status.update({
+        "running": False,
+        "finished_at": datetime.now(timezone.utc).isoformat(),
+        "elapsed_seconds": round(elapsed, 2),
+        "events_per_second": round(status["events"] / elapsed, 1) if elapsed else 0.0,
+        "db_requests": db["requests"],
+        "db_requests_per_event": round(db["requests"] / status["events"], 2) if status["events"] else 0.0,
+    })
+    logger.info(
+        f"[Replay] {status['events']} event(s) from {status['logs']} log(s) in {status['elapsed_seconds']}s "
+        f"({status['events_per_second']} ev/s, {status['db_requests_per_event']} DB requests/event)"
+    )
+    return status
+
+
+def start_replay(**kwargs) -> bool:
+    """Start a replay in the background (admin API). Returns False if one is already running."""
+    global _replay_task, _replay_status
+
+    if _replay_task and not _replay_task.done():
+        return False
+
+    _replay_status = {"running": True}
+
+    async def _run():
+        try:
+            await replay_webhook_logs(status=_replay_status, **kwargs)
+        except Exception as e:
+            logger.error(f"[Replay] Failed: {e}", exc_info=True)
+            _replay_status.update({"running": False, "error": str(e)})
+
+    _replay_task = asyncio.create_task(_run())
+    return True
+
+
+def get_replay_status() -> dict[str, Any]:
+    """Progress or result of the last replay started from the admin API."""
+    return dict(_replay_status)
+
+
+def _main():
+    parser = argparse.ArgumentParser(description="Replay stored Enode webhooks through the event pipeline")
+    parser.add_argument("--since", help="created_at lower bound (ISO timestamp)")
+    parser.add_argument("--until", help="created_at upper bound, exclusive (ISO timestamp)")
+    parser.add_argument("--user-id")
+    parser.add_argument("--vehicle-id")
+    parser.add_argument("--rate", type=float, help="events per second (default: as fast as possible)")
+    parser.add_argument("--limit", type=int)
+    parser.add_argument("--send-sinks", action="store_true", help="actually push to HA/Pushover/ABRP")
+    parser.add_argument("--rebuild-charging", action="store_true", help="only re-derive charging samples/sessions")
+    args = parser.parse_args()
+
+    result = asyncio.run(replay_webhook_logs(
+        since=args.since,
+        until=args.until,
+        user_id=args.user_id,
+        vehicle_id=args.vehicle_id,
+        rate=args.rate,
+        limit=args.limit,
+        stub_sinks=not args.send_sinks,
+        rebuild_charging=args.rebuild_charging,
+    ))
+    print(result)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    _main()
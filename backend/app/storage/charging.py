@@ -5,16 +5,18 @@ Saves charging samples from Enode vehicle webhooks and aggregates into sessions.
 """
 
 import logging
+import time
 from datetime import datetime, timedelta, timezone
-from typing import Any, Optional
+from typing import Optional
 from uuid import uuid4
 
+from app.lib.enode_vehicle import EnodeVehicle, decode_enode_vehicle
 from app.lib.supabase import get_supabase_admin_client
+from app.storage.vehicle_state import vehicle_state_entry
 
 logger = logging.getLogger(__name__)
 
-# Cache to track last saved state per vehicle (avoid duplicate saves)
-_last_sample_cache: dict[str, dict[str, Any]] = {}
+# Last saved sample per vehicle is kept in the vehicle state registry (avoid duplicate saves)
 SAMPLE_CACHE_TTL = 300  # 5 minutes - save at least once per 5 min even if unchanged
 
 
@@ -23,91 +25,65 @@ def _should_save_sample(vehicle_id: str, battery_level: int | None, is_charging:
     Determine if we should save a charging sample.
     Skip if nothing changed and vehicle is not charging.
     """
-    cache_key = vehicle_id
-    now = datetime.utcnow()
-
-    cached = _last_sample_cache.get(cache_key)
-
-    # Always save if charging
-    if is_charging:
-        _last_sample_cache[cache_key] = {
-            "battery_level": battery_level,
-            "is_charging": is_charging,
-            "saved_at": now
-        }
-        return True
-
-    # No cache = first time, save it
-    if not cached:
-        _last_sample_cache[cache_key] = {
-            "battery_level": battery_level,
-            "is_charging": is_charging,
-            "saved_at": now
-        }
-        return True
-
-    # Check if TTL expired (save periodically even if unchanged)
-    if now > cached["saved_at"] + timedelta(seconds=SAMPLE_CACHE_TTL):
-        _last_sample_cache[cache_key] = {
-            "battery_level": battery_level,
-            "is_charging": is_charging,
-            "saved_at": now
-        }
-        return True
-
-    # Check if battery level changed significantly (>= 1%)
-    old_level = cached.get("battery_level")
-    if old_level is not None and battery_level is not None:
-        if abs(battery_level - old_level) >= 1:
-            _last_sample_cache[cache_key] = {
-                "battery_level": battery_level,
-                "is_charging": is_charging,
-                "saved_at": now
-            }
-            return True
-
-    # Check if charging state changed
-    if cached.get("is_charging") != is_charging:
-        _last_sample_cache[cache_key] = {
-            "battery_level": battery_level,
-            "is_charging": is_charging,
-            "saved_at": now
-        }
-        return True
-
-    # Nothing changed, skip
-    return False
+    state = vehicle_state_entry(vehicle_id)
+    now = time.monotonic()
+
+    save = (
+        # Always save if charging
+        bool(is_charging)
+        # Nothing saved yet = first time, save it
+        or state.sample_saved_at is None
+        # TTL expired (save periodically even if unchanged)
+        or now > state.sample_saved_at + SAMPLE_CACHE_TTL
+        # Battery level changed significantly (>= 1%)
+        or (
+            state.sample_battery_level is not None and battery_level is not None
+            and abs(battery_level - state.sample_battery_level) >= 1
+        )
+        # Charging state changed
+        or state.sample_is_charging != is_charging
+    )
+
+    if save:
+        state.sample_saved_at = now
+        state.sample_battery_level = battery_level
+        state.sample_is_charging = is_charging
+    return save
 
 
 async def save_charging_sample(
     vehicle_data: dict,
     user_id: str,
-    source_event_id: Optional[str] = None
+    source_event_id: Optional[str] = None,
+    decoded: Optional[EnodeVehicle] = None,
+    replace: bool = False,
 ) -> Optional[str]:
     """
     Saves a charging sample from vehicle webhook data.
     Only saves if vehicle is charging OR state has changed significantly.
+    decoded is vehicle_data already decoded by the webhook pipeline (decoded here if not passed).
+    replace upserts on source_event_id, so re-deriving the sample of an event
+    (webhook replay) overwrites the existing one instead of adding another. It
+    also bypasses the unchanged-sample throttle, which runs on live time and
+    live per-vehicle state that a replay must neither depend on nor overwrite.
     Returns the sample ID if successful, None otherwise.
     """
     try:
-        # Extract charge state data
-        charge_state = vehicle_data.get("chargeState", {})
-        information = vehicle_data.get("information", {})
-        location = vehicle_data.get("location", {})
-        odometer_data = vehicle_data.get("odometer", {})
+        if decoded is None:
+            decoded = decode_enode_vehicle(vehicle_data)
 
         # Get vehicle_id - could be 'id' or 'vehicle_id'
-        vehicle_id = vehicle_data.get("id") or vehicle_data.get("vehicle_id")
+        vehicle_id = decoded.id
 
         if not vehicle_id:
             logger.warning("[save_charging_sample] No vehicle_id found in data")
             return None
 
         # Check if we should save (skip if nothing changed and not charging)
-        battery_level = charge_state.get("batteryLevel")
-        is_charging = charge_state.get("isCharging")
+        battery_level = decoded.battery_level
+        is_charging = decoded.is_charging
 
-        if not _should_save_sample(vehicle_id, battery_level, is_charging):
+        if not replace and not _should_save_sample(vehicle_id, battery_level, is_charging):
             logger.debug(f"[save_charging_sample] Skipping unchanged sample for vehicle {vehicle_id}")
             return None
 
@@ -115,13 +91,11 @@ async def save_charging_sample(
 
         # Build location point if available
         location_point = None
-        if location and location.get("latitude") and location.get("longitude"):
-            lat = location.get("latitude")
-            lon = location.get("longitude")
-            location_point = f"POINT({lon} {lat})"
+        if decoded.latitude and decoded.longitude:
+            location_point = f"POINT({decoded.longitude} {decoded.latitude})"
 
         sample_id = str(uuid4())
-        sample_time = vehicle_data.get("lastSeen") or datetime.now(timezone.utc).isoformat()
+        sample_time = decoded.last_seen or datetime.now(timezone.utc).isoformat()
 
         payload = {
             "id": sample_id,
@@ -130,22 +104,22 @@ async def save_charging_sample(
             "user_id": user_id,
             "sample_time": sample_time,
             "created_at": datetime.now(timezone.utc).isoformat(),
-            "is_charging": charge_state.get("isCharging"),
-            "is_plugged_in": charge_state.get("isPluggedIn"),
-            "is_fully_charged": charge_state.get("isFullyCharged"),
-            "is_reachable": vehicle_data.get("isReachable"),
-            "battery_level": charge_state.get("batteryLevel"),
-            "battery_capacity_kwh": charge_state.get("batteryCapacity"),
-            "charge_limit_percent": charge_state.get("chargeLimit"),
-            "charge_rate_kw": charge_state.get("chargeRate"),
-            "charge_time_remaining_min": charge_state.get("chargeTimeRemaining"),
-            "range_km": charge_state.get("range"),
-            "odometer_km": odometer_data.get("distance") if odometer_data else None,
-            "power_delivery_state": charge_state.get("powerDeliveryState"),
-            "vin": information.get("vin"),
-            "brand": information.get("brand"),
-            "model": information.get("model"),
-            "year": information.get("year"),
+            "is_charging": decoded.is_charging,
+            "is_plugged_in": decoded.is_plugged_in,
+            "is_fully_charged": decoded.is_fully_charged,
+            "is_reachable": decoded.is_reachable,
+            "battery_level": decoded.battery_level,
+            "battery_capacity_kwh": decoded.battery_capacity,
+            "charge_limit_percent": decoded.charge_limit,
+            "charge_rate_kw": decoded.charge_rate,
+            "charge_time_remaining_min": decoded.charge_time_remaining,
+            "range_km": decoded.range_km,
+            "odometer_km": decoded.odometer_km,
+            "power_delivery_state": decoded.power_delivery_state,
+            "vin": decoded.vin,
+            "brand": decoded.brand,
+            "model": decoded.model,
+            "year": decoded.year,
         }
 
         # Only add location if we have valid coordinates
@@ -157,7 +131,16 @@ async def save_charging_sample(
 
         logger.debug(f"[save_charging_sample] Saving sample for vehicle {vehicle_id}")
 
-        response = supabase.table("charging_samples").insert(payload).execute()
+        if replace and source_event_id:
+            # An existing sample keeps its id; only a new one takes sample_id
+            del payload["id"]
+            response = supabase.table("charging_samples") \
+                .upsert(payload, on_conflict="source_event_id") \
+                .execute()
+            if response.data:
+                sample_id = response.data[0].get("id", sample_id)
+        else:
+            response = supabase.table("charging_samples").insert(payload).execute()
 
         if response.data:
             logger.info(f"[save_charging_sample] Saved sample {sample_id} for vehicle {vehicle_id}")
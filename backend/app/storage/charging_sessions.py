@@ -123,7 +123,7 @@ async def get_vehicle_data_for_enrichment(vehicle_id: str) -> Optional[dict[str,
     """Get vehicle country code and odometer from vehicle cache."""
     supabase = get_supabase_admin_client()
     try:
-        response = supabase.table("vehicles").select("country_code, vehicle_cache").eq(
+        response = supabase.table("vehicles").select("country_code, odometer:vehicle_cache->odometer").eq(
             "vehicle_id", vehicle_id
         ).limit(1).execute()
         if response and response.data and len(response.data) > 0:
@@ -148,15 +148,10 @@ async def enrich_session_with_vehicle_data(session: dict[str, Any]) -> dict[str,
             if not session.get("currency"):
                 session["currency"] = default_currency
 
-            # Extract odometer from vehicle cache
-            vehicle_cache = vehicle_data.get("vehicle_cache") or {}
-            if isinstance(vehicle_cache, str):
-                import json
-                try:
-                    vehicle_cache = json.loads(vehicle_cache)
-                except (json.JSONDecodeError, TypeError):
-                    vehicle_cache = {}
-            odometer_data = vehicle_cache.get("odometer") or {}
+            # Odometer is selected straight from vehicle_cache->odometer
+            odometer_data = vehicle_data.get("odometer")
+            if not isinstance(odometer_data, dict):
+                odometer_data = {}
             odometer_km = odometer_data.get("distance")
             if odometer_km:
                 session["vehicle_odometer_km"] = odometer_km
@@ -108,8 +108,11 @@ async def get_enode_account_for_vehicle(vehicle_id: str) -> dict | None:
         return None
 
 
-async def get_all_active_accounts() -> list[dict]:
-    """Get all active Enode accounts (for webhook verification)."""
+async def get_all_active_accounts() -> list[dict] | None:
+    """
+    Get all active Enode accounts (for webhook verification).
+    Returns None if the query failed, so callers can tell it apart from "no active accounts".
+    """
     try:
         result = (
             supabase.table("enode_accounts")
@@ -120,7 +123,7 @@ async def get_all_active_accounts() -> list[dict]:
         return result.data or []
     except Exception as e:
         logger.error(f"[get_all_active_accounts] {e}")
-        return []
+        return None
 
 
 async def get_best_account_for_new_user() -> dict | None:
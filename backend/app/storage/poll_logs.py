@@ -1,25 +1,47 @@
 import logging
 from datetime import datetime
 from typing import Optional
+from postgrest.exceptions import APIError
+from app.config import POLL_LOG_BATCH_SIZE, POLL_LOG_FLUSH_SECONDS, POLL_LOG_MAX_BUFFER
 from app.lib.supabase import get_supabase_admin_client
+from app.services.log_writer import BufferedLogWriter
+
+logger = logging.getLogger(__name__)
 
 # Initialize Supabase admin client
 supabase = get_supabase_admin_client()
 
+def _without_vehicle(row: dict) -> dict | None:
+    """A poll whose vehicle was deleted before the flush still counts for its user."""
+    if row.get("vehicle_id") is None:
+        return None
+    return {**row, "vehicle_id": None}
+
+# Batched writer for poll_logs inserts (started and flushed in the app lifespan).
+# poll_logs is the ledger the rate limits are rebuilt from, so the writer never drops rows.
+poll_log_writer = BufferedLogWriter(
+    "poll_logs",
+    batch_size=POLL_LOG_BATCH_SIZE,
+    flush_interval=POLL_LOG_FLUSH_SECONDS,
+    max_buffer=POLL_LOG_MAX_BUFFER,
+    lossless=True,
+    repair_row=_without_vehicle,
+)
+
 async def log_poll(user_id: str, endpoint: str, timestamp: datetime, vehicle_id: Optional[str] = None) -> None:
     """
     Insert a new record into poll_logs when a user polls an endpoint.
     Optionally include the vehicle_id.
+    The insert is queued on poll_log_writer and flushed in batches, so the
+    count queries below may lag behind by up to POLL_LOG_FLUSH_SECONDS.
     """
-    log_entry = {
+    # Every row carries the same keys: a multi-row insert needs uniform columns
+    await poll_log_writer.put({
         "user_id": user_id,
         "endpoint": endpoint,
-        "created_at": timestamp.isoformat()
-    }
-    if vehicle_id:
-        log_entry["vehicle_id"] = vehicle_id
-        
-    supabase.table("poll_logs").insert(log_entry).execute()
+        "created_at": timestamp.isoformat(),
+        "vehicle_id": vehicle_id or None,
+    })
 
 async def count_polls_since(user_id: str, since: datetime) -> int:
     """
@@ -59,3 +81,19 @@ async def count_polls_in_period(user_id: str, start_time: datetime, end_time: da
         .lte("created_at", end_time.isoformat()) \
         .execute()
     return resp.count or 0
+
+def fetch_poll_hourly_counts(since: datetime) -> list[dict] | None:
+    """
+    Poll counts per user, vehicle and hour since the given datetime, in one call
+    (get_poll_hourly_counts RPC, supabase/sql_definitions/get_poll_hourly_counts.sql).
+    One entry per user and vehicle: {user_id, vehicle_id (or None), hours: {"<hours since epoch>": polls}}.
+    Returns None if the function is not deployed (PGRST202).
+    """
+    try:
+        resp = supabase.rpc("get_poll_hourly_counts", {"p_since": since.isoformat()}).execute()
+    except APIError as e:
+        if e.code == "PGRST202":
+            logger.warning("[⚠️ fetch_poll_hourly_counts] RPC not found")
+            return None
+        raise
+    return resp.data or []
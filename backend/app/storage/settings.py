@@ -1,11 +1,16 @@
 # 📄 backend/app/storage/settings.py
 
 import logging
+import time
+from typing import Any
 from app.lib.supabase import get_supabase_admin_client
 
 logger = logging.getLogger(__name__)
 supabase = get_supabase_admin_client()
 
+# {name: (expires_at monotonic, setting)} for get_cached_setting_by_name; cleared on every write
+_setting_cache: dict[str, tuple[float, Any]] = {}
+
 async def get_all_settings():
     """Retrieves all application settings from the database."""
     try:
@@ -24,8 +29,18 @@ async def get_setting_by_name(name: str):
         logger.error(f"[❌ get_setting_by_name] {e}")
         return None
 
+async def get_cached_setting_by_name(name: str, ttl_seconds: float):
+    """get_setting_by_name, cached for ttl_seconds (hot paths such as rate limiting)."""
+    cached = _setting_cache.get(name)
+    if cached is not None and time.monotonic() < cached[0]:
+        return cached[1]
+    setting = await get_setting_by_name(name)
+    _setting_cache[name] = (time.monotonic() + ttl_seconds, setting)
+    return setting
+
 async def add_setting(setting: dict):
     """Adds a new setting to the database."""
+    _setting_cache.clear()
     try:
         res = supabase.table("settings").insert(setting).execute()
         return res.data or []
@@ -35,6 +50,7 @@ async def add_setting(setting: dict):
 
 async def update_setting(setting_id: str, setting: dict):
     """Updates an existing setting in the database."""
+    _setting_cache.clear()
     try:
         res = supabase.table("settings").update(setting).eq("id", setting_id).execute()
         return res.data or []
@@ -44,6 +60,7 @@ async def update_setting(setting_id: str, setting: dict):
 
 async def delete_setting(setting_id: str):
     """Deletes a setting from the database."""
+    _setting_cache.clear()
     try:
         res = supabase.table("settings").delete().eq("id", setting_id).execute()
         return res.data or []
@@ -565,6 +565,7 @@ async def update_user_subscription(user_id: str, tier: str, status: str = "activ
             .update({"tier": tier, "subscription_status": status}) \
             .eq("id", user_id) \
             .execute()
+        invalidate_user_rate_limit_data(user_id)
         logger.info(f"[DB] Updated user {user_id} to tier {tier}, status {status}")
         return result
     except Exception as e:
@@ -615,7 +616,8 @@ async def update_user(user_id: str, **kwargs):
         
         if not result.data:
             raise Exception(f"No rows were updated for user {user_id}")
-        
+
+        invalidate_user_rate_limit_data(user_id)
         logger.info(f"[✅] Updated user {user_id} with: {update_data}")
         return result
     except Exception as e:
@@ -823,6 +825,30 @@ async def get_user_rate_limit_data(user_id: str) -> dict | None:
         logger.error(f"[❌ get_user_rate_limit_data] {e}")
         return None
 
+def _rate_limit_cache_key(user_id: str) -> str:
+    return f"rate_limit_data:{user_id}"
+
+
+async def get_cached_user_rate_limit_data(user_id: str, ttl_seconds: int = CACHE_TTL_SECONDS) -> dict | None:
+    """
+    get_user_rate_limit_data, cached for ttl_seconds. Token purchases and tier
+    changes drop the cached copy; token use updates it in place.
+    """
+    key = _rate_limit_cache_key(user_id)
+    cached = _get_cached(key)
+    if cached is not None:
+        return cached
+    data = await get_user_rate_limit_data(user_id)
+    if data:
+        _set_cached(key, data, ttl_seconds)
+    return data
+
+
+def invalidate_user_rate_limit_data(user_id: str) -> None:
+    """Drop the cached rate limit data of a user (tier or token balance changed)."""
+    _cache.pop(_rate_limit_cache_key(user_id), None)
+
+
 async def decrement_purchased_api_tokens(user_id: str) -> None:
     """
     Atomically decrements the user's purchased_api_tokens by 1.
@@ -832,6 +858,9 @@ async def decrement_purchased_api_tokens(user_id: str) -> None:
     supabase_async = await get_supabase_admin_async_client()
     try:
         await supabase_async.rpc('decrement_user_tokens', {'p_user_id': user_id}).execute()
+        cached = _get_cached(_rate_limit_cache_key(user_id))
+        if cached is not None:
+            cached["purchased_api_tokens"] = max(0, (cached.get("purchased_api_tokens") or 0) - 1)
     except Exception as e:
         logger.error(f"[❌ decrement_purchased_api_tokens] Failed to decrement tokens for user {user_id}: {e}")
         # We might want to raise an exception here to fail the request if the decrement fails
@@ -848,6 +877,7 @@ async def add_purchased_api_tokens(user_id: str, quantity: int) -> None:
     supabase_async = await get_supabase_admin_async_client()
     try:
         await supabase_async.rpc('add_user_tokens', {'p_user_id': user_id, 'p_quantity': quantity}).execute()
+        invalidate_user_rate_limit_data(user_id)
         logger.info(f"[✅] Added {quantity} tokens to user {user_id}")
     except Exception as e:
         logger.error(f"[❌ add_purchased_api_tokens] Failed to add {quantity} tokens for user {user_id}: {e}")
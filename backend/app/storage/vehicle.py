@@ -1,36 +1,48 @@
 # 📄 backend/app/storage/vehicle.py
 
+import asyncio
 from datetime import datetime, timedelta
-import json
 import logging
 from collections import defaultdict
 from typing import Any
-import reverse_geocode
+from postgrest.exceptions import APIError
 from app.lib.supabase import get_supabase_admin_client
+from app.lib.vehicle_cache import hot_columns, load_vehicle_cache
+from app.services.country_backfill import start_country_backfill
+from app.services.geocoding import country_geocoder
+from app.services.ha_status import ha_status_cache
+from app.services.ha_stream import ha_stream_broker
+from app.lib.vehicle_delta import remember_vehicle
+from app.storage.vehicle_state import (
+    find_vehicle_state_by_vin,
+    forget_user_vehicles,
+    get_vehicle_state,
+    record_vehicle_state,
+)
+from app.storage.vehicle_pairing import (
+    find_or_create_vehicle_pairing,
+    forget_user_pairings,
+    get_contribution,
+    get_vehicle_pairing,
+    rename_paired_vehicle,
+    set_contribution,
+)
 from app.logic.vehicle import handle_offline_notification_if_needed
 from app.services.admin_notifications import notify_admins_new_vehicle
 
 logger = logging.getLogger(__name__)
 
+# Set to False once the upsert_vehicle_if_newer RPC turns out to be missing (PGRST202)
+_upsert_rpc_available = True
+# Set to False once the hot columns turn out to be missing (PGRST204, vehicle_hot_columns.sql not applied)
+_hot_columns_available = True
+_HOT_COLUMNS = tuple(hot_columns({}))
+
 # Simple TTL cache for expensive operations
 _cache: dict[str, dict[str, Any]] = {}
 CACHE_TTL_SECONDS = 300  # 5 minutes
 
 
-def _get_country_code_from_location(lat: float, lon: float) -> str | None:
-    """
-    Get ISO 3166-1 alpha-2 country code from latitude/longitude.
-    Returns None if geocoding fails.
-    """
-    try:
-        results = reverse_geocode.search([(lat, lon)])
-        if results:
-            return results[0].get("country_code")
-    except Exception as e:
-        logger.warning(f"[⚠️ Reverse geocode failed] lat={lat}, lon={lon}: {e}")
-    return None
-
-
 def _get_cached(key: str) -> Any | None:
     """Get value from cache if not expired."""
     if key in _cache:
@@ -50,6 +62,22 @@ def _set_cached(key: str, value: Any, ttl_seconds: int = CACHE_TTL_SECONDS) -> N
     }
     logger.debug(f"[CACHE SET] {key} (TTL: {ttl_seconds}s)")
 
+def _publish_ha_status(db_id: str, vehicle_id: str, user_id: str, vehicle_cache: dict) -> None:
+    """Render the HA status document of a saved vehicle and send it to the owner's HA streams."""
+    ha_stream_broker.publish(ha_status_cache.put(db_id, vehicle_id, user_id, vehicle_cache))
+
+
+def get_vehicles_for_user(user_id: str, columns: str = "*") -> list[dict] | None:
+    """All of a user's vehicle rows in one query (None on error, so callers can tell it from no vehicles)."""
+    supabase = get_supabase_admin_client()
+    try:
+        response = supabase.table("vehicles").select(columns).eq("user_id", user_id).execute()
+        return response.data or []
+    except Exception as e:
+        logger.error(f"[❌ get_vehicles_for_user] {e}")
+        return None
+
+
 def get_all_cached_vehicles(user_id: str) -> list[dict]:
     """
     Return all cached vehicles for a specific user.
@@ -67,12 +95,76 @@ def get_all_cached_vehicles(user_id: str) -> list[dict]:
         logger.error(f"[❌ get_all_cached_vehicles] Exception: {e}")
         return []
 
+def _hot_columns(vehicle_cache: dict) -> dict:
+    """hot_columns() for a vehicles write, or {} once the columns turned out to be missing."""
+    return hot_columns(vehicle_cache) if _hot_columns_available else {}
+
+
+def _execute_vehicle_write(write, payload: dict):
+    """
+    Runs write(payload).execute(). If the hot columns do not exist yet (PGRST204) the
+    write is retried without them, and later writes leave them out for the rest of
+    the process lifetime.
+    """
+    global _hot_columns_available
+    try:
+        return write(payload).execute()
+    except APIError as e:
+        if e.code != "PGRST204" or not any(column in payload for column in _HOT_COLUMNS):
+            raise
+        _hot_columns_available = False
+        logger.warning("[⚠️ vehicles] Hot columns not found, writing without them (apply vehicle_hot_columns.sql)")
+        return write({k: v for k, v in payload.items() if k not in _HOT_COLUMNS}).execute()
+
+
+def _upsert_vehicle_if_newer(
+    supabase,
+    vehicle_id: str,
+    user_id: str,
+    vendor: str | None,
+    online: bool,
+    vehicle_cache: dict,
+    vin: str | None,
+    country_code: str | None,
+) -> dict | None:
+    """
+    Calls the upsert_vehicle_if_newer RPC (supabase/sql_definitions/upsert_vehicle_if_newer.sql).
+    Returns the result row (id, written, previous_online, is_new, relinked_from, country_code),
+    or None if the function does not exist yet (PGRST202) – callers then fall back
+    to the select-then-upsert path for the rest of the process lifetime.
+    """
+    global _upsert_rpc_available
+    try:
+        res = supabase.rpc("upsert_vehicle_if_newer", {
+            "p_vehicle_id": vehicle_id,
+            "p_user_id": user_id,
+            "p_vendor": vendor,
+            "p_online": online,
+            "p_vehicle_cache": vehicle_cache,
+            "p_vin": vin,
+            "p_country_code": country_code,
+            **{f"p_{column}": value for column, value in hot_columns(vehicle_cache).items()},
+        }).execute()
+    except APIError as e:
+        if e.code == "PGRST202":
+            _upsert_rpc_available = False
+            logger.warning("[⚠️ upsert_vehicle_if_newer] RPC not found, falling back to select-then-upsert")
+            return None
+        raise
+    rows = res.data or []
+    return rows[0] if rows else {"written": False}
+
+
 async def save_vehicle_data_with_client(vehicle: dict):
     from app.storage.subscription import update_linked_vehicle_count
     """
     Save vehicle cache entry, matching by VIN if available to handle relinks.
     When a user relinks their car, Enode may assign a new vehicle_id.
     By matching on VIN, we update the existing record instead of creating duplicates.
+
+    The write goes through the upsert_vehicle_if_newer RPC, which does the
+    staleness check, relink and upsert atomically in one round trip. If the
+    function is not deployed, the previous select-then-upsert path is used.
     """
     supabase = get_supabase_admin_client()
     try:
@@ -80,7 +172,6 @@ async def save_vehicle_data_with_client(vehicle: dict):
         user_id    = vehicle.get("userId") or vehicle.get("user_id")
         vendor     = vehicle.get("vendor")
         online     = vehicle.get("isReachable", False)
-        data_str   = json.dumps(vehicle)
         updated_at = datetime.utcnow().isoformat()
 
         # Extract VIN for matching
@@ -89,47 +180,52 @@ async def save_vehicle_data_with_client(vehicle: dict):
         if not vehicle_id or not user_id:
             raise ValueError("Missing vehicle_id or user_id in vehicle object")
 
-        # Check cache for previous online status (avoid DB query on every webhook)
-        cache_key = f"vehicle_online_{vehicle_id}"
-        online_old = _get_cached(cache_key)
+        brand = vehicle.get("information", {}).get("brand") or vendor or ""
 
         # Check if vehicle exists - first by vehicle_id, then by VIN
         is_new_vehicle = False
         existing_db_id = None
         old_vehicle_id = None
-
+        online_old = None
         existing_last_seen = None
-        if online_old is None:
+        existing_country = None
+
+        # Known vehicle: everything we need is in the write-through state store (no reads)
+        state = get_vehicle_state(vehicle_id)
+        if state is None and vin:
+            state = find_vehicle_state_by_vin(user_id, vin)
+            if state:
+                old_vehicle_id = state.vehicle_id
+                logger.info(f"[🔄 VIN Match] Found existing vehicle by VIN {vin}: updating {old_vehicle_id} -> {vehicle_id}")
+
+        use_rpc = _upsert_rpc_available
+
+        if state:
+            existing_db_id = state.db_id
+            online_old = state.online
+            existing_last_seen = state.last_seen
+            existing_country = state.country_code
+        elif not use_rpc:
             try:
                 # First check by vehicle_id
-                existing = supabase.table("vehicles").select("id, online, vehicle_id, vehicle_cache").eq("vehicle_id", vehicle_id).maybe_single().execute()
+                existing = supabase.table("vehicles").select("id, online, vehicle_id, vehicle_cache, country_code").eq("vehicle_id", vehicle_id).maybe_single().execute()
                 if existing and existing.data:
                     online_old = existing.data.get("online")
                     existing_db_id = existing.data.get("id")
+                    existing_country = existing.data.get("country_code")
                     # Extract existing lastSeen for staleness check
-                    existing_cache = existing.data.get("vehicle_cache")
-                    if existing_cache:
-                        try:
-                            existing_cache_data = json.loads(existing_cache) if isinstance(existing_cache, str) else existing_cache
-                            existing_last_seen = existing_cache_data.get("lastSeen")
-                        except (json.JSONDecodeError, TypeError):
-                            pass
+                    existing_last_seen = load_vehicle_cache(existing.data.get("vehicle_cache")).get("lastSeen")
                 elif vin:
                     # Vehicle ID not found - check if same VIN exists for this user (relink case)
                     # Uses indexed vin column for fast lookup
-                    existing_by_vin = supabase.table("vehicles").select("id, online, vehicle_id, vehicle_cache").eq("user_id", user_id).eq("vin", vin).maybe_single().execute()
+                    existing_by_vin = supabase.table("vehicles").select("id, online, vehicle_id, vehicle_cache, country_code").eq("user_id", user_id).eq("vin", vin).maybe_single().execute()
                     if existing_by_vin and existing_by_vin.data:
                         existing_db_id = existing_by_vin.data.get("id")
                         old_vehicle_id = existing_by_vin.data.get("vehicle_id")
                         online_old = existing_by_vin.data.get("online")
+                        existing_country = existing_by_vin.data.get("country_code")
                         # Extract existing lastSeen for staleness check
-                        existing_cache = existing_by_vin.data.get("vehicle_cache")
-                        if existing_cache:
-                            try:
-                                existing_cache_data = json.loads(existing_cache) if isinstance(existing_cache, str) else existing_cache
-                                existing_last_seen = existing_cache_data.get("lastSeen")
-                            except (json.JSONDecodeError, TypeError):
-                                pass
+                        existing_last_seen = load_vehicle_cache(existing_by_vin.data.get("vehicle_cache")).get("lastSeen")
                         logger.info(f"[🔄 VIN Match] Found existing vehicle by VIN {vin}: updating {old_vehicle_id} -> {vehicle_id}")
                     else:
                         is_new_vehicle = True
@@ -151,20 +247,13 @@ async def save_vehicle_data_with_client(vehicle: dict):
         lat = location.get("latitude") if location else None
         lon = location.get("longitude") if location else None
 
-        # Check if we need to determine country_code (only if we have location and not already cached)
+        # Determine country_code only if the vehicle doesn't have one yet
         country_code = None
         try:
-            # First check if vehicle already has country_code cached
-            if existing_db_id:
-                existing = supabase.table("vehicles").select("country_code").eq("id", existing_db_id).maybe_single().execute()
-            else:
-                existing = supabase.table("vehicles").select("country_code").eq("vehicle_id", vehicle_id).maybe_single().execute()
-            existing_country = existing.data.get("country_code") if existing and existing.data else None
-
             if not existing_country:
                 if lat is not None and lon is not None:
-                    # Reverse geocode to get country code from GPS
-                    country_code = _get_country_code_from_location(lat, lon)
+                    # Reverse geocode to get country code from GPS (a cache miss searches the KD-tree)
+                    country_code = await asyncio.to_thread(country_geocoder.country_code, lat, lon)
                     if country_code:
                         logger.info(f"[🌍 Country cached] Vehicle {vehicle_id}: {country_code} (from GPS)")
                 else:
@@ -177,46 +266,98 @@ async def save_vehicle_data_with_client(vehicle: dict):
             # Column might not exist yet - ignore
             logger.debug(f"[🌍] Could not check/set country_code: {e}")
 
-        payload = {
-            "vehicle_id":   vehicle_id,
-            "user_id":      user_id,
-            "vendor":       vendor,
-            "online":       online,
-            "vehicle_cache": data_str,
-            "updated_at":   updated_at
-        }
-
-        # Include VIN for indexed lookups
-        if vin:
-            payload["vin"] = vin
+        # Include what the paired ABRP record contributes, so this row is written once
+        vehicle_cache = merge_counterpart_contribution(vehicle, user_id, "enode", vehicle_id, brand)
 
-        # Only include country_code if we determined a new one
-        if country_code:
-            payload["country_code"] = country_code
-
-        # If we found existing vehicle by VIN (with different vehicle_id), update by db id
-        # This handles the relink case where Enode assigns a new vehicle_id
-        if existing_db_id and old_vehicle_id:
-            # Update existing record with new vehicle_id
-            res = supabase.table("vehicles").update(payload).eq("id", existing_db_id).execute()
-            logger.info(f"[🔄 Relink] Updated vehicle {existing_db_id}: {old_vehicle_id} -> {vehicle_id}")
+        if use_rpc:
+            row = _upsert_vehicle_if_newer(
+                supabase,
+                vehicle_id=vehicle_id,
+                user_id=user_id,
+                vendor=vendor,
+                online=online,
+                vehicle_cache=vehicle_cache,
+                vin=vin,
+                country_code=country_code,
+            )
+            if row is None:
+                # RPC not deployed – redo this save on the select-then-upsert path
+                return await save_vehicle_data_with_client(vehicle)
+            if not row.get("written"):
+                logger.info(f"[⏭️ Skip stale] Vehicle {vehicle_id}: stored lastSeen is newer than {incoming_last_seen}")
+                return False
+            existing_db_id = row.get("id")
+            online_old = row.get("previous_online")
+            is_new_vehicle = bool(row.get("is_new"))
+            old_vehicle_id = row.get("relinked_from")
+            existing_country = row.get("country_code") or existing_country
+            if old_vehicle_id:
+                logger.info(f"[🔄 Relink] Updated vehicle {existing_db_id}: {old_vehicle_id} -> {vehicle_id}")
+            res = None
         else:
-            # Normal upsert by vehicle_id
-            res = supabase.table("vehicles").upsert(payload, on_conflict=["vehicle_id"]).execute()
+            payload = {
+                "vehicle_id":   vehicle_id,
+                "user_id":      user_id,
+                "vendor":       vendor,
+                "online":       online,
+                "vehicle_cache": vehicle_cache,
+                "updated_at":   updated_at,
+                **_hot_columns(vehicle_cache),
+            }
 
-        if not getattr(res, "data", None):
-            logger.warning(f"⚠️ save_vehicle_data_with_client: No data returned, possible failure")
-            return False
+            # Include VIN for indexed lookups
+            if vin:
+                payload["vin"] = vin
+
+            # Only include country_code if we determined a new one
+            if country_code:
+                payload["country_code"] = country_code
+
+            # If we found existing vehicle by VIN (with different vehicle_id), update by db id
+            # This handles the relink case where Enode assigns a new vehicle_id
+            if existing_db_id and old_vehicle_id:
+                # Update existing record with new vehicle_id
+                res = _execute_vehicle_write(
+                    lambda p: supabase.table("vehicles").update(p).eq("id", existing_db_id), payload
+                )
+                logger.info(f"[🔄 Relink] Updated vehicle {existing_db_id}: {old_vehicle_id} -> {vehicle_id}")
+            else:
+                # Normal upsert by vehicle_id
+                res = _execute_vehicle_write(
+                    lambda p: supabase.table("vehicles").upsert(p, on_conflict=["vehicle_id"]), payload
+                )
+
+            if not getattr(res, "data", None):
+                logger.warning(f"⚠️ save_vehicle_data_with_client: No data returned, possible failure")
+                return False
 
         logger.info(f"✅ Vehicle {vehicle_id} saved for user {user_id}")
 
-        # Cross-populate data between Enode and ABRP if both exist for same car
-        brand = vehicle.get("information", {}).get("brand") or vendor or ""
-        if brand:
-            await cross_populate_vehicle_data(user_id, "enode", brand.upper())
+        # Baseline for delta detection on the next update (covers webhook and poll saves)
+        remember_vehicle(vehicle)
+
+        # Write-through: the next save for this vehicle needs no reads
+        saved_db_id = res.data[0].get("id") if res is not None and isinstance(res.data, list) and res.data else existing_db_id
+        if saved_db_id:
+            record_vehicle_state(
+                db_id=saved_db_id,
+                vehicle_id=vehicle_id,
+                user_id=user_id,
+                vin=vin,
+                online=online,
+                last_seen=incoming_last_seen or existing_last_seen,
+                country_code=country_code or existing_country,
+                source="enode",
+                brand=brand,
+                old_vehicle_id=old_vehicle_id,
+            )
+            # Render the HA status document now, so polls are served without a read
+            _publish_ha_status(saved_db_id, vehicle_id, user_id, vehicle_cache)
 
-        # Cache the current online status for next webhook (TTL: 1 hour)
-        _set_cached(cache_key, online, ttl_seconds=3600)
+        # Pass changed Enode data on to the paired ABRP record, if any
+        if old_vehicle_id:
+            rename_paired_vehicle(old_vehicle_id, vehicle_id)
+        await cross_populate_vehicle_data(vehicle, "enode", vehicle_id)
 
         # Handle offline notification only if status changed
         if not is_new_vehicle and online_old != online:
@@ -256,20 +397,22 @@ async def save_abrp_vehicle(vehicle_cache: dict, user_id: str, abrp_vehicle_id:
     """
     supabase = get_supabase_admin_client()
     try:
-        data_str = json.dumps(vehicle_cache)
         updated_at = datetime.utcnow().isoformat()
 
         # Extract brand info for vendor field
         vendor = vehicle_cache.get("vendor", "abrp")
+        brand = vehicle_cache.get("information", {}).get("brand") or vendor or ""
+        merged_cache = merge_counterpart_contribution(vehicle_cache, user_id, "abrp", abrp_vehicle_id, brand)
 
         payload = {
             "vehicle_id": abrp_vehicle_id,
             "user_id": user_id,
             "vendor": vendor,
             "online": True,
-            "vehicle_cache": data_str,
+            "vehicle_cache": merged_cache,
             "updated_at": updated_at,
             "source": "abrp",
+            **_hot_columns(merged_cache),
         }
 
         # Reverse geocode location for country_code (if not already cached)
@@ -278,27 +421,46 @@ async def save_abrp_vehicle(vehicle_cache: dict, user_id: str, abrp_vehicle_id:
         lon = location.get("longitude") if location else None
 
         is_new_vehicle = False
+        existing_country = None
         try:
-            existing = supabase.table("vehicles").select("country_code").eq("vehicle_id", abrp_vehicle_id).maybe_single().execute()
-            is_new_vehicle = not (existing and existing.data)
-            existing_country = existing.data.get("country_code") if existing and existing.data else None
+            state = get_vehicle_state(abrp_vehicle_id)
+            if state:
+                existing_country = state.country_code
+            else:
+                existing = supabase.table("vehicles").select("country_code").eq("vehicle_id", abrp_vehicle_id).maybe_single().execute()
+                is_new_vehicle = not (existing and existing.data)
+                existing_country = existing.data.get("country_code") if existing and existing.data else None
 
             if not existing_country and lat is not None and lon is not None:
-                country_code = _get_country_code_from_location(lat, lon)
+                country_code = await asyncio.to_thread(country_geocoder.country_code, lat, lon)
                 if country_code:
                     payload["country_code"] = country_code
                     logger.info(f"[🌍 Country cached] ABRP vehicle {abrp_vehicle_id}: {country_code}")
         except Exception as e:
             logger.debug(f"[🌍] Could not check/set country_code for ABRP vehicle: {e}")
 
-        res = supabase.table("vehicles").upsert(
-            payload, on_conflict=["vehicle_id"]
-        ).execute()
+        res = _execute_vehicle_write(
+            lambda p: supabase.table("vehicles").upsert(p, on_conflict=["vehicle_id"]), payload
+        )
 
         if not getattr(res, "data", None):
             logger.warning(f"⚠️ save_abrp_vehicle: No data returned")
             return False
 
+        if isinstance(res.data, list) and res.data:
+            record_vehicle_state(
+                db_id=res.data[0].get("id"),
+                vehicle_id=abrp_vehicle_id,
+                user_id=user_id,
+                vin=None,
+                online=True,
+                last_seen=vehicle_cache.get("lastSeen"),
+                country_code=payload.get("country_code") or existing_country,
+                source="abrp",
+                brand=brand,
+            )
+            _publish_ha_status(res.data[0].get("id"), abrp_vehicle_id, user_id, merged_cache)
+
         abrp_extra_keys = list(vehicle_cache.get("abrp_extra", {}).keys())
         logger.info(f"✅ ABRP vehicle {abrp_vehicle_id} saved for user {user_id} (abrp_extra: {abrp_extra_keys})")
 
@@ -311,10 +473,8 @@ async def save_abrp_vehicle(vehicle_cache: dict, user_id: str, abrp_vehicle_id:
             except Exception as notify_err:
                 logger.warning(f"Failed to notify admins about new ABRP vehicle: {notify_err}")
 
-        # Cross-populate data between ABRP and Enode if both exist for same car
-        brand = vehicle_cache.get("information", {}).get("brand") or vendor or ""
-        if brand:
-            await cross_populate_vehicle_data(user_id, "abrp", brand.upper())
+        # Pass changed ABRP data on to the paired Enode record, if any
+        await cross_populate_vehicle_data(vehicle_cache, "abrp", abrp_vehicle_id)
 
         return True
     except Exception as e:
@@ -322,126 +482,153 @@ async def save_abrp_vehicle(vehicle_cache: dict, user_id: str, abrp_vehicle_id:
         return False
 
 
-async def cross_populate_vehicle_data(user_id: str, saved_source: str, saved_brand: str) -> None:
+# chargeState fields the Enode record lends to its ABRP counterpart when ABRP lacks them
+ENODE_SHARED_CHARGE_FIELDS = (
+    "chargeLimit", "maxCurrent", "powerDeliveryState", "isPluggedIn",
+    "isFullyCharged", "range", "batteryCapacity", "chargeTimeRemaining",
+)
+
+
+def _counterpart_contribution(cache: dict, source: str) -> dict:
+    """
+    The fields a vehicle lends to its counterpart from the other source.
+    - ABRP → Enode: abrp_extra, odometer, batteryCapacity, range
+    - Enode → ABRP: VIN, charge settings/state, odometer, capabilities
     """
-    After saving a vehicle, find the counterpart from the other source (Enode ↔ ABRP)
-    for the same physical car and merge missing data in both directions.
+    charge = cache.get("chargeState") or {}
+    if source == "abrp":
+        return {
+            "abrp_extra": cache.get("abrp_extra"),
+            "odometer": cache.get("odometer"),
+            "batteryCapacity": charge.get("batteryCapacity"),
+            "range": charge.get("range"),
+        }
+    return {
+        "vin": (cache.get("information") or {}).get("vin"),
+        "chargeState": {f: charge[f] for f in ENODE_SHARED_CHARGE_FIELDS if charge.get(f) is not None},
+        "odometer": cache.get("odometer"),
+        "capabilities": cache.get("capabilities"),
+    }
+
+
+def _odometer_distance(odometer) -> float | None:
+    return odometer.get("distance") if isinstance(odometer, dict) else None
 
-    Matching: same user_id + same brand (case-insensitive).
-    - ABRP → Enode: abrp_extra, odometer (if missing), batteryCapacity, range
-    - Enode → ABRP: VIN, chargeLimit, maxCurrent, powerDeliveryState, capabilities
+
+def _apply_contribution(cache: dict, contribution: dict, from_source: str) -> bool:
     """
-    supabase = get_supabase_admin_client()
-    try:
-        # Fetch all vehicles for this user to find cross-source match
-        res = supabase.table("vehicles").select(
-            "id, vehicle_id, source, vendor, vin, vehicle_cache"
-        ).eq("user_id", user_id).execute()
+    Merges a counterpart's contribution into cache. Only top-level keys of cache are
+    replaced (nested dicts are copied), so a shallow copy of a vehicle can be passed.
+    Apart from abrp_extra, fields are only filled in where cache has none.
+    Returns True if cache changed.
+    """
+    changed = False
+    charge = dict(cache.get("chargeState") or {})
+
+    if from_source == "abrp":
+        abrp_extra = contribution.get("abrp_extra")
+        if abrp_extra and cache.get("abrp_extra") != abrp_extra:
+            cache["abrp_extra"] = abrp_extra
+            changed = True
+        shared_charge = {f: contribution.get(f) for f in ("batteryCapacity", "range")}
+    else:
+        vin = contribution.get("vin")
+        info = cache.get("information") or {}
+        if vin and not info.get("vin"):
+            # VIN goes into the cache for display only: the indexed vin column stays with Enode
+            cache["information"] = {**info, "vin": vin}
+            changed = True
+        if contribution.get("capabilities") and not cache.get("capabilities"):
+            cache["capabilities"] = contribution["capabilities"]
+            changed = True
+        shared_charge = contribution.get("chargeState") or {}
+
+    for field, value in shared_charge.items():
+        if value is not None and charge.get(field) is None:
+            charge[field] = value
+            changed = True
+    if changed:
+        cache["chargeState"] = charge
+
+    odometer = contribution.get("odometer")
+    if not _odometer_distance(cache.get("odometer")) and _odometer_distance(odometer):
+        cache["odometer"] = odometer
+        changed = True
+
+    return changed
+
+
+def _fetch_vehicle_cache(supabase, vehicle_id: str) -> dict | None:
+    res = supabase.table("vehicles").select("vehicle_cache").eq("vehicle_id", vehicle_id).maybe_single().execute()
+    if not res or not res.data:
+        return None
+    return load_vehicle_cache(res.data.get("vehicle_cache"))
 
-        vehicles = res.data or []
-        if len(vehicles) < 2:
-            return  # Need at least 2 vehicles to cross-populate
 
-        # Group by normalised brand
-        enode_vehicles = []
-        abrp_vehicles = []
-        for v in vehicles:
-            source = v.get("source") or "enode"
-            cache = v.get("vehicle_cache")
-            if isinstance(cache, str):
-                try:
-                    cache = json.loads(cache)
-                except (json.JSONDecodeError, TypeError):
-                    continue
-            if not cache:
-                continue
-            v["_cache"] = cache
-            brand = (cache.get("information", {}).get("brand") or v.get("vendor") or "").upper()
-            v["_brand"] = brand
-            if source == "abrp":
-                abrp_vehicles.append(v)
-            else:
-                enode_vehicles.append(v)
-
-        if not enode_vehicles or not abrp_vehicles:
-            return  # No cross-source pair
-
-        # Match by brand (case-insensitive)
-        for enode_v in enode_vehicles:
-            for abrp_v in abrp_vehicles:
-                if enode_v["_brand"] != abrp_v["_brand"]:
-                    continue
-
-                enode_cache = enode_v["_cache"]
-                abrp_cache = abrp_v["_cache"]
-                enode_updated = False
-                abrp_updated = False
-
-                # ── ABRP → Enode: augment Enode with ABRP-only data ──
-                abrp_extra = abrp_cache.get("abrp_extra")
-                if abrp_extra:
-                    enode_cache["abrp_extra"] = abrp_extra
-                    enode_updated = True
-
-                # Odometer: prefer ABRP if Enode has no valid distance
-                enode_odo = enode_cache.get("odometer") or {}
-                abrp_odo = abrp_cache.get("odometer") or {}
-                if not enode_odo.get("distance") and abrp_odo.get("distance"):
-                    enode_cache["odometer"] = abrp_odo
-                    enode_updated = True
-
-                # batteryCapacity / range from ABRP if Enode missing
-                enode_cs = enode_cache.get("chargeState", {})
-                abrp_cs = abrp_cache.get("chargeState", {})
-                if enode_cs.get("batteryCapacity") is None and abrp_cs.get("batteryCapacity") is not None:
-                    enode_cs["batteryCapacity"] = abrp_cs["batteryCapacity"]
-                    enode_cache["chargeState"] = enode_cs
-                    enode_updated = True
-                if enode_cs.get("range") is None and abrp_cs.get("range") is not None:
-                    enode_cs["range"] = abrp_cs["range"]
-                    enode_cache["chargeState"] = enode_cs
-                    enode_updated = True
-
-                # ── Enode → ABRP: augment ABRP with Enode-only data ──
-                enode_vin = enode_cache.get("information", {}).get("vin")
-                abrp_vin = abrp_cache.get("information", {}).get("vin")
-                if enode_vin and not abrp_vin:
-                    # Store VIN in cache JSON for display, but don't set the indexed
-                    # vin column since Enode already owns it (unique constraint)
-                    abrp_cache.setdefault("information", {})["vin"] = enode_vin
-                    abrp_updated = True
-
-                # chargeLimit, maxCurrent, range, batteryCapacity, etc.
-                for field in ("chargeLimit", "maxCurrent", "powerDeliveryState", "isPluggedIn", "isFullyCharged", "range", "batteryCapacity", "chargeTimeRemaining"):
-                    if enode_cs.get(field) is not None and abrp_cs.get(field) is None:
-                        abrp_cs[field] = enode_cs[field]
-                        abrp_cache["chargeState"] = abrp_cs
-                        abrp_updated = True
-
-                # Odometer: copy Enode → ABRP if ABRP is missing
-                abrp_odo_rev = abrp_cache.get("odometer") or {}
-                enode_odo_rev = enode_cache.get("odometer") or {}
-                if not abrp_odo_rev.get("distance") and enode_odo_rev.get("distance"):
-                    abrp_cache["odometer"] = enode_odo_rev
-                    abrp_updated = True
-
-                # Capabilities
-                if enode_cache.get("capabilities") and not abrp_cache.get("capabilities"):
-                    abrp_cache["capabilities"] = enode_cache["capabilities"]
-                    abrp_updated = True
-
-                # Save updated caches
-                if enode_updated:
-                    supabase.table("vehicles").update({
-                        "vehicle_cache": json.dumps(enode_cache),
-                    }).eq("id", enode_v["id"]).execute()
-                    logger.info(f"[🔀 Cross-populate] ABRP → Enode for {enode_v['_brand']} user {user_id}")
-
-                if abrp_updated:
-                    update_payload = {"vehicle_cache": json.dumps(abrp_cache)}
-                    supabase.table("vehicles").update(update_payload).eq("id", abrp_v["id"]).execute()
-                    logger.info(f"[🔀 Cross-populate] Enode → ABRP for {abrp_v['_brand']} user {user_id}")
+def merge_counterpart_contribution(vehicle_cache: dict, user_id: str, source: str, vehicle_id: str, brand: str) -> dict:
+    """
+    Returns the cache to write for a vehicle: its own data plus what its paired
+    counterpart (same car, other source) contributes, so the saved row is complete
+    without a second write. The counterpart's contribution is read from the
+    database only the first time it is needed in this process.
+    vehicle_cache itself is not modified.
+    """
+    pairing = find_or_create_vehicle_pairing(user_id, source, vehicle_id, brand)
+    if pairing is None:
+        return vehicle_cache
+
+    other_source = "enode" if source == "abrp" else "abrp"
+    counterpart_id = pairing.counterpart_of(vehicle_id)
+    contribution = get_contribution(counterpart_id)
+    if contribution is None:
+        try:
+            counterpart_cache = _fetch_vehicle_cache(get_supabase_admin_client(), counterpart_id)
+        except Exception as e:
+            logger.error(f"[❌ merge_counterpart_contribution] {e}")
+            return vehicle_cache
+        if not counterpart_cache:
+            return vehicle_cache
+        contribution = _counterpart_contribution(counterpart_cache, other_source)
+        set_contribution(counterpart_id, contribution)
 
+    merged = dict(vehicle_cache)
+    _apply_contribution(merged, contribution, other_source)
+    return merged
+
+
+async def cross_populate_vehicle_data(vehicle_cache: dict, saved_source: str, vehicle_id: str) -> None:
+    """
+    After saving a paired vehicle, pass its contribution on to the counterpart
+    record (Enode ↔ ABRP for the same physical car, see vehicle_pairing).
+
+    Nothing is read or written unless the contribution differs from the last one
+    sent, and the counterpart is only written if the merge changes its cache.
+    """
+    pairing = get_vehicle_pairing(vehicle_id)
+    if pairing is None:
+        return
+
+    contribution = _counterpart_contribution(vehicle_cache, saved_source)
+    if contribution == get_contribution(vehicle_id):
+        return
+
+    counterpart_id = pairing.counterpart_of(vehicle_id)
+    supabase = get_supabase_admin_client()
+    try:
+        counterpart_cache = _fetch_vehicle_cache(supabase, counterpart_id)
+        if counterpart_cache and _apply_contribution(counterpart_cache, contribution, saved_source):
+            _execute_vehicle_write(
+                lambda p: supabase.table("vehicles").update(p).eq("vehicle_id", counterpart_id),
+                {"vehicle_cache": counterpart_cache, **_hot_columns(counterpart_cache)},
+            )
+            counterpart_state = get_vehicle_state(counterpart_id)
+            if counterpart_state:
+                _publish_ha_status(counterpart_state.db_id, counterpart_id, counterpart_state.user_id, counterpart_cache)
+            else:
+                ha_status_cache.forget_vehicle(counterpart_id)
+            direction = "ABRP → Enode" if saved_source == "abrp" else "Enode → ABRP"
+            logger.info(f"[🔀 Cross-populate] {direction} for {pairing.brand} user {pairing.user_id}")
+        set_contribution(vehicle_id, contribution)
     except Exception as e:
         logger.error(f"[❌ cross_populate_vehicle_data] {e}")
 
@@ -468,11 +655,14 @@ async def get_internal_vehicle_id(user_id: str, abrp_vehicle_id: str) -> str | N
         return None
 
 
-async def get_vehicle_by_id(vehicle_id: str):
-    """Retrieves a vehicle record by its internal database ID."""
+async def get_vehicle_by_id(vehicle_id: str, columns: str = "*"):
+    """
+    Retrieves a vehicle record by its internal database ID.
+    columns may select vehicle_cache sub-paths, e.g. "id, odometer:vehicle_cache->odometer".
+    """
     supabase = get_supabase_admin_client()
     response = supabase.table("vehicles") \
-        .select("*") \
+        .select(columns) \
         .eq("id", vehicle_id) \
         .maybe_single() \
         .execute()
@@ -482,11 +672,14 @@ async def get_vehicle_by_id(vehicle_id: str):
 
     return response.data
 
-async def get_vehicle_by_vehicle_id(vehicle_id: str):
-    """Retrieves a vehicle record by its Enode vehicle ID."""
+async def get_vehicle_by_vehicle_id(vehicle_id: str, columns: str = "*"):
+    """
+    Retrieves a vehicle record by its Enode vehicle ID.
+    columns may select vehicle_cache sub-paths, e.g. "id, odometer:vehicle_cache->odometer".
+    """
     supabase = get_supabase_admin_client()
     response = supabase.table("vehicles") \
-        .select("*") \
+        .select(columns) \
         .eq("vehicle_id", vehicle_id) \
         .maybe_single() \
         .execute()
@@ -551,6 +744,9 @@ async def delete_vehicles_by_vendor(user_id: str, vendor: str) -> int:
         if deleted_count > 0:
             # Delete vehicles
             supabase.table("vehicles").delete().eq("user_id", user_id).eq("vendor", vendor).execute()
+            forget_user_vehicles(user_id)
+            forget_user_pairings(user_id)
+            ha_status_cache.forget_user(user_id)
             logger.info(f"🗑️ Deleted {deleted_count} vehicles for user {user_id} vendor {vendor}")
 
             # Update linked vehicle count
@@ -566,9 +762,11 @@ async def delete_vehicles_by_vendor(user_id: str, vendor: str) -> int:
 
 async def get_vehicles_by_country() -> list[dict]:
     """
-    Returns vehicles grouped by country with count.
-    Uses cached country_code from database when available, falling back to
-    reverse geocoding only for vehicles without cached country.
+    Returns vehicles grouped by country with count, from the stored country_code.
+    Vehicles without one are counted as unknown ("XX"); if any of them have
+    coordinates, the country backfill job is started to fill them in.
+    Country names come from the geocoder (names reverse_geocode returned), then a
+    built-in map, then the code itself.
     Returns list of {country_code, country, count} sorted by count descending.
     Results are cached for 5 minutes since this data changes infrequently.
     """
@@ -579,57 +777,32 @@ async def get_vehicles_by_country() -> list[dict]:
 
     supabase = get_supabase_admin_client()
     try:
-        # Fetch vehicles with cached country_code and vehicle_cache for fallback
-        res = supabase.table("vehicles").select("country_code, vehicle_cache").execute()
+        try:
+            res = supabase.table("vehicles").select("country_code, latitude").execute()
+            has_latitude = True
+        except APIError as e:
+            if e.code != "42703":
+                raise
+            # latitude is a hot column (vehicle_hot_columns.sql); without it vehicles cannot be queued for backfill here
+            logger.warning("[⚠️ get_vehicles_by_country] latitude column not found, counting stored country codes only")
+            res = supabase.table("vehicles").select("country_code").execute()
+            has_latitude = False
         vehicles = res.data or []
 
         country_counts = defaultdict(int)
-        country_names = {}
-        coords_to_geocode = []
+        pending_geocode = 0
 
         for v in vehicles:
-            # First, try to use cached country_code
-            cached_country = v.get("country_code")
-            if cached_country:
-                country_counts[cached_country] += 1
-                continue
-
-            # Fall back to reverse geocoding for vehicles without cached country
-            cache = v.get("vehicle_cache")
-            if isinstance(cache, str):
-                try:
-                    cache = json.loads(cache)
-                except:
-                    # No valid cache, count as unknown
-                    country_counts["XX"] += 1
-                    continue
-            if cache:
-                location = cache.get("location", {})
-                lat = location.get("latitude")
-                lon = location.get("longitude")
-                if lat is not None and lon is not None:
-                    coords_to_geocode.append((lat, lon))
-                else:
-                    # No location data, count as unknown
-                    country_counts["XX"] += 1
-            else:
-                # No cache at all, count as unknown
-                country_counts["XX"] += 1
-
-        # Batch reverse geocode only vehicles without cached country
-        if coords_to_geocode:
-            results = reverse_geocode.search(coords_to_geocode)
-            for result in results:
-                code = result.get("country_code", "Unknown")
-                country_counts[code] += 1
-                if code not in country_names:
-                    country_names[code] = result.get("country", "Unknown")
+            country_counts[v.get("country_code") or "XX"] += 1
+            if has_latitude and not v.get("country_code") and v.get("latitude") is not None:
+                pending_geocode += 1
+
+        if pending_geocode and start_country_backfill():
+            logger.info(f"[🌍 get_vehicles_by_country] Started country backfill for {pending_geocode} vehicle(s)")
 
         if not country_counts:
             return []
 
-        # Build country name lookup for cached countries
-        # (reverse_geocode gives us names, but for cached ones we need to look up)
         country_name_map = {
             "SE": "Sweden", "NO": "Norway", "DK": "Denmark", "FI": "Finland",
             "DE": "Germany", "NL": "Netherlands", "BE": "Belgium", "FR": "France",
@@ -644,7 +817,7 @@ async def get_vehicles_by_country() -> list[dict]:
         countries = [
             {
                 "country_code": code,
-                "country": country_names.get(code) or country_name_map.get(code, code),
+                "country": country_geocoder.country_name(code) or country_name_map.get(code, code),
                 "count": count
             }
             for code, count in country_counts.items()
@@ -661,10 +834,27 @@ async def get_vehicles_by_country() -> list[dict]:
         return []
 
 
+def _model_counts_from_caches(supabase) -> list[dict]:
+    """get_vehicle_model_counts rows computed client-side, for databases without the RPC."""
+    counts = defaultdict(int)
+    res = supabase.table("vehicles").select("vehicle_cache").execute()
+    for v in res.data or []:
+        cache = load_vehicle_cache(v.get("vehicle_cache"))
+        if not cache:
+            continue
+        info = cache.get("information") or {}
+        counts[(info.get("brand", "Unknown"), info.get("model", "Unknown"))] += 1
+    return [
+        {"brand": brand, "model": model, "vehicle_count": count}
+        for (brand, model), count in counts.items()
+    ]
+
+
 async def get_vehicles_by_model() -> list[dict]:
     """
     Returns vehicles grouped by brand + model with count.
-    Parses vehicle_cache JSON to extract information.brand and information.model.
+    Aggregated in SQL over the typed brand/model columns (get_vehicle_model_counts),
+    or from vehicle_cache if the RPC does not exist yet (PGRST202).
     Results are cached for 5 minutes.
     """
     cache_key = "vehicles_by_model"
@@ -674,27 +864,20 @@ async def get_vehicles_by_model() -> list[dict]:
 
     supabase = get_supabase_admin_client()
     try:
-        res = supabase.table("vehicles").select("vehicle_cache").execute()
-        vehicles = res.data or []
+        try:
+            rows = supabase.rpc("get_vehicle_model_counts", {}).execute().data or []
+        except APIError as e:
+            if e.code != "PGRST202":
+                raise
+            logger.warning("[⚠️ get_vehicles_by_model] RPC not found, counting models from vehicle_cache")
+            rows = _model_counts_from_caches(supabase)
 
         model_counts = defaultdict(int)
 
-        for v in vehicles:
-            cache = v.get("vehicle_cache")
-            if isinstance(cache, str):
-                try:
-                    cache = json.loads(cache)
-                except Exception:
-                    continue
-            if not cache:
-                continue
-
-            info = cache.get("information", {})
-            brand = info.get("brand", "Unknown")
-            model = info.get("model", "Unknown")
-            key = f"{brand} {model}".strip()
+        for row in rows:
+            key = f"{row.get('brand')} {row.get('model')}".strip()
             if key:
-                model_counts[key] += 1
+                model_counts[key] += row.get("vehicle_count") or 0
 
         models = [
             {"model": model, "count": count}
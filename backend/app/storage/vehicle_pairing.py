@@ -0,0 +1,229 @@
+# 📄 backend/app/storage/vehicle_pairing.py
+"""
+Pairing index between the Enode and ABRP records of the same physical car.
+
+cross-populate used to re-scan all of a user's vehicles after every save. The
+pairing (same user, same brand, same VIN when both sides have one) is now found once, persisted in
+vehicle_pairings and kept in memory, together with the last contribution
+each side made to the other. A save only merges when its vehicle is paired,
+and only writes the counterpart when its contribution actually changed.
+"""
+
+import logging
+import time
+from dataclasses import dataclass
+
+from app.lib.supabase import get_supabase_admin_client
+from app.lib.vehicle_cache import load_vehicle_cache
+from app.storage.vehicle_state import get_user_vehicle_states, get_vehicle_state, is_warm
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class VehiclePairing:
+    user_id: str
+    enode_vehicle_id: str
+    abrp_vehicle_id: str
+    brand: str
+
+    def counterpart_of(self, vehicle_id: str) -> str:
+        return self.abrp_vehicle_id if vehicle_id == self.enode_vehicle_id else self.enode_vehicle_id
+
+
+# {vehicle_id (either side): VehiclePairing}
+_pairings: dict[str, VehiclePairing] = {}
+# {vehicle_id: fields that vehicle last contributed to its counterpart}
+_contributions: dict[str, dict] = {}
+# {vehicle_id: time.monotonic() of the last table lookup that found no counterpart}.
+# Only used while the state store is not warm; a counterpart saved later finds
+# this vehicle through its own lookup.
+_unpaired_checked: dict[str, float] = {}
+UNPAIRED_RECHECK_SECONDS = 300.0
+_fallback_logged = False
+
+
+def _index(pairing: VehiclePairing) -> None:
+    _pairings[pairing.enode_vehicle_id] = pairing
+    _pairings[pairing.abrp_vehicle_id] = pairing
+
+
+async def warm_vehicle_pairings() -> int:
+    """Loads all pairings into memory. Returns the number of pairings loaded."""
+    supabase = get_supabase_admin_client()
+    try:
+        res = supabase.table("vehicle_pairings") \
+            .select("user_id, enode_vehicle_id, abrp_vehicle_id, brand") \
+            .execute()
+        _pairings.clear()
+        for row in res.data or []:
+            _index(VehiclePairing(
+                user_id=row["user_id"],
+                enode_vehicle_id=row["enode_vehicle_id"],
+                abrp_vehicle_id=row["abrp_vehicle_id"],
+                brand=row.get("brand") or "",
+            ))
+        count = len(res.data or [])
+        logger.info(f"[✅ vehicle_pairing] Loaded {count} pairing(s)")
+        return count
+    except Exception as e:
+        logger.error(f"[❌ warm_vehicle_pairings] {e}")
+        return 0
+
+
+def get_vehicle_pairing(vehicle_id: str) -> VehiclePairing | None:
+    """The pairing this Enode or ABRP vehicle belongs to, if any."""
+    return _pairings.get(vehicle_id)
+
+
+def _user_vehicles_from_db(user_id: str) -> list[dict]:
+    """A user's saved vehicles (vehicle_id, source, brand, vin), read from the table."""
+    res = get_supabase_admin_client().table("vehicles") \
+        .select("vehicle_id, source, vendor, vin, vehicle_cache") \
+        .eq("user_id", user_id) \
+        .execute()
+    vehicles = []
+    for row in res.data or []:
+        info = load_vehicle_cache(row.get("vehicle_cache")).get("information") or {}
+        vehicles.append({
+            "vehicle_id": row.get("vehicle_id"),
+            "source": row.get("source") or "enode",
+            "brand": (info.get("brand") or row.get("vendor") or "").upper(),
+            "vin": row.get("vin"),
+        })
+    return vehicles
+
+
+def _user_vehicles(user_id: str, vehicle_id: str) -> list[dict] | None:
+    """
+    The user's saved vehicles, from the vehicle state store while it holds every
+    vehicle, else from the table. None if vehicle_id itself is not saved yet.
+    """
+    global _fallback_logged
+    if is_warm():
+        if get_vehicle_state(vehicle_id) is None:
+            return None
+        return [
+            {"vehicle_id": s.vehicle_id, "source": s.source, "brand": s.brand, "vin": s.vin}
+            for s in get_user_vehicle_states(user_id)
+        ]
+
+    checked_at = _unpaired_checked.get(vehicle_id)
+    if checked_at is not None and time.monotonic() - checked_at < UNPAIRED_RECHECK_SECONDS:
+        return None
+    if not _fallback_logged:
+        _fallback_logged = True
+        logger.warning("[vehicle_pairing] Vehicle state store not warm, pairing candidates are read from the table")
+    logger.debug(f"[vehicle_pairing] Reading vehicles of user {user_id} to pair {vehicle_id}")
+    _unpaired_checked[vehicle_id] = time.monotonic()
+    if len(_unpaired_checked) > 100_000:
+        _unpaired_checked.clear()
+    vehicles = _user_vehicles_from_db(user_id)
+    if not any(v["vehicle_id"] == vehicle_id for v in vehicles):
+        return None
+    return vehicles
+
+
+def find_or_create_vehicle_pairing(user_id: str, source: str, vehicle_id: str, brand: str) -> VehiclePairing | None:
+    """
+    Returns the vehicle's pairing, creating it when the user has an unpaired
+    vehicle of the same brand from the other source. When both vehicles have a
+    VIN they must match; a VIN match wins over other candidates, and without
+    one a pair is only made if exactly one candidate is left. Candidates come
+    from the vehicle state store (a table query when it is not warm), so this
+    needs no query until a new pair is found. Both vehicles must already be
+    saved (the table references vehicles).
+    """
+    pairing = _pairings.get(vehicle_id)
+    if pairing or not brand:
+        return pairing
+
+    try:
+        vehicles = _user_vehicles(user_id, vehicle_id)
+    except Exception as e:
+        logger.error(f"[❌ find_or_create_vehicle_pairing] {e}")
+        return None
+    if vehicles is None:
+        return None
+
+    other_source = "enode" if source == "abrp" else "abrp"
+    brand = brand.upper()
+    vin = next((v["vin"] for v in vehicles if v["vehicle_id"] == vehicle_id), None)
+    candidates = [
+        v for v in vehicles
+        if v["source"] == other_source and v["brand"] == brand and v["vehicle_id"] not in _pairings
+        and not (vin and v["vin"] and v["vin"] != vin)
+    ]
+    same_vin = [v for v in candidates if vin and v["vin"] == vin]
+    if same_vin:
+        counterpart = same_vin[0]
+    elif len(candidates) == 1:
+        counterpart = candidates[0]
+    else:
+        if candidates:
+            logger.info(
+                f"[vehicle_pairing] {len(candidates)} {brand} vehicles could pair with {vehicle_id} "
+                f"for user {user_id} and none matches its VIN, not pairing"
+            )
+        return None
+
+    enode_id, abrp_id = (vehicle_id, counterpart["vehicle_id"]) if source == "enode" else (counterpart["vehicle_id"], vehicle_id)
+    pairing = VehiclePairing(user_id=user_id, enode_vehicle_id=enode_id, abrp_vehicle_id=abrp_id, brand=brand)
+    try:
+        get_supabase_admin_client().table("vehicle_pairings").upsert({
+            "user_id": user_id,
+            "enode_vehicle_id": enode_id,
+            "abrp_vehicle_id": abrp_id,
+            "brand": brand,
+        }, on_conflict="enode_vehicle_id").execute()
+    except Exception as e:
+        logger.error(f"[❌ find_or_create_vehicle_pairing] {e}")
+        return None
+
+    _index(pairing)
+    logger.info(f"[🔗 vehicle_pairing] Paired Enode {enode_id} with ABRP {abrp_id} ({brand}) for user {user_id}")
+    return pairing
+
+
+def rename_paired_vehicle(old_vehicle_id: str, new_vehicle_id: str) -> None:
+    """Follow an Enode relink (the table row is updated by its ON UPDATE CASCADE foreign key)."""
+    pairing = _pairings.pop(old_vehicle_id, None)
+    _contributions.pop(old_vehicle_id, None)
+    if pairing is None:
+        return
+    if pairing.enode_vehicle_id == old_vehicle_id:
+        pairing.enode_vehicle_id = new_vehicle_id
+    else:
+        pairing.abrp_vehicle_id = new_vehicle_id
+    _pairings[new_vehicle_id] = pairing
+
+
+def get_contribution(vehicle_id: str) -> dict | None:
+    """What this vehicle last contributed to its counterpart (None if not known in this process)."""
+    return _contributions.get(vehicle_id)
+
+
+def set_contribution(vehicle_id: str, contribution: dict) -> None:
+    _contributions[vehicle_id] = contribution
+
+
+def forget_vehicle_pairing(vehicle_id: str) -> None:
+    """Drop a deleted vehicle's pairing (the table row is removed by its ON DELETE CASCADE foreign key)."""
+    pairing = _pairings.pop(vehicle_id, None)
+    _contributions.pop(vehicle_id, None)
+    if pairing:
+        counterpart = pairing.counterpart_of(vehicle_id)
+        _pairings.pop(counterpart, None)
+        _contributions.pop(counterpart, None)
+
+
+def forget_user_pairings(user_id: str) -> None:
+    """Drop all of a user's pairings after a bulk vehicle delete."""
+    for vehicle_id, pairing in list(_pairings.items()):
+        if pairing.user_id == user_id:
+            _pairings.pop(vehicle_id, None)
+            _contributions.pop(vehicle_id, None)
+
+
+def get_vehicle_pairing_stats() -> dict:
+    return {"pairings": len(_pairings) // 2, "contributions": len(_contributions)}
@@ -0,0 +1,485 @@
+# 📄 backend/app/storage/vehicle_state.py
+"""
+In-process registry of per-vehicle state.
+
+One compact VehicleState record per vehicle holds everything the process
+remembers between events:
+- save state used by save_vehicle_data_with_client (DB id, VIN, online flag,
+  lastSeen, country code, owner, source, brand), so a webhook for a known
+  vehicle needs no reads before its write
+- the notification state used to detect Pushover transitions
+- the last saved charging sample, used to skip unchanged samples
+- the last saved vehicle object (flattened), the baseline for delta
+  detection in app.lib.vehicle_delta
+
+The registry is an LRU bounded by VEHICLE_STATE_MAX_ENTRIES. It is updated
+after every save, snapshotted to a local file on shutdown and restored from
+that file on startup, then reconciled with the rows changed or deleted since
+the snapshot was written (e.g. by another instance during a rolling deploy);
+only without a recent snapshot is it warmed with one bulk query. The delta
+baseline is not snapshotted (it would dwarf the rest of the record), so the
+first update of each vehicle after a restart counts as a state change. Once a record has been evicted the registry is no longer
+complete, so is_warm() turns False and "not in the registry" stops meaning
+"does not exist" for callers that rely on it.
+"""
+
+import json
+import logging
+import os
+import sys
+import time
+from collections import OrderedDict
+from datetime import datetime, timezone
+
+from app.config import (
+    VEHICLE_STATE_MAX_ENTRIES,
+    VEHICLE_STATE_SNAPSHOT_MAX_AGE_SECONDS,
+    VEHICLE_STATE_SNAPSHOT_PATH,
+)
+from postgrest.exceptions import APIError
+
+from app.lib.supabase import get_supabase_admin_client
+from app.lib.vehicle_cache import load_vehicle_cache
+
+logger = logging.getLogger(__name__)
+
+WARM_PAGE_SIZE = 1000
+WARM_COLUMNS = "id, vehicle_id, user_id, vin, online, country_code, source, vendor"
+# JSON paths into vehicle_cache (need the JSONB column from vehicle_cache_jsonb.sql)
+WARM_CACHE_FIELDS = "last_seen:vehicle_cache->>lastSeen, brand:vehicle_cache->information->>brand"
+# Rows updated this long before the snapshot was written are reloaded too (clock skew, in-flight saves)
+RECONCILE_MARGIN_SECONDS = 60
+
+
+class VehicleState:
+    """Everything the process remembers about one vehicle (slots keep it small)."""
+
+    __slots__ = (
+        "vehicle_id",
+        # Save state (db_id is None until the vehicle has been saved or warmed)
+        "db_id",
+        "user_id",
+        "vin",
+        "online",
+        "last_seen",
+        "country_code",
+        "source",
+        "brand",
+        # Notification state (notified is False until the first event was recorded)
+        "notified",
+        "is_charging",
+        "is_reachable",
+        "is_fully_charged",
+        "battery_level",
+        # Last saved charging sample (sample_saved_at is a time.monotonic() value)
+        "sample_saved_at",
+        "sample_battery_level",
+        "sample_is_charging",
+        # Delta baseline: last saved vehicle, flattened (delta_saved_at is a time.monotonic() value)
+        "delta_fields",
+        "delta_saved_at",
+    )
+
+    def __init__(self, vehicle_id: str):
+        self.vehicle_id = vehicle_id
+        self.db_id = None
+        self.user_id = None
+        self.vin = None
+        self.online = None
+        self.last_seen = None
+        self.country_code = None
+        self.source = "enode"
+        self.brand = ""
+        self.notified = False
+        self.is_charging = None
+        self.is_reachable = None
+        self.is_fully_charged = None
+        self.battery_level = None
+        self.sample_saved_at = None
+        self.sample_battery_level = None
+        self.sample_is_charging = None
+        self.delta_fields = None
+        self.delta_saved_at = None
+
+    def set_saved(
+        self,
+        db_id: str,
+        user_id: str | None,
+        vin: str | None,
+        online: bool | None,
+        last_seen: str | None,
+        country_code: str | None,
+        source: str,
+        brand: str,
+    ) -> None:
+        self.db_id = db_id
+        self.user_id = user_id
+        self.vin = vin
+        self.online = online
+        self.last_seen = last_seen
+        self.country_code = country_code
+        self.source = source or "enode"
+        self.brand = (brand or "").upper()
+
+    def approx_size(self) -> int:
+        """Bytes used by the record and the values it references (shared small ints/bools included)."""
+        return sys.getsizeof(self) + sum(
+            sys.getsizeof(getattr(self, name)) for name in self.__slots__
+            if getattr(self, name) is not None
+        )
+
+
+# {vehicle_id: VehicleState}, least recently used first
+_states: OrderedDict[str, VehicleState] = OrderedDict()
+# Secondary indexes over saved records (db_id set), kept in step by _index/_unindex:
+# {db_id: vehicle_id} for lookups by internal id (HA endpoints use vehicles.id)
+_by_db_id: dict[str, str] = {}
+# {user_id: {vehicle_id}} for per-user lookups (pairing, bulk deletes)
+_by_user: dict[str, set[str]] = {}
+# {(user_id, vin): vehicle_id} for relink detection
+_by_vin: dict[tuple[str, str], str] = {}
+_warmed = False
+_evictions = 0
+# Wall-clock time the restored snapshot was written (None unless restored from one)
+_snapshot_saved_at: float | None = None
+
+
+def is_warm() -> bool:
+    """
+    True while the registry holds every vehicle: warmed from the database or a
+    warm snapshot, and nothing evicted since.
+    """
+    return _warmed
+
+
+def _entry(vehicle_id: str) -> VehicleState:
+    """The record for a vehicle, created if needed and marked as most recently used."""
+    global _evictions, _warmed
+    state = _states.get(vehicle_id)
+    if state is not None:
+        _states.move_to_end(vehicle_id)
+        return state
+
+    state = _states[vehicle_id] = VehicleState(vehicle_id)
+    while len(_states) > VEHICLE_STATE_MAX_ENTRIES:
+        _, evicted = _states.popitem(last=False)
+        _unindex(evicted)
+        _evictions += 1
+        if _warmed:
+            _warmed = False
+            logger.warning(
+                f"[vehicle_state] Registry full ({VEHICLE_STATE_MAX_ENTRIES}), evicting: "
+                "lookups fall back to the database from now on"
+            )
+    return state
+
+
+def _index(state: VehicleState) -> None:
+    if state.db_id is None:
+        return
+    _by_db_id[state.db_id] = state.vehicle_id
+    if state.user_id is not None:
+        _by_user.setdefault(state.user_id, set()).add(state.vehicle_id)
+        if state.vin:
+            _by_vin[(state.user_id, state.vin)] = state.vehicle_id
+
+
+def _unindex(state: VehicleState | None) -> None:
+    if state is None or state.db_id is None:
+        return
+    if _by_db_id.get(state.db_id) == state.vehicle_id:
+        del _by_db_id[state.db_id]
+    if state.user_id is not None:
+        vehicle_ids = _by_user.get(state.user_id)
+        if vehicle_ids is not None:
+            vehicle_ids.discard(state.vehicle_id)
+            if not vehicle_ids:
+                del _by_user[state.user_id]
+        if state.vin and _by_vin.get((state.user_id, state.vin)) == state.vehicle_id:
+            del _by_vin[(state.user_id, state.vin)]
+
+
+def vehicle_state_entry(vehicle_id: str) -> VehicleState:
+    """Get-or-create the record for a vehicle (notification, sample and HA state)."""
+    return _entry(vehicle_id)
+
+
+def _warm_rows(supabase, select: str, updated_since: str | None = None) -> list[dict]:
+    """Every vehicles row with a vehicle_id (updated since updated_since if set), read in pages of WARM_PAGE_SIZE."""
+    rows_loaded = []
+    offset = 0
+    while True:
+        query = supabase.table("vehicles").select(select)
+        if updated_since:
+            query = query.gte("updated_at", updated_since)
+        res = query \
+            .order("id") \
+            .range(offset, offset + WARM_PAGE_SIZE - 1) \
+            .execute()
+        rows = res.data or []
+        rows_loaded.extend(row for row in rows if row.get("vehicle_id"))
+        if len(rows) < WARM_PAGE_SIZE:
+            break
+        offset += WARM_PAGE_SIZE
+    return rows_loaded
+
+
+def _warm_rows_from_cache(supabase, updated_since: str | None = None) -> list[dict]:
+    """
+    _warm_rows reading lastSeen and brand from the whole vehicle_cache, for
+    databases where vehicle_cache is still a text column (JSON paths unsupported).
+    """
+    rows_loaded = []
+    for row in _warm_rows(supabase, WARM_COLUMNS + ", vehicle_cache", updated_since):
+        cache = load_vehicle_cache(row.pop("vehicle_cache", None))
+        row["last_seen"] = cache.get("lastSeen")
+        row["brand"] = (cache.get("information") or {}).get("brand")
+        rows_loaded.append(row)
+    return rows_loaded
+
+
+def _load_save_state_rows(supabase, updated_since: str | None = None) -> list[dict]:
+    """Save state rows for the registry, falling back to whole caches without the JSONB migration."""
+    try:
+        return _warm_rows(supabase, WARM_COLUMNS + ", " + WARM_CACHE_FIELDS, updated_since)
+    except APIError as e:
+        logger.warning(
+            f"[vehicle_state] JSON path select failed ({e.code}), reading whole vehicle caches; "
+            "apply vehicle_cache_jsonb.sql"
+        )
+        return _warm_rows_from_cache(supabase, updated_since)
+
+
+def _apply_save_state_row(row: dict) -> VehicleState:
+    state = _entry(row["vehicle_id"])
+    _unindex(state)
+    state.set_saved(
+        db_id=row["id"],
+        user_id=row.get("user_id"),
+        vin=row.get("vin"),
+        online=row.get("online"),
+        last_seen=row.get("last_seen"),
+        country_code=row.get("country_code"),
+        source=row.get("source") or "enode",
+        brand=row.get("brand") or row.get("vendor") or "",
+    )
+    _index(state)
+    return state
+
+
+async def warm_vehicle_state_store() -> int:
+    """Loads every vehicle's save state (paged bulk query). Returns the number of vehicles loaded."""
+    global _warmed
+    supabase = get_supabase_admin_client()
+    try:
+        rows_loaded = _load_save_state_rows(supabase)
+        for row in rows_loaded:
+            _apply_save_state_row(row)
+        # More vehicles than fit: the registry cannot stand in for the table
+        _warmed = len(rows_loaded) <= VEHICLE_STATE_MAX_ENTRIES
+        logger.info(f"[✅ vehicle_state] Warmed registry with {len(rows_loaded)} vehicles")
+        return len(rows_loaded)
+    except Exception as e:
+        logger.error(f"[❌ warm_vehicle_state_store] {e}")
+        return 0
+
+
+async def reconcile_vehicle_state_snapshot() -> bool:
+    """
+    Brings a registry restored from a snapshot up to date with the vehicles table:
+    rows updated since the snapshot was written (minus RECONCILE_MARGIN_SECONDS)
+    are reloaded, and records of vehicles deleted since are dropped. Returns False
+    if there is no restored snapshot or the table could not be read, so the caller
+    warms from the database instead.
+    """
+    if _snapshot_saved_at is None:
+        return False
+    since = datetime.fromtimestamp(_snapshot_saved_at - RECONCILE_MARGIN_SECONDS, tz=timezone.utc).isoformat()
+    supabase = get_supabase_admin_client()
+    try:
+        changed = _load_save_state_rows(supabase, updated_since=since)
+        db_ids = {row["id"] for row in _warm_rows(supabase, "id, vehicle_id")}
+    except Exception as e:
+        logger.error(f"[❌ reconcile_vehicle_state_snapshot] {e}")
+        return False
+
+    for row in changed:
+        # Relinked elsewhere: the row now belongs to a new vehicle_id
+        previous_vehicle_id = _by_db_id.get(row["id"])
+        if previous_vehicle_id and previous_vehicle_id != row["vehicle_id"]:
+            _unindex(_states.pop(previous_vehicle_id, None))
+        state = _apply_save_state_row(row)
+        # Saved by another instance: the local delta baseline no longer matches the row
+        state.delta_fields = None
+        state.delta_saved_at = None
+
+    deleted = [state.vehicle_id for state in _states.values() if state.db_id is not None and state.db_id not in db_ids]
+    for vehicle_id in deleted:
+        _unindex(_states.pop(vehicle_id, None))
+
+    logger.info(
+        f"[✅ vehicle_state] Reconciled snapshot: {len(changed)} vehicle(s) reloaded, {len(deleted)} removed"
+    )
+    return True
+
+
+def save_vehicle_state_snapshot(path: str = VEHICLE_STATE_SNAPSHOT_PATH) -> int:
+    """Writes the registry to path (atomically). Returns the number of records written."""
+    if not path:
+        return 0
+    now = time.monotonic()
+    records = []
+    for state in _states.values():
+        record = {name: getattr(state, name) for name in state.__slots__}
+        # Monotonic clock values do not survive a restart: store the age instead
+        saved_at = record.pop("sample_saved_at")
+        record["sample_age"] = now - saved_at if saved_at is not None else None
+        # Not snapshotted: the first save after a restart rebuilds the baseline
+        record.pop("delta_fields")
+        record.pop("delta_saved_at")
+        records.append(record)
+
+    tmp_path = f"{path}.tmp"
+    try:
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"saved_at": time.time(), "warm": _warmed, "states": records}, f)
+        os.replace(tmp_path, path)
+        logger.info(f"[✅ vehicle_state] Saved snapshot of {len(records)} vehicles to {path}")
+        return len(records)
+    except Exception as e:
+        logger.error(f"[❌ save_vehicle_state_snapshot] {e}")
+        return 0
+
+
+def load_vehicle_state_snapshot(
+    path: str = VEHICLE_STATE_SNAPSHOT_PATH,
+    max_age_seconds: int = VEHICLE_STATE_SNAPSHOT_MAX_AGE_SECONDS,
+) -> int:
+    """
+    Restores the registry from a snapshot written by save_vehicle_state_snapshot.
+    Snapshots older than max_age_seconds are ignored. Returns the number of
+    records restored (0 if there was nothing usable, so the caller warms from the DB).
+    Call reconcile_vehicle_state_snapshot afterwards to pick up changes made since.
+    """
+    global _warmed, _snapshot_saved_at
+    if not path or not os.path.exists(path):
+        return 0
+    try:
+        with open(path, encoding="utf-8") as f:
+            snapshot = json.load(f)
+        age = time.time() - snapshot.get("saved_at", 0)
+        if age > max_age_seconds:
+            logger.info(f"[vehicle_state] Ignoring snapshot from {int(age)}s ago (max {max_age_seconds}s)")
+            return 0
+
+        now = time.monotonic()
+        for record in snapshot.get("states", []):
+            sample_age = record.pop("sample_age", None)
+            state = _entry(record["vehicle_id"])
+            _unindex(state)
+            for name in state.__slots__:
+                if name in record:
+                    setattr(state, name, record[name])
+            # The sample ages on across the restart, so its TTL still counts from the original save
+            state.sample_saved_at = now - sample_age - age if sample_age is not None else None
+            _index(state)
+        _warmed = bool(snapshot.get("warm"))
+        _snapshot_saved_at = snapshot["saved_at"]
+        logger.info(f"[✅ vehicle_state] Restored {len(_states)} vehicles from snapshot ({int(age)}s old)")
+        return len(_states)
+    except Exception as e:
+        logger.error(f"[❌ load_vehicle_state_snapshot] {e}")
+        return 0
+
+
+def get_vehicle_state(vehicle_id: str) -> VehicleState | None:
+    """Save state for an Enode/ABRP vehicle id, or None if the vehicle is not known as saved."""
+    state = _states.get(vehicle_id)
+    if state is None or state.db_id is None:
+        return None
+    _states.move_to_end(vehicle_id)
+    return state
+
+
+def get_vehicle_state_by_db_id(db_id: str) -> VehicleState | None:
+    """Save state for an internal vehicle id (vehicles.id), or None if not in the registry."""
+    vehicle_id = _by_db_id.get(db_id)
+    state = _states.get(vehicle_id) if vehicle_id else None
+    if state is None or state.db_id != db_id:
+        return None
+    _states.move_to_end(vehicle_id)
+    return state
+
+
+def find_vehicle_state_by_vin(user_id: str, vin: str) -> VehicleState | None:
+    """State of this user's vehicle with the given VIN (relink detection)."""
+    vehicle_id = _by_vin.get((user_id, vin))
+    return _states.get(vehicle_id) if vehicle_id else None
+
+
+def get_user_vehicle_states(user_id: str) -> list[VehicleState]:
+    """All saved vehicles of a user that are in the registry."""
+    return [_states[vehicle_id] for vehicle_id in _by_user.get(user_id, ()) if vehicle_id in _states]
+
+
+def user_has_source(user_id: str, source: str) -> bool:
+    """True if the user has at least one vehicle from the given source ("enode" or "abrp")."""
+    return any(state.source == source for state in get_user_vehicle_states(user_id))
+
+
+def record_vehicle_state(
+    db_id: str,
+    vehicle_id: str,
+    user_id: str | None,
+    vin: str | None,
+    online: bool | None,
+    last_seen: str | None,
+    country_code: str | None,
+    source: str,
+    brand: str,
+    old_vehicle_id: str | None = None,
+) -> None:
+    """Write-through update after a successful save (old_vehicle_id: previous id on relink)."""
+    if old_vehicle_id and old_vehicle_id != vehicle_id:
+        previous = _states.pop(old_vehicle_id, None)
+        _unindex(previous)
+        if previous is not None and vehicle_id not in _states:
+            previous.vehicle_id = vehicle_id
+            _states[vehicle_id] = previous
+    state = _entry(vehicle_id)
+    _unindex(state)
+    state.set_saved(
+        db_id=db_id,
+        user_id=user_id,
+        vin=vin,
+        online=online,
+        last_seen=last_seen,
+        country_code=country_code,
+        source=source,
+        brand=brand,
+    )
+    _index(state)
+
+
+def forget_vehicle_state(vehicle_id: str) -> None:
+    """Remove a deleted vehicle."""
+    _unindex(_states.pop(vehicle_id, None))
+
+
+def forget_user_vehicles(user_id: str) -> None:
+    """Remove a user's vehicles after a bulk delete (later saves fall back to a DB lookup)."""
+    for vehicle_id in list(_by_user.get(user_id, ())):
+        _unindex(_states.pop(vehicle_id, None))
+
+
+def get_vehicle_state_stats() -> dict:
+    approx_bytes = sum(state.approx_size() for state in _states.values())
+    return {
+        "warm": _warmed,
+        "vehicles": sum(1 for state in _states.values() if state.db_id is not None),
+        "entries": len(_states),
+        "max_entries": VEHICLE_STATE_MAX_ENTRIES,
+        "evictions": _evictions,
+        "approx_bytes": approx_bytes,
+        "approx_bytes_per_entry": approx_bytes // len(_states) if _states else 0,
+    }
@@ -4,11 +4,21 @@ from datetime import datetime
 from typing import Optional
 import logging
 from app.enode.webhook import fetch_enode_webhook_subscriptions
+from app.config import WEBHOOK_LOG_BATCH_SIZE, WEBHOOK_LOG_FLUSH_SECONDS, WEBHOOK_LOG_MAX_BUFFER
 from app.lib.supabase import get_supabase_admin_client
+from app.services.log_writer import BufferedLogWriter
 
 logger = logging.getLogger(__name__)
 supabase = get_supabase_admin_client()
 
+# Batched writer for raw webhook payloads (started in the app lifespan)
+webhook_log_writer = BufferedLogWriter(
+    "webhook_logs",
+    batch_size=WEBHOOK_LOG_BATCH_SIZE,
+    flush_interval=WEBHOOK_LOG_FLUSH_SECONDS,
+    max_buffer=WEBHOOK_LOG_MAX_BUFFER,
+)
+
 async def sync_webhook_subscriptions_from_enode(account: dict | None = None):
     """
     Fetch current webhook subscriptions from Enode and upsert them to Supabase.
@@ -153,7 +163,7 @@ async def mark_webhook_as_inactive(enode_webhook_id: str):
 def save_webhook_event(payload: dict | list):
     """
     Save a webhook event with metadata like user_id, vehicle_id, and event type.
-    Enhanced with debug logging.
+    The insert is queued on webhook_log_writer and flushed in batches.
     """
     timestamp = datetime.utcnow().isoformat()
 
@@ -168,16 +178,13 @@ def save_webhook_event(payload: dict | list):
         logger.warning(f"[⚠️ Metadata parse error] Failed to extract metadata from webhook payload: {e}")
         user_id = vehicle_id = event = version = None
 
-    try:
-        response = supabase.table("webhook_logs").insert({
-            "created_at": timestamp,
-            "payload": payload,
-            "user_id": user_id,
-            "vehicle_id": vehicle_id,
-            "event": event,
-            "event_type": event,  # keep both for now
-            "version": version
-        }).execute()
-        logger.info(f"✅ Webhook event saved at {timestamp}")
-    except Exception as db_error:
-        logger.error(f"[❌ DB error] Failed to insert webhook event: {db_error}")
\ No newline at end of file
+    # Buffered: the row is written by the background log writer, not on the request path
+    webhook_log_writer.write({
+        "created_at": timestamp,
+        "payload": payload,
+        "user_id": user_id,
+        "vehicle_id": vehicle_id,
+        "event": event,
+        "event_type": event,  # keep both for now
+        "version": version
+    })
@@ -0,0 +1,38 @@
+-- Hourly poll counts per user and vehicle, used to seed and rebuild the backend's
+-- in-memory rate-limit counters (app/services/rate_limiter.py) instead of running a
+-- count query on poll_logs for every rate-limited request.
+-- Returns a single jsonb array (one aggregation pass, one consistent snapshot, and not
+-- subject to the PostgREST row cap) of objects:
+--   {"user_id": uuid, "vehicle_id": uuid | null, "hours": {"<hours since epoch>": polls, ...}}
+-- vehicle_id is null for polls not tied to a vehicle.
+
+CREATE OR REPLACE FUNCTION public.get_poll_hourly_counts(p_since timestamptz)
+RETURNS jsonb
+LANGUAGE sql
+STABLE
+AS $$
+    SELECT coalesce(
+        jsonb_agg(jsonb_build_object('user_id', g.user_id, 'vehicle_id', g.vehicle_id, 'hours', g.hours)),
+        '[]'::jsonb
+    )
+    FROM (
+        SELECT h.user_id, h.vehicle_id, jsonb_object_agg(h.hour, h.poll_count) AS hours
+        FROM (
+            SELECT
+                pl.user_id,
+                pl.vehicle_id,
+                floor(extract(epoch FROM pl.created_at) / 3600)::bigint AS hour,
+                COUNT(*) AS poll_count
+            FROM public.poll_logs pl
+            -- From the start of the hour containing p_since
+            WHERE pl.created_at >= to_timestamp(floor(extract(epoch FROM p_since) / 3600) * 3600)
+            GROUP BY 1, 2, 3
+        ) h
+        GROUP BY h.user_id, h.vehicle_id
+    ) g;
+$$;
+
+COMMENT ON FUNCTION public.get_poll_hourly_counts(timestamptz) IS
+'Poll counts per user, vehicle and hour since p_since, as one jsonb array. Seeds the backend rate-limit counters.';
+
+GRANT EXECUTE ON FUNCTION public.get_poll_hourly_counts(timestamptz) TO service_role;
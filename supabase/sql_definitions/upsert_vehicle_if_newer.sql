@@ -0,0 +1,147 @@
+-- Atomic "upsert if newer" for vehicle caches
+-- Replaces the select-then-upsert in save_vehicle_data_with_client with one round trip:
+--   * finds the existing row by vehicle_id, or by (user_id, vin) when Enode assigned a new
+--     vehicle_id after a relink, and locks it
+--   * skips the write when the stored lastSeen is newer than the incoming one
+--   * otherwise updates (or inserts) the row; country_code is only filled in when missing
+-- Returns one row: id, written, previous_online, is_new, relinked_from, country_code
+-- Requires vehicle_cache to be JSONB (vehicle_cache_jsonb.sql) and the typed hot columns
+-- (vehicle_hot_columns.sql), which are written together with the cache
+
+CREATE OR REPLACE FUNCTION public.upsert_vehicle_if_newer(
+    p_vehicle_id text,
+    p_user_id uuid,
+    p_vendor text,
+    p_online boolean,
+    p_vehicle_cache jsonb,
+    p_vin text DEFAULT NULL,
+    p_country_code text DEFAULT NULL,
+    p_battery_level double precision DEFAULT NULL,
+    p_is_charging boolean DEFAULT NULL,
+    p_latitude double precision DEFAULT NULL,
+    p_longitude double precision DEFAULT NULL,
+    p_odometer_km double precision DEFAULT NULL,
+    p_brand text DEFAULT NULL,
+    p_model text DEFAULT NULL
+)
+RETURNS TABLE (
+    id uuid,
+    written boolean,
+    previous_online boolean,
+    is_new boolean,
+    relinked_from text,
+    country_code text
+)
+LANGUAGE plpgsql
+AS $$
+#variable_conflict use_column
+DECLARE
+    v_id uuid;
+    v_vehicle_id text;
+    v_online boolean;
+    v_country text;
+    v_incoming_last_seen text := p_vehicle_cache->>'lastSeen';
+    v_existing_last_seen text;
+    v_inserted boolean;
+BEGIN
+    SELECT v.id, v.vehicle_id, v.online, v.vehicle_cache->>'lastSeen', v.country_code
+    INTO v_id, v_vehicle_id, v_online, v_existing_last_seen, v_country
+    FROM public.vehicles v
+    WHERE v.vehicle_id = p_vehicle_id
+    FOR UPDATE;
+
+    -- Relink: same car (VIN) for this user under a previous Enode vehicle_id
+    IF v_id IS NULL AND p_vin IS NOT NULL THEN
+        SELECT v.id, v.vehicle_id, v.online, v.vehicle_cache->>'lastSeen', v.country_code
+        INTO v_id, v_vehicle_id, v_online, v_existing_last_seen, v_country
+        FROM public.vehicles v
+        WHERE v.user_id = p_user_id AND v.vin = p_vin
+        FOR UPDATE;
+    END IF;
+
+    IF v_id IS NOT NULL THEN
+        -- Same comparison as the Python guard: ISO-8601 strings from Enode sort chronologically
+        IF v_incoming_last_seen IS NOT NULL AND v_existing_last_seen IS NOT NULL
+           AND v_incoming_last_seen < v_existing_last_seen THEN
+            RETURN QUERY SELECT v_id, false, v_online, false, NULL::text, v_country;
+            RETURN;
+        END IF;
+
+        UPDATE public.vehicles v
+        SET vehicle_id = p_vehicle_id,
+            user_id = p_user_id,
+            vendor = p_vendor,
+            online = p_online,
+            vehicle_cache = p_vehicle_cache,
+            vin = COALESCE(p_vin, v.vin),
+            country_code = COALESCE(v.country_code, p_country_code),
+            battery_level = p_battery_level,
+            is_charging = p_is_charging,
+            latitude = p_latitude,
+            longitude = p_longitude,
+            odometer_km = p_odometer_km,
+            brand = p_brand,
+            model = p_model,
+            updated_at = now()
+        WHERE v.id = v_id;
+
+        RETURN QUERY SELECT
+            v_id,
+            true,
+            v_online,
+            false,
+            CASE WHEN v_vehicle_id <> p_vehicle_id THEN v_vehicle_id END,
+            COALESCE(v_country, p_country_code);
+        RETURN;
+    END IF;
+
+    -- New vehicle. ON CONFLICT covers a concurrent insert of the same vehicle_id.
+    INSERT INTO public.vehicles AS v (
+        vehicle_id, user_id, vendor, online, vehicle_cache, vin, country_code,
+        battery_level, is_charging, latitude, longitude, odometer_km, brand, model, updated_at
+    )
+    VALUES (
+        p_vehicle_id, p_user_id, p_vendor, p_online, p_vehicle_cache, p_vin, p_country_code,
+        p_battery_level, p_is_charging, p_latitude, p_longitude, p_odometer_km, p_brand, p_model, now()
+    )
+    ON CONFLICT (vehicle_id) DO UPDATE
+    SET user_id = EXCLUDED.user_id,
+        vendor = EXCLUDED.vendor,
+        online = EXCLUDED.online,
+        vehicle_cache = EXCLUDED.vehicle_cache,
+        vin = COALESCE(EXCLUDED.vin, v.vin),
+        country_code = COALESCE(v.country_code, EXCLUDED.country_code),
+        battery_level = EXCLUDED.battery_level,
+        is_charging = EXCLUDED.is_charging,
+        latitude = EXCLUDED.latitude,
+        longitude = EXCLUDED.longitude,
+        odometer_km = EXCLUDED.odometer_km,
+        brand = EXCLUDED.brand,
+        model = EXCLUDED.model,
+        updated_at = now()
+    WHERE v_incoming_last_seen IS NULL
+       OR (v.vehicle_cache->>'lastSeen') IS NULL
+       OR (v.vehicle_cache->>'lastSeen') <= v_incoming_last_seen
+    RETURNING v.id, (v.xmax = 0), v.country_code INTO v_id, v_inserted, v_country;
+
+    IF v_id IS NULL THEN
+        -- Lost the race to a newer concurrent write
+        RETURN QUERY SELECT v.id, false, v.online, false, NULL::text, v.country_code::text
+        FROM public.vehicles v WHERE v.vehicle_id = p_vehicle_id;
+        RETURN;
+    END IF;
+
+    RETURN QUERY SELECT v_id, true, NULL::boolean, v_inserted, NULL::text, v_country;
+END;
+$$;
+
+COMMENT ON FUNCTION public.upsert_vehicle_if_newer(
+    text, uuid, text, boolean, jsonb, text, text,
+    double precision, boolean, double precision, double precision, double precision, text, text
+) IS
+'Atomically upserts a vehicle cache unless the stored lastSeen is newer; handles VIN relinks. Used by save_vehicle_data_with_client.';
+
+GRANT EXECUTE ON FUNCTION public.upsert_vehicle_if_newer(
+    text, uuid, text, boolean, jsonb, text, text,
+    double precision, boolean, double precision, double precision, double precision, text, text
+) TO service_role;
@@ -0,0 +1,27 @@
+-- Store vehicles.vehicle_cache as a native JSONB object
+-- The backend used to write json.dumps(vehicle), which left either a text column or a
+-- JSONB string scalar holding the encoded object. It now passes the dict straight through,
+-- so PostgREST can return it as-is and select sub-paths (e.g. vehicle_cache->chargeState).
+-- Apply before deploying a backend that selects vehicle_cache sub-paths: until then those
+-- selects fail on a text column (the vehicle state warm-up falls back to whole caches).
+-- Safe to run more than once.
+
+DO $$
+BEGIN
+    -- Text column: convert the type, parsing the stored JSON
+    IF (
+        SELECT data_type
+        FROM information_schema.columns
+        WHERE table_schema = 'public' AND table_name = 'vehicles' AND column_name = 'vehicle_cache'
+    ) <> 'jsonb' THEN
+        ALTER TABLE public.vehicles
+        ALTER COLUMN vehicle_cache TYPE jsonb USING vehicle_cache::jsonb;
+    END IF;
+END $$;
+
+-- JSONB column holding double-encoded values: unwrap the string scalar into the object
+UPDATE public.vehicles
+SET vehicle_cache = (vehicle_cache #>> '{}')::jsonb
+WHERE jsonb_typeof(vehicle_cache) = 'string';
+
+COMMENT ON COLUMN public.vehicles.vehicle_cache IS 'Last Enode (or ABRP-normalised) vehicle object, stored as a JSONB object';
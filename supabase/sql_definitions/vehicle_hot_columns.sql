@@ -0,0 +1,65 @@
+-- Typed copies of the most read vehicle_cache fields
+-- Written by the backend together with vehicle_cache (app/lib/vehicle_cache.py: hot_columns),
+-- so listing and aggregation queries can read small typed rows instead of the JSON document.
+-- Requires vehicle_cache to be JSONB (vehicle_cache_jsonb.sql). Safe to run more than once.
+-- Apply before deploying the backend; until then vehicle writes retry without these columns.
+
+ALTER TABLE public.vehicles ADD COLUMN IF NOT EXISTS battery_level DOUBLE PRECISION;
+ALTER TABLE public.vehicles ADD COLUMN IF NOT EXISTS is_charging BOOLEAN;
+ALTER TABLE public.vehicles ADD COLUMN IF NOT EXISTS latitude DOUBLE PRECISION;
+ALTER TABLE public.vehicles ADD COLUMN IF NOT EXISTS longitude DOUBLE PRECISION;
+ALTER TABLE public.vehicles ADD COLUMN IF NOT EXISTS odometer_km DOUBLE PRECISION;
+ALTER TABLE public.vehicles ADD COLUMN IF NOT EXISTS brand TEXT;
+ALTER TABLE public.vehicles ADD COLUMN IF NOT EXISTS model TEXT;
+
+COMMENT ON COLUMN public.vehicles.battery_level IS 'vehicle_cache.chargeState.batteryLevel (percent)';
+COMMENT ON COLUMN public.vehicles.is_charging IS 'vehicle_cache.chargeState.isCharging';
+COMMENT ON COLUMN public.vehicles.latitude IS 'vehicle_cache.location.latitude';
+COMMENT ON COLUMN public.vehicles.longitude IS 'vehicle_cache.location.longitude';
+COMMENT ON COLUMN public.vehicles.odometer_km IS 'vehicle_cache.odometer.distance (km)';
+COMMENT ON COLUMN public.vehicles.brand IS 'vehicle_cache.information.brand';
+COMMENT ON COLUMN public.vehicles.model IS 'vehicle_cache.information.model';
+
+-- Model distribution (admin insights)
+CREATE INDEX IF NOT EXISTS idx_vehicles_brand_model ON public.vehicles (brand, model);
+
+-- Vehicles currently charging
+CREATE INDEX IF NOT EXISTS idx_vehicles_is_charging ON public.vehicles (is_charging) WHERE is_charging;
+
+-- Vehicles still waiting for a country_code (geocoding fallback)
+CREATE INDEX IF NOT EXISTS idx_vehicles_missing_country
+ON public.vehicles (id)
+WHERE country_code IS NULL AND latitude IS NOT NULL;
+
+-- One-off backfill from existing caches. Non-numeric values are left NULL.
+UPDATE public.vehicles
+SET battery_level = CASE WHEN jsonb_typeof(vehicle_cache->'chargeState'->'batteryLevel') = 'number'
+                         THEN (vehicle_cache->'chargeState'->>'batteryLevel')::double precision END,
+    is_charging   = CASE WHEN jsonb_typeof(vehicle_cache->'chargeState'->'isCharging') = 'boolean'
+                         THEN (vehicle_cache->'chargeState'->>'isCharging')::boolean END,
+    latitude      = CASE WHEN jsonb_typeof(vehicle_cache->'location'->'latitude') = 'number'
+                         THEN (vehicle_cache->'location'->>'latitude')::double precision END,
+    longitude     = CASE WHEN jsonb_typeof(vehicle_cache->'location'->'longitude') = 'number'
+                         THEN (vehicle_cache->'location'->>'longitude')::double precision END,
+    odometer_km   = CASE WHEN jsonb_typeof(vehicle_cache->'odometer'->'distance') = 'number'
+                         THEN (vehicle_cache->'odometer'->>'distance')::double precision END,
+    brand         = NULLIF(vehicle_cache->'information'->>'brand', ''),
+    model         = NULLIF(vehicle_cache->'information'->>'model', '')
+WHERE jsonb_typeof(vehicle_cache) = 'object';
+
+-- Vehicle count per brand + model, used by get_vehicles_by_model()
+CREATE OR REPLACE FUNCTION public.get_vehicle_model_counts()
+RETURNS TABLE (brand text, model text, vehicle_count bigint)
+LANGUAGE sql
+STABLE
+AS $$
+    SELECT COALESCE(v.brand, 'Unknown'), COALESCE(v.model, 'Unknown'), count(*)
+    FROM public.vehicles v
+    GROUP BY 1, 2
+    ORDER BY 3 DESC;
+$$;
+
+COMMENT ON FUNCTION public.get_vehicle_model_counts() IS
+'Vehicle count per brand and model from the typed hot columns. Used by the admin insights endpoint.';
+
+GRANT EXECUTE ON FUNCTION public.get_vehicle_model_counts() TO service_role;
@@ -0,0 +1,29 @@
+-- Pairing index between the Enode and ABRP records of the same physical car
+-- Written by the backend (app/storage/vehicle_pairing.py) the first time a user's Enode and
+-- ABRP vehicles of the same brand are both seen; cross-populate merges only paired vehicles.
+-- Rows follow Enode relinks (ON UPDATE CASCADE) and disappear with either vehicle.
+
+CREATE TABLE IF NOT EXISTS public.vehicle_pairings (
+    enode_vehicle_id TEXT PRIMARY KEY
+        REFERENCES public.vehicles(vehicle_id) ON UPDATE CASCADE ON DELETE CASCADE,
+    abrp_vehicle_id TEXT NOT NULL UNIQUE
+        REFERENCES public.vehicles(vehicle_id) ON UPDATE CASCADE ON DELETE CASCADE,
+    user_id UUID NOT NULL,
+    brand TEXT,
+    created_at TIMESTAMPTZ DEFAULT now()
+);
+
+CREATE INDEX IF NOT EXISTS idx_vehicle_pairings_user_id ON public.vehicle_pairings (user_id);
+
+-- Enable Row Level Security (backend only)
+ALTER TABLE public.vehicle_pairings ENABLE ROW LEVEL SECURITY;
+
+DROP POLICY IF EXISTS "Allow access for service role" ON public.vehicle_pairings;
+CREATE POLICY "Allow access for service role"
+    ON public.vehicle_pairings
+    TO service_role
+    USING (true);
+
+GRANT ALL ON TABLE public.vehicle_pairings TO service_role;
+
+COMMENT ON TABLE public.vehicle_pairings IS 'Enode vehicle ↔ ABRP vehicle of the same car (same user and brand), used by cross-populate';